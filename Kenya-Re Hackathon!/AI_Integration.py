@@ -1,14 +1,21 @@
 import os
+import contextlib
 import csv
+import functools
 import json
 import io
 import pandas as pd
-import pdfplumber
 import openai
 from flask import jsonify,render_template_string
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
-import tiktoken
+import prompt_builder
+import batch_analysis
+import clause_index
+import excel_ingest
+import instrumentation
+import pdf_extraction
+import pdf_report
+import summarizer
+import llm_cache
 
 
 def allowed_file(filename, allowed_extensions):
@@ -17,10 +24,7 @@ def allowed_file(filename, allowed_extensions):
 def extract_text_from_pdf(file):
     """Extract text from a PDF using pdfplumber"""
     try:
-        with pdfplumber.open(file) as pdf:
-            text = ''.join(page.extract_text() or '' for page in pdf.pages)
-        print(f'Character count: {len(text)}')
-        return text
+        return pdf_extraction.extract_text(file)
     except Exception as e:
         print(f"Error extracting text from PDF: {e}")
         return ""
@@ -37,26 +41,67 @@ def read_file(file_path):
         print(f"Error reading file {file_path}: {e}")
         return ""
 
-def call_openai_api(prompt):
-    try:
+MODEL = "gpt-3.5-turbo"
+SYSTEM_MESSAGE = "You are an insurance data analyst."
+MAX_TOKENS = 1000  # Reduce token limit
+TEMPERATURE = 0.4
+# Optional semaphore capping concurrent API calls; the batch runner shares one across its worker processes
+llm_slots = None
+
+def chat_completion(prompt, namespace='default', use_cache=True):
+    """Send one prompt to the chat model; API errors propagate so callers can retry.
+
+    Responses are cached under namespace, keyed by the model settings and a hash of the prompt.
+    """
+    key = llm_cache.cache_key(MODEL, TEMPERATURE, MAX_TOKENS, SYSTEM_MESSAGE, prompt)
+    if use_cache and not llm_cache.BYPASS:
+        cached = llm_cache.response_cache.get(key, namespace)
+        if cached is not None:
+            instrumentation.add(llm_cache_hits=1)
+            return cached
+
+    with llm_slots or contextlib.nullcontext():
         response = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo", 
-            messages=[{"role": "system", "content": "You are an insurance data analyst."},
+            model=MODEL, 
+            messages=[{"role": "system", "content": SYSTEM_MESSAGE},
                       {"role": "user", "content": prompt}],
-            max_tokens=1000,  # Reduce token limit
-            temperature=0.4,
+            max_tokens=MAX_TOKENS,
+            temperature=TEMPERATURE,
         )
-        return response["choices"][0]["message"]["content"].strip()
+    usage = response.get("usage") or {}
+    instrumentation.add(llm_calls=1, prompt_tokens=usage.get("prompt_tokens", 0),
+                        completion_tokens=usage.get("completion_tokens", 0))
+    content = response["choices"][0]["message"]["content"].strip()
+    if use_cache and content:
+        llm_cache.response_cache.put(key, content, namespace)
+    return content
+
+def call_openai_api(prompt, namespace='default', use_cache=True):
+    try:
+        return chat_completion(prompt, namespace, use_cache)
     except Exception as e:
         print(f"OpenAI API error: {e}")
         return ""
 
+def clean_bordereaux_frame(df):
+    """Drop rows and columns that are entirely empty"""
+    return df.dropna(how='all').dropna(axis=1, how='all')
+
+def read_bordereaux(bordereaux_file):
+    """Parse the first sheet of an uploaded bordereaux and clean it in memory"""
+    if hasattr(bordereaux_file, 'seek'):
+        bordereaux_file.seek(0)
+    # .xlsx streams through openpyxl's read-only mode; legacy .xls still needs a full read
+    if excel_ingest.is_xlsx(bordereaux_file):
+        return excel_ingest.read_bordereaux(bordereaux_file)
+    return clean_bordereaux_frame(pd.read_excel(bordereaux_file))
+
 def clean_excel(input_file, output_file):
     try:
         df = pd.read_excel(input_file, sheet_name=None)
         with pd.ExcelWriter(output_file) as writer:
             for sheet_name, sheet_df in df.items():
-                cleaned_df = sheet_df.dropna(how='all').dropna(axis=1, how='all')
+                cleaned_df = clean_bordereaux_frame(sheet_df)
                 cleaned_df.to_excel(writer, sheet_name=sheet_name, index=False)
     except Exception as e:
         print(f"Error cleaning Excel file: {e}")
@@ -64,126 +109,114 @@ def clean_excel(input_file, output_file):
 def generate_pdf_from_text(text, output_pdf_path):
 
     try:
-        # Create a PDF canvas
-        c = canvas.Canvas(output_pdf_path, pagesize=letter)
-        width, height = letter
-
-        # Set font
-        c.setFont("Helvetica", 10)
-
-        # Split text into lines that fit within the page width
-        lines = text.split("\n")
-        y_position = height - 50  # Start position
-
-        for line in lines:
-            if y_position < 50:  # New page if space runs out
-                c.showPage()
-                c.setFont("Helvetica", 10)
-                y_position = height - 50
-
-            c.drawString(50, y_position, line)
-            y_position -= 15  # Move to next line
-
-        # Save PDF
-        c.save()
+        # Long lines are wrapped to the page width and pages are written out as they fill
+        pdf_report.write_text(text, output_pdf_path)
         print(f"PDF successfully saved at: {output_pdf_path}")
 
     except Exception as e:
         print(f"Error generating PDF: {e}")
 
 def generate_pdf_from_csv(csv_filepath, output_pdf_path):
-    buffer = io.BytesIO()
-    c = canvas.Canvas(buffer, pagesize=letter)
-    c.drawString(100, 750, "CSV Report")
-    y = 720
     try:
         with open(csv_filepath, newline='', encoding='utf-8') as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                for key, value in row.items():
-                    c.drawString(100, y, f"{key}: {value}")
-                    y -= 15
-                y -= 10
-                if y < 100:
-                    c.showPage()
-                    y = 750
-        c.save()
-        buffer.seek(0)
-        with open(output_pdf_path, 'wb') as f:
-            f.write(buffer.getvalue())
-        buffer.close()
+            reader = csv.reader(csvfile)
+            header = next(reader, None)
+            if header:
+                # Rows go straight from the CSV reader to the PDF file, one page at a time
+                pdf_report.write_rows(header, reader, output_pdf_path, title="CSV Report")
         print(f"PDF report generated: {output_pdf_path}")
     except Exception as e:
         print(f"Error generating PDF: {e}")
 
 
 def truncate_text_to_fit(text, max_tokens=9000, model="3.5-turbo"):
-    enc = tiktoken.get_encoding("cl100k_base")
-    tokens = enc.encode(text)
+    enc = prompt_builder.get_encoder()
+    tokens = enc.encode_ordinary(text)
 
     if len(tokens) > max_tokens:
         tokens = tokens[:max_tokens]  # Truncate to fit within limits
     
     return enc.decode(tokens)  # Convert back to text
 
-def process_files(treaty_file, bordereaux_file):
-    allowed_pdf = {'pdf'}
-    allowed_excel = {'xls', 'xlsx'}
-    if not (allowed_file(treaty_file.filename, allowed_pdf) and allowed_file(bordereaux_file.filename, allowed_excel)):
-        return jsonify({'error': 'Invalid file format. Treaty should be PDF, and Bordereaux should be Excel.'}), 400
-    
-    treaty_text = extract_text_from_pdf(treaty_file)
-    treaty_output_path = "treatyoutput.txt"
-    save_text_file(treaty_text, treaty_output_path)
-    
-    openai.api_key = 'eka hapa'
-    prompt = "Create a summarized document highlighting key details."
+def debug_path(debug_dir, filename):
+    """Path for an optional debug dump, or None when dumps are disabled"""
+    if not debug_dir:
+        return None
+    os.makedirs(debug_dir, exist_ok=True)
+    return os.path.join(debug_dir, filename)
+
+def summarize_treaty(treaty_text, debug_dir=None):
+    final_treaty_text = ""
     try:
-        truncate_text_to_fit(treaty_output_path)
-        max=50000
-        final_treaty_text = call_openai_api((read_file(treaty_output_path)[max]) + "\n\n" + prompt)
-        final_treaty_path = "final_treaty_document.txt"
-        save_text_file(final_treaty_text, final_treaty_path)
+        # Every section of the treaty is summarized, not just the first slice that fits one prompt
+        # Cached apart from the analyses so a new bordereaux reuses last run's treaty summary
+        final_treaty_text = summarizer.summarize(treaty_text, functools.partial(chat_completion, namespace='treaty_summary'))
+        final_treaty_path = debug_path(debug_dir, "final_treaty_document.txt")
+        if final_treaty_path:
+            save_text_file(final_treaty_text, final_treaty_path)
 
     except Exception as e:
         print(f"Error in initial call : {e}")
+    return final_treaty_text
 
-    
-    clean_bordereaux_output = 'clean_bordereaux.xlsx'
-    clean_excel(bordereaux_file, clean_bordereaux_output)
-    df = pd.read_excel(clean_bordereaux_output)
-    df = df.iloc[:len(df) // 2]  # Selects the first half of rows
-    final_bordereaux_csv = "final_bordereaux.csv"
-    df.to_csv(final_bordereaux_csv, index=False)
-    
-    analysis_prompt = """
-    The following files are an insurance boardereaux csv and insurance treaty text. 
-    Search for insurance discrepancies related to claims processing in the boardereaux. 
-    Compare it with the insurance treaty provided and search for any discrepancies related to treaty violations in the boardereaux. 
-    Finally, generate an official report on your findings.
-    """
+def analyze_bordereaux(bordereaux_df, final_treaty_text, debug_dir=None, clauses=None):
+    final_bordereaux_csv = debug_path(debug_dir, "final_bordereaux.csv")
+    if final_bordereaux_csv:
+        bordereaux_df.to_csv(final_bordereaux_csv, index=False)
+
+    # Every row is analysed, in token-sized batches that run concurrently
+    report_text = ""
     try:
-        maxchars=50000
-        report_text = call_openai_api((analysis_prompt +"\n\nBordereaux CSV:\n" + read_file(final_bordereaux_csv) + "\n\nTreaty text:\n" + final_treaty_text)[:maxchars])
+        report = batch_analysis.analyze(bordereaux_df, final_treaty_text,
+                                        functools.partial(chat_completion, namespace='discrepancy_analysis'),
+                                        clauses=clauses)
+        instrumentation.add(rows=report['rows_analysed'])
+        report_text = json.dumps(report, indent=2, default=str)
     
     except Exception as e:
         print(f"Error in final call : {e}")
-    print(report_text)
-    try:
-        report_json = json.loads(report_text)
-        print(report_json)
-        df = pd.DataFrame([report_json])
-        final_report_csv = "Final_gpt_response.csv"
-        df.to_csv(final_report_csv, index=False)
-        print(f"CSV Report Saved: {final_report_csv}")
-        
-        output_pdf_path = 'AI_PDF_REPORT.pdf'
-        generate_pdf_from_csv(final_report_csv, output_pdf_path)
-    except Exception as e:
-        print(f"Error in pdf from json/csv: {e}")
 
-                
+    final_report_csv = debug_path(debug_dir, "Final_gpt_response.csv")
+    if final_report_csv:
+        try:
+            report_json = json.loads(report_text)
+            pd.DataFrame(report_json['findings']).to_csv(final_report_csv, index=False)
+            print(f"CSV Report Saved: {final_report_csv}")
+            generate_pdf_from_csv(final_report_csv, debug_path(debug_dir, 'AI_PDF_REPORT.pdf'))
+        except Exception as e:
+            print(f"Error in pdf from json/csv: {e}")
+
     return report_text
+
+def run_ai_analysis(treaty_text, bordereaux_df, debug_dir=None, clauses=None):
+    """AI stage of the pipeline: works on already parsed treaty text and bordereaux DataFrame.
+
+    clauses is the treaty's clause_index.ClauseIndex; it is built here when not given and retrieval is on.
+    """
+    openai.api_key = 'eka hapa'
+    treaty_output_path = debug_path(debug_dir, "treatyoutput.txt")
+    if treaty_output_path:
+        save_text_file(treaty_text, treaty_output_path)
+    if clauses is None and clause_index.ENABLED:
+        clauses = clause_index.for_treaty(treaty_text)
+    if clauses is not None and len(clauses):
+        # Each batch carries the clauses matching its own rows, so no whole-treaty summary is needed
+        with instrumentation.stage('ai.bordereaux_analysis'):
+            return analyze_bordereaux(bordereaux_df, None, debug_dir, clauses)
+    with instrumentation.stage('ai.treaty_summary'):
+        final_treaty_text = summarize_treaty(treaty_text, debug_dir)
+    with instrumentation.stage('ai.bordereaux_analysis'):
+        return analyze_bordereaux(bordereaux_df, final_treaty_text, debug_dir)
+
+def process_files(treaty_file, bordereaux_file, debug_dir=None):
+    allowed_pdf = {'pdf'}
+    allowed_excel = {'xls', 'xlsx'}
+    if not (allowed_file(treaty_file.filename, allowed_pdf) and allowed_file(bordereaux_file.filename, allowed_excel)):
+        return jsonify({'error': 'Invalid file format. Treaty should be PDF, and Bordereaux should be Excel.'}), 400
+    
+    treaty_text = extract_text_from_pdf(treaty_file)
+    bordereaux_df = read_bordereaux(bordereaux_file)
+    return run_ai_analysis(treaty_text, bordereaux_df, debug_dir)
 import os
 from reportlab.lib.pagesizes import letter
 from reportlab.pdfgen import canvas
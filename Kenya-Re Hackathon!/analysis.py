@@ -0,0 +1,62 @@
+import pandas as pd
+import matching
+import pdf_report
+import rules
+
+def identify_common_fields(bordereaux_df, statement_text, treaty_text):
+    """Identify common fields between Bordereaux, Statement, and Treaty"""
+    common_fields = []
+    for column in bordereaux_df.columns:
+        if column in statement_text and column in treaty_text:
+            common_fields.append(column)
+    return common_fields
+
+def compare_bordereaux_statement(bordereaux_df, statement_text, common_fields):
+    """Compare Bordereaux with Statement based on common fields"""
+    return matching.find_discrepancies(bordereaux_df, statement_text, None, common_fields)['statement']
+
+def compare_bordereaux_treaty(bordereaux_df, treaty_text, common_fields):
+    """Compare Bordereaux with Treaty based on common fields"""
+    return matching.find_discrepancies(bordereaux_df, None, treaty_text, common_fields)['treaty']
+
+def compare_premium_prices(bordereaux_df, statement_text, common_fields):
+    """Compare Premium prices between Bordereaux and Statement"""
+    premium_fields = [field for field in common_fields if 'Premium' in field]
+    return matching.find_discrepancies(bordereaux_df, statement_text, None, premium_fields)['premium']
+
+def flag_fraudulent_claims(bordereaux_df):
+    """Flag potentially fraudulent claims based on certain conditions"""
+    return rules.evaluate(bordereaux_df, [rules.RatioRule()])['Fraudulent Claims']
+
+def detect_duplicate_data(bordereaux_df):
+    """Detect duplicate entries in the Bordereaux"""
+    return rules.evaluate(bordereaux_df, [rules.DuplicateRule()])['Duplicate Entries']
+
+def generate_report(discrepancies, treaty_discrepancies, premium_discrepancies, fraud_flags, duplicate_data,
+                    other_flags=None):
+    """Generate a comprehensive report of discrepancies"""
+    report = {
+        'Statement Discrepancies': discrepancies,
+        'Treaty Discrepancies': treaty_discrepancies,
+        'Premium Discrepancies': premium_discrepancies,
+        'Fraudulent Claims': fraud_flags,
+        'Duplicate Entries': duplicate_data
+    }
+    # Categories produced by configured rules beyond the built-in fraud and duplicate checks
+    report.update(other_flags or {})
+    
+    # Handle NaN values in discrepancies
+    for category in report.values():
+        for discrepancy in category:
+            for key, value in discrepancy.items():
+                if pd.isnull(value):
+                    discrepancy[key] = 'Unknown'
+    
+    return report
+
+def generate_pdf_report(report):
+    """Generate a PDF report from discrepancies.
+
+    Pages are streamed to a temporary file as they fill up; the returned file is rewound for reading.
+    """
+    return pdf_report.report_file(report.items())
@@ -1,18 +1,30 @@
 from flask import jsonify,render_template_string
-from flask import Flask, request, render_template, send_file, jsonify,redirect, url_for
-import pandas as pd
-import pdfplumber
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
-import io
-import AI_Integration
+from flask import (Flask, Response, request, render_template, send_file, jsonify, redirect, url_for,
+                   stream_with_context)
+import logging
+import os
+# Only light modules are imported here so a new worker serves / and /healthz at once; the pipeline
+# (pandas, pdfplumber, openai, reportlab, tiktoken) is imported with the job queue or by warm().
+import instrumentation
+import llm_cache
+import prompt_builder
+import report_html
+import report_store
+import uploads
 
 app = Flask(__name__)
+# Uploaded files are spooled to a scratch directory per request instead of being held in memory
+uploads.init_app(app)
+job_queue = None
 
 @app.route('/')
 def index():
     return render_template('index.html')
 
+@app.route('/healthz')
+def healthz():
+    return jsonify({'status': 'ok'})
+
 @app.route('/upload', methods=['POST'])
 def upload_file():
     # Check if the files are in the request
@@ -24,22 +36,6 @@ def upload_file():
     bordereaux_file = request.files['bordereaux']
     statement_file = request.files['statement']
 
-    try:
-
-        # Generate the HTML report
-        report=AI_Integration.process_files(treaty_file,bordereaux_file)
-        
-        if not report:
-            return "No report data provided", 400
-        html_content = AI_Integration.generate_final_report(report)
-        print(html_content)
-        
-        
-
-    except Exception as e:
-        print(f"Error occurred in AI processing: {e}")
-        return jsonify({'error': f"An error occurred while using API: {str(e)}"}), 500
-    
     # Validate file types (PDF for treaty and statement, Excel for bordereaux)
     allowed_pdf = {'pdf'}
     allowed_excel = {'xls', 'xlsx'}
@@ -48,48 +44,112 @@ def upload_file():
             allowed_file(bordereaux_file.filename, allowed_excel) and
             allowed_file(statement_file.filename, allowed_pdf)):
         return jsonify({'error': 'Invalid file format. Treaty and Statement should be PDF, and Bordereaux should be Excel.'}), 400
-        
-    try:
-        treaty_text = extract_text_from_pdf(treaty_file)
-        bordereaux_df = pd.read_excel(bordereaux_file)
-        statement_text = extract_text_from_pdf(statement_file)
-
-        with open("treatyoutput.txt", "w",encoding="utf-8") as file1:
-            print('im  here')
-            file1.write(treaty_text)
-        with open("statementoutput.txt", "w",encoding="utf-8") as file2:
-            file2.write(statement_text)
-
-        
-            
-        # Identify common fields
-        common_fields = identify_common_fields(bordereaux_df, statement_text, treaty_text)
-
-        # Perform comparisons
-        discrepancies = compare_bordereaux_statement(bordereaux_df, statement_text, common_fields)
-        treaty_discrepancies = compare_bordereaux_treaty(bordereaux_df, treaty_text, common_fields)
-        premium_discrepancies = compare_premium_prices(bordereaux_df, statement_text, common_fields)
-        
-        # Flag potentially fraudulent claims
-        fraud_flags = flag_fraudulent_claims(bordereaux_df)
-        
-        # Detect duplicate data in Bordereaux
-        duplicate_data = detect_duplicate_data(bordereaux_df)
-
-        # Generate report
-        report = generate_report(discrepancies, treaty_discrepancies, premium_discrepancies, fraud_flags, duplicate_data)
-
-        # Generate PDF from the report
-        pdf_buffer = generate_pdf_report(report)
-
-        # Return PDF for download
-        
 
+    # Reconciliation runs in the background; the client polls the job for progress
+    # Resubmissions for the same cedant and treaty only send new or changed rows to the model
+    job_id = get_job_queue().submit(request.files, cedant=request.form.get('cedant'))
+    return jsonify({
+        'job_id': job_id,
+        'status_url': url_for('job_status', job_id=job_id),
+        'report_url': url_for('job_report', job_id=job_id),
+        'pdf_url': url_for('job_pdf_report', job_id=job_id),
+    }), 202
+
+def get_job_queue():
+    """Create the job queue on first use so the debug reloader's parent process does not start workers"""
+    global job_queue
+    if job_queue is None:
+        from jobs import JobQueue
+        job_queue = JobQueue()
+    return job_queue
+
+def warm():
+    """Import the pipeline and build the tokenizer and font metrics ahead of the first job.
+
+    serve.py calls this once before forking, so every worker starts with them already in memory.
+    """
+    import jobs
+    import pdf_report
+    try:
+        prompt_builder.load_encoder()
     except Exception as e:
-        # Log the error and send a response with the error message
-        print(f"Error occurred: {e}")
-        return jsonify({'error': f"An error occurred in data analysis the files: {str(e)}"}), 500
-    return html_content, 200, {'Content-Type': 'text/html'}
+        print(f"Could not load the tokenizer, it will be loaded by the first job: {e}")
+    pdf_report.load_font_metrics()
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = get_job_queue().get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job id.'}), 404
+    return jsonify(job)
+
+def finished_report(job_id, kind):
+    """Path of a finished job's report, or an error response if it is not ready"""
+    job = get_job_queue().get(job_id)
+    if job is None:
+        return None, (jsonify({'error': 'Unknown job id.'}), 404)
+    if job['status'] == 'failed':
+        return None, (jsonify({'error': f"An error occurred in data analysis the files: {job['error']}"}), 500)
+    if job['status'] != 'done':
+        return None, (jsonify({'error': 'Report is not ready yet.', 'status': job['status']}), 409)
+    return get_job_queue().report_path(job_id, kind), None
+
+@app.route('/jobs/<job_id>/report')
+def job_report(job_id):
+    """Report page, streamed in chunks; its sections are loaded a page at a time from job_report_sections"""
+    path, error = finished_report(job_id, 'sections')
+    if error:
+        return error
+    index = report_store.ReportStore(path).index()
+    html = report_html.iter_report_html(index, url_for('job_report_sections', job_id=job_id),
+                                        url_for('static', filename='js/report.js'))
+    return Response(stream_with_context(html), mimetype='text/html')
+
+@app.route('/jobs/<job_id>/report/sections')
+def job_report_sections(job_id):
+    """Section index of a report, or one page of a section with ?category=...&page=...&page_size=..."""
+    path, error = finished_report(job_id, 'sections')
+    if error:
+        return error
+    store = report_store.ReportStore(path)
+    category = request.args.get('category')
+    if category is None:
+        return jsonify(store.index())
+    page = store.page(category, request.args.get('page', 1, type=int),
+                      request.args.get('page_size', report_store.PAGE_SIZE, type=int))
+    if page is None:
+        return jsonify({'error': 'Unknown report category.'}), 404
+    return jsonify(page)
+
+@app.route('/jobs/<job_id>/report.pdf')
+def job_pdf_report(job_id):
+    path, error = finished_report(job_id, 'pdf')
+    if error:
+        return error
+    return send_file(path, as_attachment=True, download_name='discrepancy_report.pdf', mimetype='application/pdf')
+
+@app.route('/jobs/<job_id>/trace')
+def job_trace(job_id):
+    """Per-stage wall time, CPU time, peak memory, rows, pages and tokens of a job"""
+    if get_job_queue().get(job_id) is None:
+        return jsonify({'error': 'Unknown job id.'}), 404
+    path = get_job_queue().trace_path(job_id)
+    if not os.path.exists(path):
+        return jsonify({'error': 'Trace is not ready yet.'}), 409
+    return send_file(path, mimetype='application/json')
+
+@app.route('/metrics')
+def metrics():
+    """Stage timings and counters of every run, in Prometheus text format.
+
+    Under serve.py the totals cover every worker process; peak memory is reported per process (pid label).
+    """
+    return Response(instrumentation.registry.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/llm-cache')
+def llm_cache_metrics():
+    """Hit/miss counts and stored size of the LLM response cache, per namespace"""
+    return jsonify(llm_cache.response_cache.metrics())
 
 def allowed_file(filename, allowed_extensions):
     """Utility function to check file extensions"""
@@ -97,154 +157,10 @@ def allowed_file(filename, allowed_extensions):
 
 def extract_text_from_pdf(file):
     """Extract text from a PDF using pdfplumber"""
-    with pdfplumber.open(file) as pdf:
-        text = ''
-        for page in pdf.pages:
-            text += page.extract_text()
-    char_count = len(text)
-    print('character count= ',char_count)
-    return text
-
-def identify_common_fields(bordereaux_df, statement_text, treaty_text):
-    """Identify common fields between Bordereaux, Statement, and Treaty"""
-    common_fields = []
-    for column in bordereaux_df.columns:
-        if column in statement_text and column in treaty_text:
-            common_fields.append(column)
-    return common_fields
-
-def compare_bordereaux_statement(bordereaux_df, statement_text, common_fields):
-    """Compare Bordereaux with Statement based on common fields"""
-    discrepancies = []
-    for index, row in bordereaux_df.iterrows():
-        for field in common_fields:
-            value = str(row[field])
-            if value not in statement_text:
-                discrepancies.append({
-                    'Policy Holder ID': row.get('Policy Holder ID', 'Unknown'),
-                    'Field': field,
-                    'Value': value,
-                    'Issue': f'{value} not found in statement under field {field} (Row {index+1})'
-                })
-    return discrepancies
-
-def compare_bordereaux_treaty(bordereaux_df, treaty_text, common_fields):
-    """Compare Bordereaux with Treaty based on common fields"""
-    treaty_discrepancies = []
-    for index, row in bordereaux_df.iterrows():
-        for field in common_fields:
-            value = str(row[field])
-            if value not in treaty_text:
-                treaty_discrepancies.append({
-                    'Policy Holder ID': row.get('Policy Holder ID', 'Unknown'),
-                    'Field': field,
-                    'Value': value,
-                    'Issue': f'{value} not found in treaty under field {field} (Row {index+1})'
-                })
-    return treaty_discrepancies
-
-def compare_premium_prices(bordereaux_df, statement_text, common_fields):
-    """Compare Premium prices between Bordereaux and Statement"""
-    premium_discrepancies = []
-    for index, row in bordereaux_df.iterrows():
-        for field in common_fields:
-            if 'Premium' in field:
-                value = str(row[field])
-                if value not in statement_text:
-                    premium_discrepancies.append({
-                        'Policy Holder ID': row.get('Policy Holder ID', 'Unknown'),
-                        'Field': field,
-                        'Value': value,
-                        'Issue': f'{value} not found in statement under field {field} (Row {index+1})'
-                    })
-    return premium_discrepancies
-
-def flag_fraudulent_claims(bordereaux_df):
-    """Flag potentially fraudulent claims based on certain conditions"""
-    fraud_flags = []
-    for index, row in bordereaux_df.iterrows():
-        claim_amount = row.get('Claim Amount', None)
-        premium_amount = row.get('Premium Amount', None)
-        if pd.notnull(claim_amount) and pd.notnull(premium_amount):
-            if claim_amount > (2 * premium_amount):  # Example threshold for potential fraud
-                fraud_flags.append({
-                    'Policy Holder ID': row.get('Policy Holder ID', 'Unknown'),
-                    'Claim Amount': claim_amount,
-                    'Premium Amount': premium_amount,
-                    'Issue': f'Potential fraud: Claim Amount ({claim_amount}) significantly higher than Premium Amount ({premium_amount}) (Row {index+1})'
-                })
-    return fraud_flags
-
-def detect_duplicate_data(bordereaux_df):
-    """Detect duplicate entries in the Bordereaux"""
-    duplicate_data = bordereaux_df[bordereaux_df.duplicated(subset=['Policy Holder ID'], keep=False)]
-    duplicates = []
-    for index, row in duplicate_data.iterrows():
-        duplicates.append({
-            'Policy Holder ID': row['Policy Holder ID'],
-            'Issue': f'Duplicate Policy Holder ID found in bordereaux (Row {index+1})'
-        })
-    return duplicates
-
-def generate_report(discrepancies, treaty_discrepancies, premium_discrepancies, fraud_flags, duplicate_data):
-    """Generate a comprehensive report of discrepancies"""
-    report = {
-        'Statement Discrepancies': discrepancies,
-        'Treaty Discrepancies': treaty_discrepancies,
-        'Premium Discrepancies': premium_discrepancies,
-        'Fraudulent Claims': fraud_flags,
-        'Duplicate Entries': duplicate_data
-    }
-    
-    # Handle NaN values in discrepancies
-    for category in report.values():
-        for discrepancy in category:
-            for key, value in discrepancy.items():
-                if pd.isnull(value):
-                    discrepancy[key] = 'Unknown'
-    
-    return report
-
-def generate_pdf_report(report):
-    """Generate a PDF report from discrepancies"""
-    buffer = io.BytesIO()
-    c = canvas.Canvas(buffer, pagesize=letter)
-    
-    # Header
-    c.drawString(100, 750, "Discrepancy fu Report")
-    y = 720
-    
-    # Debug print for report
-    print("Generated Report: ", report)  # For debugging
-    
-    # Check if report has data
-    if not any(report.values()):  # If all lists are empty
-        c.drawString(100, y, "No discrepancies found.")
-        c.save()
-        buffer.seek(0)
-        return buffer
-    
-    # Iterate through report categories and discrepancies
-    for category, discrepancies in report.items():
-        if discrepancies:  # Check if there are discrepancies in the current category
-            c.drawString(100, y, f'{category}:')
-            y -= 20
-            
-            for discrepancy in discrepancies:
-                c.drawString(100, y, f"Policy Holder ID: {discrepancy['Policy Holder ID']}")
-                y -= 15
-                c.drawString(100, y, f"Issue: {discrepancy['Issue']}")
-                y -= 30
-
-                # Ensure there's enough space on the current page
-                if y < 100:  # Create a new page if there's no space
-                    c.showPage()
-                    y = 750  # Reset Y-coordinate for new page
-    
-    # Save and return PD
-    c.save()
-    buffer.seek(0)
-    return buffer
+    import pdf_extraction
+    return pdf_extraction.extract_text(file)
 
 if __name__ == '__main__':
+    # Development server; heavy modules load on first use. Use serve.py for pre-forked, warmed workers.
+    logging.basicConfig(level=logging.INFO)
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,163 @@
+import json
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import clause_index
+import instrumentation
+import prompt_builder
+import summarizer
+
+ANALYSIS_PROMPT = """
+The following are an insurance treaty summary and a batch of rows from an insurance bordereaux csv.
+Search for insurance discrepancies related to claims processing in the bordereaux rows.
+Compare them with the insurance treaty and search for any discrepancies related to treaty violations.
+Answer with JSON only, in exactly this shape:
+{"findings": [{"row": <value of the Row column>, "policy_holder_id": "<id>", "category": "claims" or "treaty", "issue": "<description>"}], "summary": "<one paragraph on this batch>"}
+Use an empty findings list if the batch has no discrepancies.
+"""
+
+CLAUSE_ANALYSIS_PROMPT = """
+The following are a batch of rows from an insurance bordereaux csv and the clauses of the insurance treaty most relevant to them.
+Search for insurance discrepancies related to claims processing in the bordereaux rows.
+Compare them with the treaty clauses and search for any discrepancies related to treaty violations.
+Answer with JSON only, in exactly this shape:
+{"findings": [{"row": <value of the Row column>, "policy_holder_id": "<id>", "category": "claims" or "treaty", "clause": <number of the treaty clause concerned, or null>, "issue": "<description>"}], "summary": "<one paragraph on this batch>"}
+Use an empty findings list if the batch has no discrepancies.
+"""
+
+# Per-batch budget; smaller than a full prompt so many batches can run side by side.
+BATCH_TOKEN_BUDGET = 6000
+# Share of each batch budget held back for the treaty clauses retrieved for that batch's rows
+CLAUSE_BUDGET_SHARE = 0.3
+MAX_CONCURRENCY = 4
+ROW_COLUMN = 'Row'
+
+JSON_OBJECT = re.compile(r'\{.*\}', re.DOTALL)
+
+
+def with_row_numbers(bordereaux_df):
+    """Prefix the bordereaux with the same 1-based row numbers the rule-based report uses"""
+    df = bordereaux_df.copy(deep=False)
+    df.insert(0, ROW_COLUMN, bordereaux_df.index + 1)
+    return df
+
+
+def start_batch(treaty_summary, header, max_tokens, prompt=ANALYSIS_PROMPT):
+    builder = prompt_builder.PromptBuilder(max_tokens)
+    builder.add(prompt)
+    if treaty_summary is not None:
+        # The summary may use at most half the budget so every batch has room for rows.
+        builder.add_section("Treaty summary", treaty_summary, max_tokens=max_tokens // 2)
+    builder.add(f"\n\nBordereaux CSV:\n{header}")
+    return builder
+
+
+def plan_batches(bordereaux_df, treaty_summary, max_tokens=BATCH_TOKEN_BUDGET, clauses=None):
+    """Split the bordereaux into consecutive row batches whose prompts each fit max_tokens.
+
+    With a clause_index.ClauseIndex as clauses, each prompt carries the treaty clauses that best
+    match its own rows instead of the treaty summary. Returns a list of (prompt, first_row, row_count, stats)
+    tuples covering every row exactly once; first_row is a 0-based position and stats is the
+    PromptBuilder.stats() of the prompt, clauses included.
+    """
+    df = with_row_numbers(bordereaux_df)
+    header = df.head(0).to_csv(index=False)
+    clause_tokens = int(max_tokens * CLAUSE_BUDGET_SHARE)
+    batches = []
+    rows = []
+
+    def new_batch():
+        if clauses is not None:
+            return start_batch(None, header, max_tokens - clause_tokens, CLAUSE_ANALYSIS_PROMPT)
+        return start_batch(treaty_summary, header, max_tokens)
+
+    def close(builder, first_row):
+        prompt = builder.build()
+        stats = builder.stats()
+        if clauses is not None:
+            excerpt = clauses.excerpt(header + ''.join(rows) + ' ' + clause_index.TOPIC_QUERY, clause_tokens)
+            prompt += excerpt
+            stats['tokens'] += prompt_builder.count_tokens(excerpt) if excerpt else 0
+            stats['max_tokens'] = max_tokens
+        batches.append((prompt, first_row, builder.rows_included, stats))
+        rows.clear()
+
+    builder = new_batch()
+    first_row = 0
+    # csv_rows yields one record per DataFrame row, so positions are row positions even when cells hold line breaks
+    for position, row in zip(range(len(df)), prompt_builder.csv_rows(df), strict=True):
+        if builder.add_row(row):
+            rows.append(row)
+            continue
+        if builder.rows_included:
+            close(builder, first_row)
+            builder = new_batch()
+            first_row = position
+            if builder.add_row(row):
+                rows.append(row)
+                continue
+        # A single row larger than the whole budget still gets analysed, trimmed to fit.
+        print(f"Bordereaux row {position + 1} does not fit in one prompt; sending it trimmed")
+        builder.add_section(None, row)
+        builder.rows_included += 1
+        rows.append(row)
+        close(builder, first_row)
+        builder = new_batch()
+        first_row = position + 1
+    if builder.rows_included:
+        close(builder, first_row)
+    return batches
+
+
+def parse_findings(text):
+    """Parse the model's JSON answer, tolerating code fences and surrounding prose"""
+    match = JSON_OBJECT.search(text or '')
+    if not match:
+        raise ValueError("no JSON object in model response")
+    result = json.loads(match.group(0))
+    findings = result.get('findings') or []
+    if not isinstance(findings, list):
+        raise ValueError("'findings' is not a list")
+    return findings, result.get('summary', '')
+
+
+def analyze_batch(batch, complete, **retry):
+    prompt, first_row, row_count, stats = batch
+    rows = {'first_row': first_row + 1, 'row_count': row_count, 'prompt_tokens': stats['tokens'],
+            'truncated': stats['truncated']}
+    try:
+        response = summarizer.complete_with_retry(complete, prompt, **retry)
+        findings, summary = parse_findings(response)
+        return {**rows, 'findings': findings, 'summary': summary}
+    except Exception as e:
+        print(f"Bordereaux batch starting at row {first_row + 1} failed: {e}")
+        return {**rows, 'findings': [], 'summary': '', 'error': str(e)}
+
+
+def analyze(bordereaux_df, treaty_summary, complete, max_tokens=BATCH_TOKEN_BUDGET,
+            max_concurrency=MAX_CONCURRENCY, clauses=None, **retry):
+    """Send every bordereaux row to the model in concurrent batches and merge the findings"""
+    batches = plan_batches(bordereaux_df, treaty_summary, max_tokens, clauses)
+    instrumentation.add(batch_prompt_rows=sum(batch[2] for batch in batches),
+                        batch_prompt_tokens=sum(batch[3]['tokens'] for batch in batches))
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        futures = [instrumentation.submit(executor, analyze_batch, batch, complete, **retry) for batch in batches]
+        results = [future.result() for future in futures]
+
+    findings = [finding for result in results for finding in result['findings']]
+    return {
+        'rows_analysed': sum(result['row_count'] for result in results if 'error' not in result),
+        'rows_total': len(bordereaux_df),
+        'batches': len(results),
+        'findings': findings,
+        'batch_summaries': [result['summary'] for result in results if result['summary']],
+        # Rows and tokens that went into each prompt
+        'batch_prompts': [
+            {key: result[key] for key in ('first_row', 'row_count', 'prompt_tokens', 'truncated')}
+            for result in results
+        ],
+        'failed_batches': [
+            {'first_row': result['first_row'], 'row_count': result['row_count'], 'error': result['error']}
+            for result in results if 'error' in result
+        ],
+    }
@@ -0,0 +1,191 @@
+"""Reconcile every cedant package under a directory tree, e.g. at quarter-end:
+
+    python batch_reconcile.py packages/ --output reports/ --workers 4 --llm-concurrency 8
+
+A package is a directory holding a treaty PDF, a bordereaux workbook and optionally a statement
+PDF; PDFs are told apart by 'treaty' or 'statement' in their file names. Finished packages are
+recorded in <output>/manifest.jsonl, so rerunning the same command resumes where it stopped.
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import AI_Integration
+from pipeline import DEBUG_DUMP_DIR, ReconciliationPipeline
+
+EXCEL_EXTENSIONS = ('.xls', '.xlsx')
+MANIFEST_NAME = 'manifest.jsonl'
+SUMMARY_NAME = 'summary'
+
+
+def file_role(filename):
+    """'treaty', 'bordereaux', 'statement' or None for a file in a package directory"""
+    name, extension = os.path.splitext(filename.lower())
+    if extension in EXCEL_EXTENSIONS:
+        return 'bordereaux'
+    if extension == '.pdf':
+        if 'statement' in name:
+            return 'statement'
+        if 'treaty' in name:
+            return 'treaty'
+    return None
+
+
+def discover_packages(root):
+    """Every directory under root that holds at least a treaty and a bordereaux, in path order"""
+    packages = []
+    for directory, subdirectories, filenames in os.walk(root):
+        subdirectories.sort()
+        files = {}
+        for filename in sorted(filenames):
+            role = file_role(filename)
+            if role and role not in files:
+                files[role] = os.path.join(directory, filename)
+        if 'treaty' not in files or 'bordereaux' not in files:
+            continue
+        package_id = os.path.relpath(directory, root).replace(os.sep, '/')
+        packages.append({
+            'id': package_id,
+            # Packages are usually laid out as <cedant>/<period>/, so the top folder names the cedant.
+            'cedant': package_id.split('/')[0] if package_id != '.' else None,
+            'treaty': files['treaty'],
+            'bordereaux': files['bordereaux'],
+            'statement': files.get('statement'),
+        })
+    return packages
+
+
+def read_manifest(output_dir):
+    """Latest manifest entry per package id"""
+    entries = {}
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return entries
+    with open(path, 'r', encoding='utf-8') as file:
+        for line in file:
+            if line.strip():
+                entry = json.loads(line)
+                entries[entry['id']] = entry
+    return entries
+
+
+def append_manifest(output_dir, entry):
+    with open(os.path.join(output_dir, MANIFEST_NAME), 'a', encoding='utf-8') as file:
+        file.write(json.dumps(entry) + '\n')
+        file.flush()
+        os.fsync(file.fileno())
+
+
+def init_worker(llm_slots):
+    AI_Integration.llm_slots = llm_slots
+
+
+def process_package(package, output_dir):
+    """Run the full reconciliation for one package and write its reports; never raises"""
+    started = time.time()
+    report_dir = os.path.join(output_dir, *package['id'].split('/'))
+    entry = {'id': package['id'], 'report_dir': report_dir}
+    reconciliation = None
+    try:
+        os.makedirs(report_dir, exist_ok=True)
+        debug_dir = os.path.join(DEBUG_DUMP_DIR, *package['id'].split('/')) if DEBUG_DUMP_DIR else None
+        reconciliation = ReconciliationPipeline(package['treaty'], package['bordereaux'], package['statement'],
+                                                debug_dir=debug_dir, cedant=package['cedant'], run_id=package['id'])
+        ai_report, pdf_buffer = reconciliation.run()
+        with open(os.path.join(report_dir, 'report.pdf'), 'wb') as file, pdf_buffer:
+            for chunk in iter(lambda: pdf_buffer.read(1024 * 1024), b''):
+                file.write(chunk)
+        with open(os.path.join(report_dir, 'ai_report.json'), 'w', encoding='utf-8') as file:
+            file.write(ai_report)
+        with open(os.path.join(report_dir, 'discrepancies.json'), 'w', encoding='utf-8') as file:
+            json.dump(reconciliation.report, file, indent=2, default=str)
+        entry.update(status='done', rows=len(reconciliation.bordereaux_df),
+                     counts={category: len(items) for category, items in reconciliation.report.items()},
+                     ai_findings=len(json.loads(ai_report).get('findings', [])))
+    except Exception as e:
+        entry.update(status='failed', error=str(e), traceback=traceback.format_exc())
+    if reconciliation is not None:
+        reconciliation.trace.write(os.path.join(report_dir, 'trace.json'))
+    entry['elapsed_seconds'] = round(time.time() - started, 3)
+    entry['finished_at'] = time.time()
+    return entry
+
+
+def write_summary(output_dir, entries):
+    """Aggregate per-package results into summary.json and a summary.csv with one row per package"""
+    entries = sorted(entries.values(), key=lambda entry: entry['id'])
+    categories = []
+    for entry in entries:
+        for category in entry.get('counts', {}):
+            if category not in categories:
+                categories.append(category)
+    totals = {category: sum(entry.get('counts', {}).get(category, 0) for entry in entries)
+              for category in categories}
+    summary = {
+        'packages': len(entries),
+        'done': sum(entry['status'] == 'done' for entry in entries),
+        'failed': [entry['id'] for entry in entries if entry['status'] == 'failed'],
+        'rows': sum(entry.get('rows', 0) for entry in entries),
+        'ai_findings': sum(entry.get('ai_findings', 0) for entry in entries),
+        'totals': totals,
+    }
+    with open(os.path.join(output_dir, f'{SUMMARY_NAME}.json'), 'w', encoding='utf-8') as file:
+        json.dump(summary, file, indent=2)
+    with open(os.path.join(output_dir, f'{SUMMARY_NAME}.csv'), 'w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow(['package', 'status', 'elapsed_seconds', 'rows', 'ai_findings', *categories, 'error'])
+        for entry in entries:
+            counts = entry.get('counts', {})
+            writer.writerow([entry['id'], entry['status'], entry.get('elapsed_seconds'), entry.get('rows', ''),
+                             entry.get('ai_findings', ''), *(counts.get(category, '') for category in categories),
+                             entry.get('error', '')])
+    return summary
+
+
+def run_batch(root, output_dir, workers=2, llm_concurrency=4, force=False):
+    """Process every package not yet done according to the manifest; returns the aggregate summary"""
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = read_manifest(output_dir)
+    packages = discover_packages(root)
+    pending = [package for package in packages
+               if force or manifest.get(package['id'], {}).get('status') != 'done']
+    print(f"Found {len(packages)} packages, {len(pending)} to process")
+
+    if pending:
+        llm_slots = multiprocessing.BoundedSemaphore(llm_concurrency)
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(llm_slots,)) as executor:
+            futures = {executor.submit(process_package, package, output_dir): package for package in pending}
+            for future in as_completed(futures):
+                entry = future.result()
+                # Entries are appended as packages finish, so an interrupted run resumes from here.
+                append_manifest(output_dir, entry)
+                manifest[entry['id']] = entry
+                print(f"{entry['id']}: {entry['status']} in {entry['elapsed_seconds']}s"
+                      + (f" ({entry['error']})" if entry['status'] == 'failed' else ''))
+
+    known = {package['id'] for package in packages}
+    return write_summary(output_dir, {key: entry for key, entry in manifest.items() if key in known})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Reconcile every treaty/bordereaux/statement package under a directory.')
+    parser.add_argument('root', help='directory tree holding one package per folder')
+    parser.add_argument('--output', '-o', default='batch_reports', help='directory for reports and the manifest')
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help='packages processed in parallel')
+    parser.add_argument('--llm-concurrency', type=int, default=4,
+                        help='maximum model API calls in flight across all workers')
+    parser.add_argument('--force', action='store_true', help='reprocess packages the manifest marks as done')
+    args = parser.parse_args(argv)
+    summary = run_batch(args.root, args.output, args.workers, args.llm_concurrency, args.force)
+    print(f"{summary['done']} of {summary['packages']} packages done, {len(summary['failed'])} failed")
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,356 @@
+"""Time the parsing, comparison, rule and report functions on synthetic data at several scales:
+
+    python benchmark.py --scales 1000,10000,100000 --output results.json
+    python benchmark.py --output new.json --compare results.json
+    python benchmark.py --startup --scales '' --output startup.json
+
+Treaty PDFs, statement PDFs and bordereaux are generated from a fixed seed, so two runs at the same
+scales time the same inputs. Model calls go to a stub backend. Results are written as JSON, one
+entry per (benchmark, rows); with --compare, medians are checked against an earlier results file
+and the exit status is 1 if any benchmark got slower than the threshold allows. --startup adds
+cold-start timings of a fresh worker process (rows 0), so autoscaling regressions show up too.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import openai
+import pandas as pd
+
+import AI_Integration
+import analysis
+import instrumentation
+import llm_cache
+import pdf_extraction
+import pdf_report
+import prompt_builder
+
+SEED = 1234
+DEFAULT_SCALES = (1000, 10000)
+DEFAULT_REPEATS = 3
+# A benchmark counts as a regression when its median is this much slower than the baseline's.
+REGRESSION_THRESHOLD = 0.2
+# ...and at least this many seconds slower, so millisecond-scale timer noise is not reported.
+REGRESSION_MIN_SECONDS = 0.01
+TREATY_CLAUSES = 200
+STATEMENT_COLUMNS = ('Policy Holder ID', 'Premium Amount', 'Claim Amount', 'Start Date of Cover')
+
+CLAUSES = (
+    'The Reinsurer shall indemnify the Cedant for each {field} recorded for Policy Holder ID {id} '
+    'up to {amount} per annum.',
+    'Where the {field} of Policy Holder ID {id} exceeds {amount}, the Cedant shall notify the '
+    'Reinsurer within thirty days.',
+    'Premium Amount for Policy Holder ID {id} is payable in quarterly installments of {amount}.',
+    'Claims arising under the Benefit Limit shall be settled net of any recoveries, subject to a '
+    'retention of {amount} for Policy Holder ID {id}.',
+)
+
+
+def synthetic_bordereaux(rows, extra_columns=0, duplicate_rate=0.02, fraud_rate=0.01, seed=SEED):
+    """Bordereaux-shaped DataFrame: a share of rows repeat an earlier Policy Holder ID and a share
+    claim more than twice their premium, so the duplicate and fraud rules have work to do."""
+    rng = np.random.default_rng(seed)
+    ids = np.array([f'PH{number:08d}' for number in range(1, rows + 1)], dtype=object)
+    duplicates = np.flatnonzero(rng.random(rows) < duplicate_rate)
+    duplicates = duplicates[duplicates > 0]
+    ids[duplicates] = ids[rng.integers(0, duplicates)]
+
+    premiums = rng.integers(50_000, 5_000_000, rows)
+    claims = (premiums * rng.uniform(0, 1.5, rows)).astype(np.int64)
+    fraud = rng.random(rows) < fraud_rate
+    claims[fraud] = premiums[fraud] * rng.integers(3, 10, int(fraud.sum()))
+    principals = rng.integers(1, 40, rows)
+    dependants = rng.integers(0, 100, rows)
+    starts = np.datetime64('2020-01-01') + rng.integers(0, 730, rows).astype('timedelta64[D]')
+
+    df = pd.DataFrame({
+        'Policy Holder ID': ids,
+        'Principal beneficiary': principals,
+        'Dependants': dependants,
+        'Total beneficiaries': principals + dependants,
+        'Start Date of Cover': pd.to_datetime(starts),
+        'End Date of Cover': pd.to_datetime(starts + np.timedelta64(364, 'D')),
+        'Premium Amount': premiums,
+        'Claim Amount': claims,
+        'Benefit Limit': rng.choice([500_000, 1_200_000, 2_000_000, 8_000_000], rows),
+        'Premium Paid/Billed': premiums - rng.integers(0, 2, rows) * rng.integers(0, 50_000, rows),
+    })
+    for number in range(1, extra_columns + 1):
+        df[f'Extra {number}'] = rng.integers(0, 1_000_000, rows)
+    return df
+
+
+def write_treaty_pdf(path, bordereaux_df, clauses=TREATY_CLAUSES, seed=SEED):
+    """Treaty PDF whose clauses name bordereaux fields, IDs and amounts"""
+    rng = np.random.default_rng(seed + 1)
+    fields = ['Premium Amount', 'Claim Amount', 'Benefit Limit', 'Start Date of Cover']
+    with open(path, 'wb') as file, pdf_report.StreamingPdfWriter(file, 'Quota Share Treaty') as writer:
+        for number in range(1, clauses + 1):
+            position = int(rng.integers(0, len(bordereaux_df))) if len(bordereaux_df) else 0
+            row = bordereaux_df.iloc[position] if len(bordereaux_df) else None
+            clause = CLAUSES[number % len(CLAUSES)].format(
+                field=fields[number % len(fields)],
+                id=row['Policy Holder ID'] if row is not None else 'N/A',
+                amount=row['Premium Amount'] if row is not None else 0)
+            writer.heading(f'Article {number}')
+            writer.paragraph(clause)
+
+
+def write_statement_pdf(path, bordereaux_df, mismatch_rate=0.05, missing_rate=0.01, seed=SEED):
+    """Statement of account PDF listing the bordereaux rows, with some premiums changed and rows left out"""
+    rng = np.random.default_rng(seed + 2)
+    statement = bordereaux_df[list(STATEMENT_COLUMNS)].copy()
+    mismatched = rng.random(len(statement)) < mismatch_rate
+    statement.loc[mismatched, 'Premium Amount'] += rng.integers(1, 100_000, int(mismatched.sum()))
+    statement = statement[rng.random(len(statement)) >= missing_rate]
+    statement['Start Date of Cover'] = statement['Start Date of Cover'].dt.strftime('%Y-%m-%d')
+    with open(path, 'wb') as file, pdf_report.StreamingPdfWriter(file, 'Statement of Account') as writer:
+        writer.table(STATEMENT_COLUMNS, statement.itertuples(index=False, name=None))
+
+
+class StubChatCompletion:
+    """Stands in for openai.ChatCompletion: answers instantly (or after latency seconds) with a
+    well-formed reply and token usage estimated from the prompt length."""
+
+    latency = 0.0
+
+    @classmethod
+    def create(cls, model=None, messages=(), **kwargs):
+        if cls.latency:
+            time.sleep(cls.latency)
+        prompt = messages[-1]['content'] if messages else ''
+        if '"findings"' in prompt:
+            content = json.dumps({'findings': [], 'summary': 'No discrepancies in this batch.'})
+        else:
+            content = 'The treaty covers medical benefits up to the stated limits.'
+        return {
+            'choices': [{'message': {'content': content}}],
+            'usage': {'prompt_tokens': len(prompt) // 4, 'completion_tokens': len(content) // 4},
+        }
+
+
+# Run in a fresh interpreter per repeat; prints the timings as JSON on its last line.
+STARTUP_PROBE = """
+import json, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.app.test_client().get('/healthz')
+responded = time.perf_counter()
+app.warm()
+warmed = time.perf_counter()
+print(json.dumps({'import app': imported - started, 'first /healthz response': responded - started,
+                  'warm': warmed - responded}))
+"""
+
+
+def measure(fn, repeats, setup=None):
+    """Wall-clock seconds of each of repeats calls to fn, after an optional untimed setup call"""
+    timings = []
+    for _ in range(repeats):
+        if setup:
+            setup()
+        gc.collect()
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def result(name, rows, timings):
+    return {
+        'name': name,
+        'rows': rows,
+        'repeats': len(timings),
+        'min_seconds': round(min(timings), 6),
+        'median_seconds': round(statistics.median(timings), 6),
+        'mean_seconds': round(statistics.mean(timings), 6),
+        # Process high-water mark after the benchmark, not the memory of this benchmark alone
+        'peak_rss_bytes': instrumentation.peak_rss_bytes(),
+    }
+
+
+def run_startup(repeats):
+    """Cold-start timings of new worker processes: importing the app, answering a health check, warming up"""
+    timings = {}
+    for _ in range(repeats):
+        started = time.perf_counter()
+        output = subprocess.run([sys.executable, '-c', STARTUP_PROBE], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+        total = time.perf_counter() - started
+        probe = json.loads(output.strip().splitlines()[-1])
+        probe['process total'] = total
+        for name, seconds in probe.items():
+            timings.setdefault(f'startup: {name}', []).append(seconds)
+    results = []
+    for name, values in timings.items():
+        results.append(result(name, 0, values))
+        print(f"{name:<40} {'':>14}  median {statistics.median(values):9.4f}s  min {min(values):9.4f}s")
+    return results
+
+
+def clear_directory(directory):
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory)
+
+
+def run_scale(rows, repeats, data_dir, extra_columns=0, duplicate_rate=0.02, fraud_rate=0.01):
+    """Generate one scale's inputs and time every benchmark on them"""
+    directory = os.path.join(data_dir, str(rows))
+    os.makedirs(directory, exist_ok=True)
+    bordereaux_df = synthetic_bordereaux(rows, extra_columns, duplicate_rate, fraud_rate)
+    bordereaux_path = os.path.join(directory, 'bordereaux.xlsx')
+    treaty_path = os.path.join(directory, 'treaty.pdf')
+    statement_path = os.path.join(directory, 'statement.pdf')
+    bordereaux_df.to_excel(bordereaux_path, index=False)
+    write_treaty_pdf(treaty_path, bordereaux_df)
+    write_statement_pdf(statement_path, bordereaux_df)
+
+    # Extraction is timed cold: the text cache is pointed at a scratch directory emptied before each call.
+    text_cache_dir = os.path.join(directory, 'pdf_text')
+    pdf_extraction._cache = pdf_extraction.TextCache(text_cache_dir)
+    treaty_text = pdf_extraction.extract_text(treaty_path, use_cache=False)
+    statement_text = pdf_extraction.extract_text(statement_path, use_cache=False)
+    common_fields = analysis.identify_common_fields(bordereaux_df, statement_text, treaty_text)
+    statement_discrepancies = analysis.compare_bordereaux_statement(bordereaux_df, statement_text, common_fields)
+    report = analysis.generate_report(
+        statement_discrepancies,
+        analysis.compare_bordereaux_treaty(bordereaux_df, treaty_text, common_fields),
+        analysis.compare_premium_prices(bordereaux_df, statement_text, common_fields),
+        analysis.flag_fraudulent_claims(bordereaux_df),
+        analysis.detect_duplicate_data(bordereaux_df))
+    findings_csv = os.path.join(directory, 'findings.csv')
+    pd.DataFrame(statement_discrepancies, columns=list(pdf_report.REPORT_COLUMNS)).to_csv(findings_csv, index=False)
+
+    def generate_pdf_report():
+        with analysis.generate_pdf_report(report):
+            pass
+
+    benchmarks = [
+        ('extract_text_from_pdf (treaty)', lambda: AI_Integration.extract_text_from_pdf(treaty_path),
+         lambda: clear_directory(text_cache_dir)),
+        ('extract_text_from_pdf (statement)', lambda: AI_Integration.extract_text_from_pdf(statement_path),
+         lambda: clear_directory(text_cache_dir)),
+        ('clean_excel', lambda: AI_Integration.clean_excel(bordereaux_path, os.path.join(directory, 'clean.xlsx')),
+         None),
+        ('compare_bordereaux_statement',
+         lambda: analysis.compare_bordereaux_statement(bordereaux_df, statement_text, common_fields), None),
+        ('compare_bordereaux_treaty',
+         lambda: analysis.compare_bordereaux_treaty(bordereaux_df, treaty_text, common_fields), None),
+        ('compare_premium_prices',
+         lambda: analysis.compare_premium_prices(bordereaux_df, statement_text, common_fields), None),
+        ('flag_fraudulent_claims', lambda: analysis.flag_fraudulent_claims(bordereaux_df), None),
+        ('detect_duplicate_data', lambda: analysis.detect_duplicate_data(bordereaux_df), None),
+        ('generate_pdf_report', generate_pdf_report, None),
+        ('generate_pdf_from_csv',
+         lambda: AI_Integration.generate_pdf_from_csv(findings_csv, os.path.join(directory, 'findings.pdf')), None),
+    ]
+    try:
+        prompt_builder.load_encoder()
+        benchmarks.append(('run_ai_analysis (stub LLM)',
+                           lambda: AI_Integration.run_ai_analysis(treaty_text, bordereaux_df), None))
+    except Exception as e:
+        print(f"Skipping run_ai_analysis, tokenizer unavailable: {e}")
+
+    results = []
+    for name, fn, setup in benchmarks:
+        timings = measure(fn, repeats, setup)
+        results.append(result(name, rows, timings))
+        print(f"{name:<40} {rows:>9} rows  median {statistics.median(timings):9.4f}s  min {min(timings):9.4f}s")
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def compare(results, baseline, threshold=REGRESSION_THRESHOLD):
+    """Print each benchmark's median against the baseline's; returns the (name, rows) that regressed"""
+    previous = {(entry['name'], entry['rows']): entry for entry in baseline['results']}
+    regressions = []
+    print(f"\nAgainst {baseline.get('git_commit') or 'baseline'} (regression above +{threshold:.0%}):")
+    for entry in results['results']:
+        before = previous.get((entry['name'], entry['rows']))
+        if before is None or not before['median_seconds']:
+            continue
+        change = entry['median_seconds'] / before['median_seconds'] - 1
+        regressed = change > threshold and entry['median_seconds'] - before['median_seconds'] > REGRESSION_MIN_SECONDS
+        if regressed:
+            regressions.append((entry['name'], entry['rows']))
+        print(f"{entry['name']:<40} {entry['rows']:>9} rows  {before['median_seconds']:9.4f}s -> "
+              f"{entry['median_seconds']:9.4f}s  {change:+7.1%}{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+def run_benchmarks(scales=DEFAULT_SCALES, repeats=DEFAULT_REPEATS, data_dir=None, llm_latency=0.0, startup=False,
+                   **generator):
+    """Run every benchmark at every scale with the stub LLM installed; returns the results record"""
+    StubChatCompletion.latency = llm_latency
+    openai.ChatCompletion = StubChatCompletion
+    scratch = tempfile.mkdtemp(prefix='claims-benchmark-')
+    # Every call reaches the stub and nothing lands in the real response cache.
+    llm_cache.BYPASS = True
+    llm_cache.response_cache = llm_cache.ResponseCache(os.path.join(scratch, 'llm_responses.sqlite3'))
+    try:
+        results = run_startup(repeats) if startup else []
+        for rows in scales:
+            results.extend(run_scale(rows, repeats, data_dir or scratch, **generator))
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+    return {
+        'created_at': time.time(),
+        'git_commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'config': {'scales': list(scales), 'repeats': repeats, 'seed': SEED, 'llm_latency': llm_latency,
+                   'startup': startup, **generator},
+        'results': results,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the reconciliation functions on synthetic data.')
+    parser.add_argument('--scales', default=','.join(map(str, DEFAULT_SCALES)),
+                        help="comma-separated bordereaux row counts; '' for none")
+    parser.add_argument('--repeats', type=int, default=DEFAULT_REPEATS, help='timed calls per benchmark')
+    parser.add_argument('--extra-columns', type=int, default=0, help='filler columns added to the bordereaux')
+    parser.add_argument('--duplicate-rate', type=float, default=0.02, help='share of rows reusing an earlier ID')
+    parser.add_argument('--fraud-rate', type=float, default=0.01, help='share of rows claiming over twice the premium')
+    parser.add_argument('--llm-latency', type=float, default=0.0, help='seconds the stub LLM waits per call')
+    parser.add_argument('--startup', action='store_true', help='also time the cold start of a worker process')
+    parser.add_argument('--data-dir', help='keep the generated inputs here instead of a temporary directory')
+    parser.add_argument('--output', '-o', default='benchmark_results.json', help='where to write the results')
+    parser.add_argument('--compare', help='earlier results file to check for regressions')
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+                        help='allowed slowdown of the median before a benchmark counts as regressed')
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks([int(scale) for scale in args.scales.split(',') if scale], args.repeats, args.data_dir,
+                             args.llm_latency, args.startup, extra_columns=args.extra_columns,
+                             duplicate_rate=args.duplicate_rate, fraud_rate=args.fraud_rate)
+    with open(args.output, 'w', encoding='utf-8') as file:
+        json.dump(results, file, indent=2)
+    print(f"Results written to {args.output}")
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as file:
+            regressions = compare(results, json.load(file), args.threshold)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
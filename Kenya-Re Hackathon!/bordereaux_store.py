@@ -0,0 +1,148 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pandas.api.types import infer_dtype
+
+STORE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'bordereaux')
+# Bumped whenever ingest (excel_ingest typing) or the stored layout changes, so old files are re-ingested.
+STORE_VERSION = 2
+STORE_SUFFIX = f'.v{STORE_VERSION}.parquet'
+HASH_BLOCK = 1024 * 1024
+# Mixed-type columns (e.g. numbers with a text sub-header row) are stored as strings plus a
+# per-value kind code so the original Python types can be restored on load.
+KIND_PREFIX = '__kind__'
+MIXED_KEY = b'claims.mixed_columns'
+HOMOGENEOUS = ('string', 'integer', 'floating', 'datetime', 'datetime64', 'boolean')
+KIND_NULL, KIND_STR, KIND_INT, KIND_FLOAT, KIND_DATETIME, KIND_BOOL = range(6)
+
+
+def file_hash(file):
+    """SHA-256 of an upload, path or file-like object, read in blocks"""
+    digest = hashlib.sha256()
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, 'rb') as handle:
+            for block in iter(lambda: handle.read(HASH_BLOCK), b''):
+                digest.update(block)
+        return digest.hexdigest()
+    file.seek(0)
+    for block in iter(lambda: file.read(HASH_BLOCK), b''):
+        digest.update(block)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def store_path(key, store_dir=STORE_DIR):
+    return os.path.join(store_dir, f'{key}{STORE_SUFFIX}')
+
+
+def stored_keys(store_dir=STORE_DIR):
+    """Keys of the frames stored in store_dir in the current format"""
+    return [name[:-len(STORE_SUFFIX)] for name in os.listdir(store_dir) if name.endswith(STORE_SUFFIX)]
+
+
+def value_kind(value):
+    if value is None or (isinstance(value, float) and np.isnan(value)) or value is pd.NaT:
+        return KIND_NULL
+    if isinstance(value, (bool, np.bool_)):
+        return KIND_BOOL
+    if isinstance(value, (int, np.integer)):
+        return KIND_INT
+    if isinstance(value, (float, np.floating)):
+        return KIND_FLOAT
+    if isinstance(value, (pd.Timestamp, np.datetime64)) or hasattr(value, 'isoformat'):
+        return KIND_DATETIME
+    return KIND_STR
+
+
+def encode_mixed(column):
+    kinds = np.fromiter((value_kind(value) for value in column), dtype=np.int8, count=len(column))
+    text = [None if kind == KIND_NULL else str(value) for value, kind in zip(column, kinds)]
+    return pa.array(text, type=pa.string()), pa.array(kinds, type=pa.int8())
+
+
+def decode_mixed(text, kinds):
+    # Blanks come back as NaN, as read_excel gives them in object columns
+    values = np.full(len(text), np.nan, dtype=object)
+    for kind, convert in ((KIND_STR, str), (KIND_INT, int), (KIND_FLOAT, float),
+                          (KIND_DATETIME, pd.Timestamp), (KIND_BOOL, lambda value: value == 'True')):
+        positions = np.flatnonzero(kinds == kind)
+        if len(positions):
+            values[positions] = [convert(value) for value in text[positions]]
+    return values
+
+
+def save(key, df, store_dir=STORE_DIR):
+    """Persist an ingested bordereaux as Parquet under its content hash"""
+    os.makedirs(store_dir, exist_ok=True)
+    plain = {}
+    mixed = []
+    for name in df.columns:
+        column = df[name]
+        if isinstance(column.dtype, pd.CategoricalDtype) and infer_dtype(column.cat.categories) not in HOMOGENEOUS:
+            # Arrow dictionaries need one value type; store these like any mixed column.
+            mixed.append(name)
+        elif column.dtype == object and infer_dtype(column, skipna=True) not in ('string', 'empty'):
+            mixed.append(name)
+        else:
+            plain[name] = column
+    table = pa.Table.from_pandas(pd.DataFrame(plain, index=df.index), preserve_index=True)
+    for name in mixed:
+        text, kinds = encode_mixed(df[name].to_numpy(dtype=object))
+        table = table.append_column(name, text).append_column(KIND_PREFIX + name, kinds)
+
+    metadata = dict(table.schema.metadata or {})
+    categorical = [name for name in df.columns if isinstance(df[name].dtype, pd.CategoricalDtype)]
+    metadata[MIXED_KEY] = json.dumps({'mixed': mixed, 'categorical': categorical,
+                                      'columns': [str(name) for name in df.columns]}).encode()
+    table = table.replace_schema_metadata(metadata)
+
+    path = store_path(key, store_dir)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    pq.write_table(table, tmp_path)
+    os.replace(tmp_path, path)
+    return path
+
+
+def load(key, columns=None, store_dir=STORE_DIR):
+    """Memory-map a stored bordereaux, reading only the requested columns; None if not stored"""
+    path = store_path(key, store_dir)
+    if not os.path.exists(path):
+        return None
+    layout = json.loads(pq.read_schema(path).metadata[MIXED_KEY])
+    wanted = layout['columns'] if columns is None else [name for name in layout['columns'] if name in columns]
+    mixed = [name for name in wanted if name in layout['mixed']]
+    read_columns = wanted + [KIND_PREFIX + name for name in mixed]
+
+    table = pq.read_pandas(path, columns=read_columns, memory_map=True)
+    df = table.to_pandas()
+    for name in mixed:
+        df[name] = decode_mixed(df[name].to_numpy(dtype=object), df.pop(KIND_PREFIX + name).to_numpy())
+    # Only string dictionaries come back from Parquet as categoricals; restore the rest.
+    for name in wanted:
+        if name in layout['categorical'] and not isinstance(df[name].dtype, pd.CategoricalDtype):
+            df[name] = df[name].astype('category')
+    return df[wanted]
+
+
+def exists(key, store_dir=STORE_DIR):
+    return os.path.exists(store_path(key, store_dir))
+
+
+def load_or_ingest(key, file, ingest, columns=None, store_dir=STORE_DIR):
+    """Load a bordereaux by content hash, parsing it with ingest(file) and storing it on first sight"""
+    df = load(key, columns, store_dir)
+    if df is not None:
+        return df
+    df = ingest(file)
+    try:
+        save(key, df, store_dir)
+    except Exception as e:
+        print(f"Could not store bordereaux {key}: {e}")
+    if columns is not None:
+        df = df[[name for name in df.columns if name in columns]]
+    return df
@@ -0,0 +1,162 @@
+import os
+import time
+from contextlib import closing
+
+import numpy as np
+import pandas as pd
+
+import keyed_reconciliation
+import sqlite_store
+
+CLAIMS_DB = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'claims_index.sqlite3')
+# Set CLAIMS_HISTORY=0 to skip checking bordereaux against previously processed claims.
+ENABLED = os.environ.get('CLAIMS_HISTORY', '1').lower() not in ('0', 'false', 'no')
+CATEGORY = 'Previously Submitted Claims'
+# Claim amounts are compared in buckets of this size, looking in the adjacent buckets too: amounts less
+# than one bucket apart (1,500.00 and 1500.4, or 199 and 201) always count as the same claim.
+AMOUNT_BUCKET = 100
+NEIGHBOUR_BUCKETS = (-1, 1)
+ID_COLUMNS = ('Policy Holder ID', 'Claim ID', 'Policy ID')
+DATE_COLUMNS = ('Claim Date', 'Date of Loss', 'Loss Date', 'Date of Claim')
+AMOUNT_COLUMNS = ('Claim Amount', 'Amount Claimed', 'Claim Paid', 'Paid Amount')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS submissions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    bordereaux_key TEXT NOT NULL UNIQUE,
+    cedant TEXT,
+    rows INTEGER NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS claims (
+    claim_key INTEGER NOT NULL,
+    submission_id INTEGER NOT NULL,
+    row INTEGER NOT NULL,
+    PRIMARY KEY (claim_key, submission_id, row)
+) WITHOUT ROWID;
+"""
+
+
+def find_column(bordereaux_df, candidates):
+    """First bordereaux column matching one of candidates, ignoring case and spacing"""
+    labels = {keyed_reconciliation.column_label(name): name for name in bordereaux_df.columns}
+    for candidate in candidates:
+        if keyed_reconciliation.column_label(candidate) in labels:
+            return labels[keyed_reconciliation.column_label(candidate)]
+    return None
+
+
+def key_columns(bordereaux_df):
+    """(id, claim date, claim amount) columns of a claims bordereaux, or None if it lacks any of them"""
+    columns = tuple(find_column(bordereaux_df, candidates)
+                    for candidates in (ID_COLUMNS, DATE_COLUMNS, AMOUNT_COLUMNS))
+    return columns if all(column is not None for column in columns) else None
+
+
+def claim_parts(bordereaux_df, columns):
+    """Positions of the rows with an ID, date and amount, and the normalized (ID, day, amount bucket) of each"""
+    id_column, date_column, amount_column = columns
+    ids = keyed_reconciliation.normalized_column(bordereaux_df[id_column])
+    days = pd.to_datetime(bordereaux_df[date_column], errors='coerce')
+    amounts = pd.to_numeric(bordereaux_df[amount_column], errors='coerce')
+    valid = (ids.notna() & days.notna() & amounts.notna()).to_numpy()
+    positions = np.flatnonzero(valid)
+    return positions, pd.DataFrame({
+        'id': ids.to_numpy(dtype=object)[positions],
+        'day': days.to_numpy(dtype='datetime64[D]')[positions].astype(np.int64),
+        'bucket': np.floor(amounts.to_numpy(dtype='float64')[positions] / AMOUNT_BUCKET).astype(np.int64),
+    })
+
+
+def hash_parts(parts, bucket_offset=0):
+    """64-bit claim key of each (ID, day, amount bucket + bucket_offset)"""
+    if not len(parts):
+        return np.zeros(0, dtype=np.int64)
+    if bucket_offset:
+        parts = parts.assign(bucket=parts['bucket'] + bucket_offset)
+    return pd.util.hash_pandas_object(parts, index=False).to_numpy().view(np.int64)
+
+
+def claim_keys(bordereaux_df, columns):
+    """Positions of the rows with an ID, date and amount, and the claim key of each"""
+    positions, parts = claim_parts(bordereaux_df, columns)
+    return positions, hash_parts(parts)
+
+
+class ClaimsIndex:
+    """Composite keys of every claim in every processed bordereaux, in SQLite, clustered by key"""
+
+    def __init__(self, db_path=CLAIMS_DB):
+        self.db_path = db_path
+        self.database = sqlite_store.Database(db_path, SCHEMA)
+
+    def _connect(self):
+        return self.database.connect()
+
+    def lookup(self, keys, exclude_bordereaux_key=None, positions=None):
+        """Earliest past sighting of each key, as {position: (cedant, row, created_at)}, in one query.
+
+        positions gives the position each key stands for (default: its index in keys); several keys may
+        share one. Claims from the bordereaux identified by exclude_bordereaux_key (the file being
+        checked) are ignored.
+        """
+        if not len(keys):
+            return {}
+        if positions is None:
+            positions = np.arange(len(keys))
+        with closing(self._connect()) as conn:
+            # Keyed on position first so the join walks the batch in order and searches claims by key
+            conn.execute('CREATE TEMP TABLE batch (position INTEGER NOT NULL, claim_key INTEGER NOT NULL, '
+                         'PRIMARY KEY (position, claim_key)) WITHOUT ROWID')
+            conn.executemany('INSERT OR IGNORE INTO batch VALUES (?, ?)', zip(positions.tolist(), keys.tolist()))
+            matches = conn.execute(
+                'SELECT batch.position, submissions.cedant, claims.row, submissions.created_at '
+                'FROM batch JOIN claims ON claims.claim_key = batch.claim_key '
+                'JOIN submissions ON submissions.id = claims.submission_id '
+                'WHERE submissions.bordereaux_key IS NOT ? '
+                'ORDER BY batch.position, claims.submission_id, claims.row', (exclude_bordereaux_key,))
+            seen = {}
+            for position, cedant, row, created_at in matches:
+                seen.setdefault(position, (cedant, row, created_at))
+            return seen
+
+    def add(self, bordereaux_key, cedant, row_numbers, keys):
+        """Record a bordereaux's claim keys; a bordereaux already recorded is left as it is"""
+        with closing(self._connect()) as conn, conn:
+            cursor = conn.execute('INSERT OR IGNORE INTO submissions (bordereaux_key, cedant, rows, created_at) '
+                                  'VALUES (?, ?, ?, ?)', (bordereaux_key, cedant, len(keys), time.time()))
+            if not cursor.rowcount:
+                return False
+            conn.executemany('INSERT OR IGNORE INTO claims (claim_key, submission_id, row) VALUES (?, ?, ?)',
+                             zip(keys.tolist(), [cursor.lastrowid] * len(keys), row_numbers.tolist()))
+            return True
+
+
+def check_and_record(bordereaux_df, bordereaux_key, cedant=None, index=None):
+    """Flag rows whose claim was already submitted in another bordereaux, then add this one to the index.
+
+    Returns {CATEGORY: [flag dicts]}, or {} when the bordereaux has no claim ID, date and amount columns.
+    """
+    columns = key_columns(bordereaux_df)
+    if columns is None:
+        return {}
+    index = index or ClaimsIndex()
+    positions, parts = claim_parts(bordereaux_df, columns)
+    keys = hash_parts(parts)
+    row_numbers = bordereaux_df.index.to_numpy()[positions] + 1
+    # Each row is looked up under its own amount bucket and the adjacent ones
+    candidates = np.concatenate([keys] + [hash_parts(parts, offset) for offset in NEIGHBOUR_BUCKETS])
+    seen = index.lookup(candidates, bordereaux_key, np.tile(np.arange(len(keys)), 1 + len(NEIGHBOUR_BUCKETS)))
+    ids = bordereaux_df[columns[0]].to_numpy(dtype=object)
+    flags = []
+    for position in sorted(seen):
+        previous_cedant, previous_row, created_at = seen[position]
+        source = f"{previous_cedant}'s" if previous_cedant else 'an earlier'
+        submitted = time.strftime('%Y-%m-%d', time.localtime(created_at))
+        flags.append({
+            'Policy Holder ID': ids[positions[position]],
+            'Issue': f'Claim with the same {", ".join(columns)} already submitted in {source} bordereaux '
+                     f'processed {submitted} (row {previous_row} there) (Row {row_numbers[position]})',
+        })
+    index.add(bordereaux_key, cedant, row_numbers, keys)
+    return {CATEGORY: flags}
@@ -0,0 +1,202 @@
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+
+import prompt_builder
+import summarizer
+
+INDEX_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'clause_index')
+# Bumped whenever the clause splitting or the stored format changes, so old indexes are rebuilt.
+INDEX_VERSION = 1
+# Set CLAIMS_CLAUSE_RETRIEVAL=0 to send the whole treaty summary with every batch instead.
+ENABLED = os.environ.get('CLAIMS_CLAUSE_RETRIEVAL', '1').lower() not in ('0', 'false', 'no')
+TOP_K = 6
+# Clauses longer than this are split on paragraphs, then into word windows, so one clause is one topic.
+MAX_CLAUSE_WORDS = 250
+TITLE_LENGTH = 60
+# Indexes kept in memory, most recently used last
+MEMORY_INDEXES = 8
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Numbered sub-clauses inside a section: "5.2 ...", "(a) ...", "(iv) ..."
+SUB_CLAUSE = re.compile(r'^[ \t]*(?:\d+(?:\.\d+)+[.)]?|\((?:[a-z]|[ivx]+|\d+)\))[ \t]+', re.IGNORECASE | re.MULTILINE)
+TERM = re.compile(r'[^\W_]+')
+STOPWORDS = frozenset(
+    'a an and any are as at be by for from has have in is it its of on or shall such that the this to '
+    'under was were which will with'.split())
+# Added to every batch query so the clauses a reviewer checks first rank ahead of boilerplate.
+TOPIC_QUERY = 'exclusion exclusions excluded limit limits retention territory territorial premium claims'
+
+
+def terms(text):
+    return [term for term in TERM.findall(text.casefold()) if term not in STOPWORDS]
+
+
+def split_at(text, pattern):
+    starts = [match.start() for match in pattern.finditer(text)]
+    if not starts or starts[0] != 0:
+        starts.insert(0, 0)
+    starts.append(len(text))
+    return [text[start:end] for start, end in zip(starts, starts[1:]) if text[start:end].strip()]
+
+
+def split_long(text, max_words=MAX_CLAUSE_WORDS):
+    """Break text longer than max_words on blank lines, then into consecutive word windows"""
+    if len(text.split()) <= max_words:
+        return [text]
+    paragraphs = [paragraph for paragraph in re.split(r'\n\s*\n', text) if paragraph.strip()]
+    if len(paragraphs) > 1:
+        return [part for paragraph in paragraphs for part in split_long(paragraph, max_words)]
+    words = text.split()
+    return [' '.join(words[start:start + max_words]) for start in range(0, len(words), max_words)]
+
+
+def split_clauses(text):
+    """Numbered clauses of a treaty: sections, their numbered sub-clauses, and long paragraphs split up"""
+    clauses = []
+    for section in summarizer.split_sections(text):
+        for part in split_at(section, SUB_CLAUSE):
+            for piece in split_long(part):
+                title = ' '.join(piece.split())[:TITLE_LENGTH]
+                clauses.append({'number': len(clauses) + 1, 'title': title, 'text': piece.strip()})
+    return clauses
+
+
+def label(clause):
+    return f"Clause {clause['number']}: {clause['title']}"
+
+
+class ClauseIndex:
+    """Inverted index of treaty clauses, ranked with BM25"""
+
+    def __init__(self, clauses, postings=None, lengths=None):
+        self.clauses = clauses
+        if postings is None:
+            postings = {}
+            lengths = []
+            for position, clause in enumerate(clauses):
+                counts = Counter(terms(clause['text']))
+                lengths.append(sum(counts.values()))
+                for term, count in counts.items():
+                    postings.setdefault(term, []).append((position, count))
+        self.postings = postings
+        self.lengths = lengths
+        self.average_length = (sum(lengths) / len(lengths) or 1) if lengths else 1
+
+    def __len__(self):
+        return len(self.clauses)
+
+    def idf(self, term):
+        frequency = len(self.postings.get(term, ()))
+        return math.log(1 + (len(self.clauses) - frequency + 0.5) / (frequency + 0.5))
+
+    def scores(self, query):
+        """BM25 score of every clause against the distinct terms of query"""
+        scores = [0.0] * len(self.clauses)
+        for term in set(terms(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = self.idf(term)
+            for position, count in postings:
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[position] / self.average_length)
+                scores[position] += idf * count * (BM25_K1 + 1) / (count + norm)
+        return scores
+
+    def search(self, query, k=TOP_K):
+        """Up to k clauses that share terms with query, best first"""
+        scores = self.scores(query)
+        ranked = sorted((position for position, score in enumerate(scores) if score > 0),
+                        key=lambda position: -scores[position])
+        return [self.clauses[position] for position in ranked[:k]]
+
+    def excerpt(self, query, max_tokens, k=TOP_K):
+        """Prompt section holding the top clauses for query that fit in max_tokens, or '' if none match"""
+        builder = prompt_builder.PromptBuilder(max_tokens)
+        if not builder.add("\n\nRelevant treaty clauses:"):
+            return ''
+        for clause in self.search(query, k):
+            if not builder.add_section(f"Clause {clause['number']}", clause['text']) or builder.truncated:
+                break
+        return builder.build() if len(builder.parts) > 1 else ''
+
+    def to_dict(self):
+        return {'version': INDEX_VERSION, 'clauses': self.clauses, 'postings': self.postings,
+                'lengths': self.lengths}
+
+    @classmethod
+    def from_dict(cls, data):
+        postings = {term: [tuple(posting) for posting in postings] for term, postings in data['postings'].items()}
+        return cls(data['clauses'], postings, data['lengths'])
+
+
+def index_key(treaty_text):
+    return hashlib.sha256(treaty_text.encode('utf-8')).hexdigest()
+
+
+def index_path(key, index_dir=INDEX_DIR):
+    return os.path.join(index_dir, f'{key}.v{INDEX_VERSION}.json')
+
+
+def load(key, index_dir=INDEX_DIR):
+    try:
+        with open(index_path(key, index_dir), 'r', encoding='utf-8') as file:
+            return ClauseIndex.from_dict(json.load(file))
+    except FileNotFoundError:
+        return None
+
+
+def save(key, index, index_dir=INDEX_DIR):
+    os.makedirs(index_dir, exist_ok=True)
+    path = index_path(key, index_dir)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        json.dump(index.to_dict(), file)
+    os.replace(tmp_path, path)
+
+
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def for_treaty(treaty_text, index_dir=INDEX_DIR):
+    """Clause index of a treaty, from memory, then from disk, building and persisting it the first time"""
+    key = index_key(treaty_text or '')
+    with _indexes_lock:
+        if key in _indexes:
+            _indexes.move_to_end(key)
+            return _indexes[key]
+    index = load(key, index_dir)
+    if index is None:
+        index = ClauseIndex(split_clauses(treaty_text or ''))
+        try:
+            save(key, index, index_dir)
+        except OSError as e:
+            print(f"Could not write treaty clause index: {e}")
+    with _indexes_lock:
+        _indexes[key] = index
+        while len(_indexes) > MEMORY_INDEXES:
+            _indexes.popitem(last=False)
+    return index
+
+
+def cite(items, index, query, k=3):
+    """Add a 'Treaty Clauses' entry to each item naming the clauses most relevant to query(item).
+
+    Items with the same query share one search, so citing thousands of flags on a few fields stays cheap.
+    """
+    if not len(index):
+        return items
+    citations = {}
+    for item in items:
+        text = query(item)
+        if text not in citations:
+            citations[text] = '; '.join(label(clause) for clause in index.search(text, k))
+        if citations[text]:
+            item['Treaty Clauses'] = citations[text]
+    return items
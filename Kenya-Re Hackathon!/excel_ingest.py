@@ -0,0 +1,239 @@
+import re
+
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+from pandas.api.types import (is_bool_dtype, is_datetime64_any_dtype, is_float_dtype, is_integer_dtype,
+                              is_numeric_dtype, is_string_dtype, union_categoricals)
+from pandas.io.parsers import TextParser
+
+CHUNK_ROWS = 50000
+# Columns stored as categoricals (repeated identifiers) and as float64 (money), matched on the header.
+ID_COLUMN = re.compile(r'\bID\b')
+AMOUNT_COLUMN = re.compile(r'amount|premium|limit|balance|paid|payable', re.IGNORECASE)
+
+
+def is_xlsx(file):
+    """True for OOXML workbooks (zip containers), which openpyxl can stream"""
+    if isinstance(file, str):
+        with open(file, 'rb') as handle:
+            return handle.read(2) == b'PK'
+    file.seek(0)
+    signature = file.read(2)
+    file.seek(0)
+    return signature == b'PK'
+
+
+def column_names(header):
+    """Header labels as pandas would name them: blanks become 'Unnamed: i', repeats get '.n' suffixes"""
+    names = []
+    seen = {}
+    for position, label in enumerate(header):
+        name = f'Unnamed: {position}' if label is None else str(label) if not isinstance(label, str) else label
+        if name in seen:
+            seen[name] += 1
+            name = f'{name}.{seen[name]}'
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+
+def cell_value(value):
+    # Match pandas' openpyxl reader: empty cells are '' (read as NaN), whole-number floats come back as ints.
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def parse_rows(rows, names, index):
+    """Type a block of rows as pd.read_excel types a sheet: blanks and NA strings ('NA', 'null', ...)
+    become NaN and numeric text becomes numbers.
+
+    Returns the typed block and, for the columns where text was turned into numbers, the same
+    values kept as read (NA strings still NaN), in case another block makes the column text.
+    """
+    df = TextParser(rows, names=names, header=None).read()
+    df.index = index
+    converted = [name for position, name in enumerate(names)
+                 if is_numeric_dtype(df[name].dtype) and any(isinstance(row[position], str) for row in rows)]
+    as_read = None
+    if converted:
+        as_read = TextParser(rows, names=names, header=None, usecols=converted, dtype=object).read()
+        as_read.index = index
+    return df, as_read
+
+
+def compact_column(name, column):
+    """Compact dtype for one column: categorical for IDs, float64 for numeric amounts"""
+    if ID_COLUMN.search(name):
+        return column.astype('category')
+    if AMOUNT_COLUMN.search(name) and is_numeric_dtype(column.dtype) and not is_bool_dtype(column.dtype):
+        column = column.astype('float64')
+    return column
+
+
+def compact_chunk(df):
+    for name in df.columns:
+        df[name] = compact_column(name, df[name])
+    return df
+
+
+def iter_typed_chunks(file, chunk_rows=CHUNK_ROWS, sheet_name=None):
+    """Yield (typed chunk, as-read text columns or None) for the first (or named) sheet, skipping blank rows.
+
+    Chunks keep a running row index, so row numbers match a full pd.read_excel. Each chunk is typed
+    on its own; concat_chunks settles every column on one dtype across all of them.
+    """
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        sheet = workbook[sheet_name] if sheet_name else workbook.worksheets[0]
+        rows = sheet.iter_rows(values_only=True)
+        header = None
+        for row in rows:
+            if any(value is not None for value in row):
+                header = row
+                break
+        if header is None:
+            return
+        names = column_names(header)
+        width = len(names)
+
+        buffer = []
+        index = []
+        position = 0
+        for row in rows:
+            if not any(value is not None for value in row):
+                # Blank rows keep their position, as dropna(how='all') keeps the original index.
+                position += 1
+                continue
+            values = [cell_value(value) for value in row[:width]]
+            values.extend([''] * (width - len(values)))
+            buffer.append(values)
+            index.append(position)
+            position += 1
+            if len(buffer) >= chunk_rows:
+                df, as_read = parse_rows(buffer, names, index)
+                yield compact_chunk(df), as_read
+                buffer, index = [], []
+        if buffer:
+            df, as_read = parse_rows(buffer, names, index)
+            yield compact_chunk(df), as_read
+    finally:
+        workbook.close()
+
+
+def iter_chunks(file, chunk_rows=CHUNK_ROWS, sheet_name=None):
+    """Yield typed DataFrame chunks of the first (or named) sheet, skipping blank rows as they stream.
+
+    Each chunk is typed on its own, so a column's dtype may differ between chunks; read_bordereaux
+    unifies them. Columns that are empty across the whole sheet are only known at the end.
+    """
+    for chunk, _ in iter_typed_chunks(file, chunk_rows, sheet_name):
+        yield chunk
+
+
+def values_of(column):
+    """The values a column's dtype describes: the categories of a categorical, else the column"""
+    return column.cat.categories if isinstance(column.dtype, pd.CategoricalDtype) else column
+
+
+def value_kind(column):
+    """Kind of values one chunk holds in a column, or None if they are all blank"""
+    if not column.notna().any():
+        return None
+    dtype = values_of(column).dtype
+    if is_bool_dtype(dtype):
+        return 'boolean'
+    if is_integer_dtype(dtype):
+        return 'integer'
+    if is_float_dtype(dtype):
+        return 'floating'
+    if is_datetime64_any_dtype(dtype):
+        return 'datetime'
+    if is_string_dtype(dtype) and dtype != object:
+        return 'string'
+    return 'mixed'
+
+
+def common_dtype(columns):
+    """The dtype pd.read_excel gives the whole column, from the column's chunks; None if it is all blank"""
+    kinds = [value_kind(column) for column in columns]
+    present = set(kinds) - {None}
+    if not present:
+        return None
+    first = next(values_of(column).dtype for column, kind in zip(columns, kinds) if kind is not None)
+    blanks = any(column.isna().any() for column in columns)
+    if present in ({'integer'}, {'boolean'}):
+        return 'float64' if blanks else first
+    # A chunk of booleans with blanks is read as 1.0/0.0, like any other numeric column with blanks.
+    if present <= {'integer', 'floating'} or present <= {'boolean', 'floating'}:
+        return 'float64'
+    if present in ({'datetime'}, {'string'}):
+        return first
+    return object
+
+
+def as_objects(values):
+    """Values as Python objects with NaN for blanks; whole floats become ints, as read_excel keeps them"""
+    values = pd.Series(values, dtype=object)
+    blank = values.isna().to_numpy()
+    objects = np.full(len(values), np.nan, dtype=object)
+    objects[~blank] = [cell_value(value) for value in values.to_numpy()[~blank]]
+    return pd.Series(objects, index=values.index, dtype=object)
+
+
+def unify_column(chunks, as_read, name):
+    """One column of all chunks concatenated with the dtype pd.read_excel gives it, categoricals kept"""
+    columns = [chunk[name] for chunk in chunks]
+    categorical = any(isinstance(column.dtype, pd.CategoricalDtype) for column in columns)
+    dtype = common_dtype(columns)
+    if dtype is None:
+        return pd.concat(columns)
+    if dtype == object:
+        parts = []
+        for column, read in zip(columns, as_read):
+            if read is not None and name in read.columns:
+                # This chunk turned text such as '00123' into numbers, but elsewhere the column is text.
+                column = read[name]
+            parts.append(as_objects(column).set_axis(column.index))
+        # Text in every chunk, once numbers parsed from text are restored, is a string column.
+        column = pd.concat(parts).infer_objects()
+        return column.astype('category') if categorical else column
+    if not categorical:
+        return pd.concat([column if column.dtype == dtype else column.astype(dtype) for column in columns])
+    parts = [pd.Categorical.from_codes(column.cat.codes, column.cat.categories.astype(dtype)) for column in columns]
+    return pd.Series(union_categoricals(parts), index=pd.concat(columns).index, name=name)
+
+
+def concat_chunks(chunks, as_read=None):
+    """Concatenate typed chunks, giving each column one dtype however the rows were split into chunks.
+
+    as_read holds each chunk's as-read text columns (see parse_rows). Categoricals are merged
+    instead of falling back to object dtype.
+    """
+    chunks = list(chunks)
+    if not chunks:
+        return pd.DataFrame()
+    if len(chunks) == 1:
+        return chunks[0]
+    as_read = list(as_read) if as_read is not None else [None] * len(chunks)
+    return pd.DataFrame({name: unify_column(chunks, as_read, name) for name in chunks[0].columns})
+
+
+def read_bordereaux(file, chunk_rows=CHUNK_ROWS):
+    """Stream a bordereaux workbook into a compact DataFrame with empty rows and columns removed.
+
+    Values and dtypes are those of pd.read_excel, whatever chunk_rows is.
+    """
+    chunks = []
+    as_read = []
+    non_empty = set()
+    for chunk, read in iter_typed_chunks(file, chunk_rows):
+        non_empty.update(chunk.columns[chunk.notna().any()])
+        chunks.append(chunk)
+        as_read.append(read)
+    df = concat_chunks(chunks, as_read)
+    return df[[name for name in df.columns if name in non_empty]]
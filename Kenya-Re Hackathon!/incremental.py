@@ -0,0 +1,150 @@
+import hashlib
+import json
+import os
+import time
+from contextlib import closing
+
+import numpy as np
+import pandas as pd
+
+import sqlite_store
+
+SUBMISSIONS_DB = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'submissions.sqlite3')
+# Set CLAIMS_INCREMENTAL=0 to send every row to the model on every submission.
+ENABLED = os.environ.get('CLAIMS_INCREMENTAL', '1').lower() not in ('0', 'false', 'no')
+# Submissions kept per cedant and treaty; only the latest is diffed against.
+KEEP_SUBMISSIONS = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS submissions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    lineage TEXT NOT NULL,
+    bordereaux_key TEXT,
+    rows INTEGER NOT NULL,
+    changed_rows INTEGER NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS submissions_lineage ON submissions (lineage, id);
+CREATE TABLE IF NOT EXISTS row_results (
+    submission_id INTEGER NOT NULL,
+    row_hash INTEGER NOT NULL,
+    findings TEXT NOT NULL,
+    PRIMARY KEY (submission_id, row_hash)
+);
+"""
+
+
+def lineage(cedant, treaty_hash):
+    """Identity of a series of monthly submissions: the cedant plus the treaty they are checked against"""
+    return hashlib.sha256(json.dumps([(cedant or '').strip().casefold(), treaty_hash]).encode()).hexdigest()
+
+
+def row_hashes(bordereaux_df):
+    """Stable 64-bit fingerprint of each row's values, independent of its position in the sheet"""
+    if not len(bordereaux_df):
+        return np.zeros(0, dtype=np.int64)
+    return pd.util.hash_pandas_object(bordereaux_df, index=False).to_numpy().view(np.int64)
+
+
+def row_keys(bordereaux_df):
+    """Row fingerprints numbered by occurrence, so the nth copy of a row only matches an nth copy.
+
+    The first copy keeps its plain row hash; an exact duplicate added to a sheet therefore has a key
+    the previous submission did not analyse and is sent to the model.
+    """
+    hashes = row_hashes(bordereaux_df)
+    occurrence = pd.Series(hashes).groupby(hashes, sort=False).cumcount().to_numpy()
+    repeated = occurrence > 0
+    if repeated.any():
+        copies = pd.DataFrame({'hash': hashes[repeated], 'occurrence': occurrence[repeated]})
+        hashes = hashes.copy()
+        hashes[repeated] = pd.util.hash_pandas_object(copies, index=False).to_numpy().view(np.int64)
+    return hashes
+
+
+def finding_row(finding):
+    """1-based bordereaux row a model finding refers to, or None if it cannot be read"""
+    try:
+        return int(finding.get('row'))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+class SubmissionStore:
+    """Model findings of past submissions per row hash, in SQLite"""
+
+    def __init__(self, db_path=SUBMISSIONS_DB):
+        self.db_path = db_path
+        self.database = sqlite_store.Database(db_path, SCHEMA)
+
+    def _connect(self):
+        return self.database.connect()
+
+    def previous(self, lineage_key):
+        """{row_hash: findings} of every row analysed in the latest submission of this lineage"""
+        with closing(self._connect()) as conn:
+            row = conn.execute('SELECT id FROM submissions WHERE lineage = ? ORDER BY id DESC LIMIT 1',
+                               (lineage_key,)).fetchone()
+            if row is None:
+                return {}
+            results = conn.execute('SELECT row_hash, findings FROM row_results WHERE submission_id = ?', row)
+            return {row_hash: json.loads(findings) for row_hash, findings in results}
+
+    def save(self, lineage_key, bordereaux_key, rows, changed_rows, findings_by_hash):
+        """Record a submission's analysed rows and prune all but the latest KEEP_SUBMISSIONS"""
+        with closing(self._connect()) as conn, conn:
+            cursor = conn.execute('INSERT INTO submissions (lineage, bordereaux_key, rows, changed_rows, created_at) '
+                                  'VALUES (?, ?, ?, ?, ?)',
+                                  (lineage_key, bordereaux_key, rows, changed_rows, time.time()))
+            submission_id = cursor.lastrowid
+            conn.executemany('INSERT INTO row_results (submission_id, row_hash, findings) VALUES (?, ?, ?)',
+                             ((submission_id, int(row_hash), json.dumps(findings, default=str))
+                              for row_hash, findings in findings_by_hash.items()))
+            stale = [stale_id for (stale_id,) in conn.execute(
+                'SELECT id FROM submissions WHERE lineage = ? ORDER BY id DESC LIMIT -1 OFFSET ?',
+                (lineage_key, KEEP_SUBMISSIONS))]
+            conn.executemany('DELETE FROM row_results WHERE submission_id = ?', ((stale_id,) for stale_id in stale))
+            conn.executemany('DELETE FROM submissions WHERE id = ?', ((stale_id,) for stale_id in stale))
+        return submission_id
+
+
+def changed_rows(hashes, previous):
+    """Mask of rows whose fingerprint was not analysed in the previous submission"""
+    if not previous:
+        return np.ones(len(hashes), dtype=bool)
+    return ~np.isin(hashes, np.fromiter(previous, dtype=np.int64, count=len(previous)))
+
+
+def merge_report(report, bordereaux_df, hashes, changed, previous):
+    """Combine the model report for the changed rows with reused findings for unchanged rows.
+
+    Returns the merged report and {row_hash: findings} for every row whose result is now known;
+    rows in failed batches are left out so the next submission retries them.
+    """
+    row_numbers = bordereaux_df.index.to_numpy() + 1
+    changed_positions = np.flatnonzero(changed)
+    hash_by_row = dict(zip(row_numbers[changed_positions].tolist(), hashes[changed_positions].tolist()))
+
+    failed = np.zeros(len(changed_positions), dtype=bool)
+    for batch in report.get('failed_batches', []):
+        failed[batch['first_row'] - 1:batch['first_row'] - 1 + batch['row_count']] = True
+    known = {row_hash: [] for row_hash in hashes[changed_positions[~failed]].tolist()}
+    for finding in report.get('findings', []):
+        row_hash = hash_by_row.get(finding_row(finding))
+        if row_hash in known:
+            known[row_hash].append({key: value for key, value in finding.items() if key != 'row'})
+
+    reused = []
+    for position in np.flatnonzero(~changed):
+        row_hash = int(hashes[position])
+        known[row_hash] = previous[row_hash]
+        reused.extend({'row': int(row_numbers[position]), **finding} for finding in previous[row_hash])
+
+    merged = dict(report)
+    merged['findings'] = sorted(report.get('findings', []) + reused,
+                                key=lambda finding: finding_row(finding) or 0)
+    merged['rows_total'] = len(bordereaux_df)
+    # Rows answered by the model this time, and rows whose findings were carried over unchanged
+    merged['rows_analysed'] = report.get('rows_analysed', 0)
+    merged['rows_reused'] = int((~changed).sum())
+    return merged, known
@@ -0,0 +1,253 @@
+import contextlib
+import contextvars
+import json
+import logging
+import os
+import resource
+import sys
+import threading
+import time
+from collections import defaultdict
+
+logger = logging.getLogger('claims')
+
+# ru_maxrss is reported in kilobytes on Linux and in bytes on macOS.
+RSS_UNIT = 1 if sys.platform == 'darwin' else 1024
+
+_current = contextvars.ContextVar('claims_stage', default=None)
+
+
+def peak_rss_bytes():
+    """High-water mark of this process's resident memory so far"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * RSS_UNIT
+
+
+class Registry:
+    """Process-wide totals per stage, rendered in the Prometheus text exposition format.
+
+    After share(directory) each process also keeps its totals in a file there, and render() reports the
+    sum over every process that wrote one, so pre-forked workers all serve the same /metrics.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.directory = None
+        self.reset()
+
+    def reset(self):
+        self.stage_runs = defaultdict(int)
+        self.stage_seconds = defaultdict(float)
+        self.stage_cpu_seconds = defaultdict(float)
+        self.stage_counters = defaultdict(float)
+        self.runs = defaultdict(int)
+
+    def share(self, directory):
+        """Sum totals over every process using directory; serve.py calls this before forking its workers.
+
+        Files left by an earlier server are removed. Workers that exit keep their file, so totals do
+        not drop when a worker is replaced. Forked children start from empty totals.
+        """
+        os.makedirs(directory, exist_ok=True)
+        for name in os.listdir(directory):
+            if name.endswith('.json'):
+                os.remove(os.path.join(directory, name))
+        self.directory = directory
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+        self.reset()
+        self._save()
+
+    def record_stage(self, stage):
+        with self._lock:
+            self.stage_runs[stage['name']] += 1
+            self.stage_seconds[stage['name']] += stage['wall_seconds']
+            self.stage_cpu_seconds[stage['name']] += stage['cpu_seconds']
+            for name, value in stage['counters'].items():
+                self.stage_counters[(stage['name'], name)] += value
+            self._save()
+
+    def record_run(self, status):
+        with self._lock:
+            self.runs[status] += 1
+            self._save()
+
+    def _totals(self):
+        return {
+            'pid': os.getpid(),
+            'peak_rss_bytes': peak_rss_bytes(),
+            'runs': dict(self.runs),
+            'stage_runs': dict(self.stage_runs),
+            'stage_seconds': dict(self.stage_seconds),
+            'stage_cpu_seconds': dict(self.stage_cpu_seconds),
+            'stage_counters': [[stage, name, value] for (stage, name), value in self.stage_counters.items()],
+        }
+
+    def _save(self):
+        if self.directory is None:
+            return
+        path = os.path.join(self.directory, f'{os.getpid()}.json')
+        with open(path + '.tmp', 'w', encoding='utf-8') as file:
+            json.dump(self._totals(), file)
+        os.replace(path + '.tmp', path)
+
+    def _all_totals(self):
+        """Totals of this process and of every other process sharing the directory"""
+        own = self._totals()
+        if self.directory is None:
+            return [own]
+        totals = [own]
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json') or name == f'{own["pid"]}.json':
+                continue
+            try:
+                with open(os.path.join(self.directory, name), 'r', encoding='utf-8') as file:
+                    totals.append(json.load(file))
+            except (OSError, ValueError) as e:
+                logger.warning('could not read metrics file %s: %s', name, e)
+        return totals
+
+    def render(self):
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in samples:
+                label_text = ','.join(f'{key}="{escape_label(label)}"' for key, label in labels)
+                lines.append(f'{name}{{{label_text}}} {value}' if label_text else f'{name} {value}')
+
+        with self._lock:
+            processes = self._all_totals()
+        runs, stage_runs = defaultdict(int), defaultdict(int)
+        stage_seconds, stage_cpu_seconds, stage_counters = defaultdict(float), defaultdict(float), defaultdict(float)
+        for process in processes:
+            for totals, merged in ((process['runs'], runs), (process['stage_runs'], stage_runs),
+                                   (process['stage_seconds'], stage_seconds),
+                                   (process['stage_cpu_seconds'], stage_cpu_seconds)):
+                for key, value in totals.items():
+                    merged[key] += value
+            for stage, name, value in process['stage_counters']:
+                stage_counters[(stage, name)] += value
+
+        metric('claims_runs_total', 'counter', 'Reconciliation runs by outcome.',
+               [((('status', status),), count) for status, count in sorted(runs.items())])
+        metric('claims_stage_runs_total', 'counter', 'Times each pipeline stage ran.',
+               [((('stage', stage),), count) for stage, count in sorted(stage_runs.items())])
+        metric('claims_stage_seconds_total', 'counter', 'Wall-clock seconds spent in each stage.',
+               [((('stage', stage),), round(value, 6)) for stage, value in sorted(stage_seconds.items())])
+        metric('claims_stage_cpu_seconds_total', 'counter', 'Process CPU seconds spent in each stage.',
+               [((('stage', stage),), round(value, 6)) for stage, value in sorted(stage_cpu_seconds.items())])
+        # Counters are whatever stages add(), e.g. rows, pages, characters, prompt_tokens, llm_calls
+        for counter in sorted({name for _, name in stage_counters}):
+            samples = [((('stage', stage),), value)
+                       for (stage, name), value in sorted(stage_counters.items()) if name == counter]
+            metric(f'claims_{counter}_total', 'counter', f'{counter.replace("_", " ").capitalize()} per stage.',
+                   samples)
+        # One sample per running process; another process's value is as of its last recorded stage
+        metric('claims_process_peak_rss_bytes', 'gauge', 'Peak resident memory of each running process.',
+               [((('pid', process['pid']),), process['peak_rss_bytes'])
+                for process in sorted(processes, key=lambda process: process['pid']) if running(process['pid'])])
+        return '\n'.join(lines) + '\n'
+
+
+def running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+registry = Registry()
+
+
+class Trace:
+    """Timing, memory and counters of every stage of one run, as a JSON-serializable record"""
+
+    def __init__(self, run_id=None, registry=registry):
+        self.run_id = run_id
+        self.registry = registry
+        self.started_at = time.time()
+        self.stages = []
+        self.status = 'running'
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Measure a block as a stage; counters added inside it, from any thread started with submit, go to it"""
+        parent = _current.get()
+        record = {
+            'name': name,
+            'parent': parent[1]['name'] if parent and parent[0] is self else None,
+            'started_at': time.time(),
+            'counters': defaultdict(float),
+        }
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        token = _current.set((self, record))
+        try:
+            yield record
+        finally:
+            _current.reset(token)
+            record['wall_seconds'] = round(time.perf_counter() - wall_start, 6)
+            record['cpu_seconds'] = round(time.process_time() - cpu_start, 6)
+            record['peak_rss_bytes'] = peak_rss_bytes()
+            record['counters'] = dict(record['counters'])
+            with self._lock:
+                self.stages.append(record)
+            self.registry.record_stage(record)
+            logger.info('stage %s took %.3fs (cpu %.3fs) %s', name, record['wall_seconds'], record['cpu_seconds'],
+                        record['counters'])
+
+    def finish(self, status):
+        self.status = status
+        self.registry.record_run(status)
+
+    def to_dict(self):
+        with self._lock:
+            stages = sorted(self.stages, key=lambda stage: stage['started_at'])
+        return {
+            'run_id': self.run_id,
+            'status': self.status,
+            'started_at': self.started_at,
+            'stages': stages,
+        }
+
+    def write(self, path):
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(self.to_dict(), file, indent=2)
+
+
+def add(**counters):
+    """Add to the counters of the innermost running stage; a no-op outside a traced run"""
+    current = _current.get()
+    if current is None:
+        return
+    trace, record = current
+    with trace._lock:
+        for name, value in counters.items():
+            record['counters'][name] += value
+
+
+def submit(executor, fn, *args, **kwargs):
+    """executor.submit that carries the current stage into the worker thread"""
+    return executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+@contextlib.contextmanager
+def stage(name):
+    """Stage of the current trace, or a plain block when nothing is being traced"""
+    current = _current.get()
+    if current is None:
+        yield None
+        return
+    with current[0].stage(name) as record:
+        yield record
@@ -0,0 +1,182 @@
+import json
+import os
+import shutil
+import sqlite3
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+
+import sqlite_store
+import uploads
+from pipeline import DEBUG_DUMP_DIR, ReconciliationPipeline, STAGES
+from report_store import ReportStore
+
+JOBS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'jobs')
+JOBS_DB = os.path.join(JOBS_DIR, 'jobs.sqlite3')
+MAX_JOB_WORKERS = int(os.environ.get('CLAIMS_JOB_WORKERS', '4'))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    stage TEXT,
+    stages_done INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    owner_pid INTEGER,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+)
+"""
+
+INPUT_NAMES = {'treaty': 'treaty.pdf', 'bordereaux': 'bordereaux.xlsx', 'statement': 'statement.pdf'}
+OPTIONS_NAME = 'options.json'
+
+
+REQUEUE = "UPDATE jobs SET status = 'queued', stage = NULL, stages_done = 0, owner_pid = NULL, updated_at = ? "
+
+
+def add_owner_column(conn):
+    """Job tables created before claims recorded the claiming process lack owner_pid"""
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(jobs)')}
+    if 'owner_pid' not in columns:
+        conn.execute('ALTER TABLE jobs ADD COLUMN owner_pid INTEGER')
+
+
+def requeue_interrupted(jobs_dir=JOBS_DIR, db_path=JOBS_DB):
+    """Put jobs left running by a server that stopped back in the queue"""
+    os.makedirs(jobs_dir, exist_ok=True)
+    with closing(sqlite_store.Database(db_path, SCHEMA).connect()) as conn, conn:
+        add_owner_column(conn)
+        conn.execute(REQUEUE + "WHERE status = 'running'", (time.time(),))
+
+
+def requeue_owned(pid, db_path=JOBS_DB):
+    """Put the jobs a process that died had claimed back in the queue; returns how many there were"""
+    with closing(sqlite_store.Database(db_path, SCHEMA).connect()) as conn, conn:
+        return conn.execute(REQUEUE + "WHERE status = 'running' AND owner_pid = ?", (time.time(), pid)).rowcount
+
+
+class JobQueue:
+    """Runs reconciliations on a local thread pool and tracks them in a SQLite job table.
+
+    Several queues, in several processes, may share one job table. Only one server process should
+    requeue interrupted jobs, since running jobs of the others look the same; serve.py does it before forking,
+    and requeues the jobs of a worker that dies (claim() records the claiming process) before replacing it.
+    """
+
+    def __init__(self, jobs_dir=JOBS_DIR, db_path=JOBS_DB, max_workers=MAX_JOB_WORKERS, requeue_running=True):
+        self.jobs_dir = jobs_dir
+        self.db_path = db_path
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        self.database = sqlite_store.Database(db_path, SCHEMA)
+        with closing(self._connect()) as conn, conn:
+            add_owner_column(conn)
+        if requeue_running:
+            requeue_interrupted(jobs_dir, db_path)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='reconcile')
+        self.resume_pending()
+
+    def _connect(self):
+        return self.database.connect()
+
+    def _update(self, job_id, **fields):
+        fields['updated_at'] = time.time()
+        assignments = ', '.join(f'{name} = ?' for name in fields)
+        with closing(self._connect()) as conn, conn:
+            conn.execute(f'UPDATE jobs SET {assignments} WHERE id = ?', (*fields.values(), job_id))
+
+    def job_dir(self, job_id):
+        return os.path.join(self.jobs_dir, job_id)
+
+    def report_path(self, job_id, kind):
+        """Path of the PDF report, or of the directory holding the paginated report sections"""
+        filename = 'report.pdf' if kind == 'pdf' else 'report'
+        return os.path.join(self.job_dir(job_id), filename)
+
+    def trace_path(self, job_id):
+        return os.path.join(self.job_dir(job_id), 'trace.json')
+
+    def report_store(self, job_id):
+        return ReportStore(self.report_path(job_id, 'sections'))
+
+    def submit(self, files, cedant=None):
+        """Store the uploaded files under a new job and queue it; returns the job id"""
+        job_id = uuid.uuid4().hex
+        job_dir = self.job_dir(job_id)
+        os.makedirs(job_dir)
+        # The request's workspace is removed when it ends, so the spooled uploads are moved into the job.
+        for name, filename in INPUT_NAMES.items():
+            uploads.save(files[name], os.path.join(job_dir, filename))
+        with open(os.path.join(job_dir, OPTIONS_NAME), 'w', encoding='utf-8') as file:
+            json.dump({'cedant': cedant}, file)
+
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            conn.execute('INSERT INTO jobs (id, status, created_at, updated_at) VALUES (?, ?, ?, ?)',
+                         (job_id, 'queued', now, now))
+        self.executor.submit(self.run, job_id)
+        return job_id
+
+    def resume_pending(self):
+        """Pick up queued jobs, e.g. those left by a previous server process; claim() keeps each to one worker"""
+        with closing(self._connect()) as conn:
+            rows = conn.execute("SELECT id FROM jobs WHERE status = 'queued'").fetchall()
+        for (job_id,) in rows:
+            self.executor.submit(self.run, job_id)
+
+    def options(self, job_id):
+        try:
+            with open(os.path.join(self.job_dir(job_id), OPTIONS_NAME), 'r', encoding='utf-8') as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {}
+
+    def claim(self, job_id):
+        """Mark a queued job as running in this process; False if another worker or process already took it"""
+        with closing(self._connect()) as conn, conn:
+            cursor = conn.execute("UPDATE jobs SET status = 'running', owner_pid = ?, updated_at = ? "
+                                  "WHERE id = ? AND status = 'queued'", (os.getpid(), time.time(), job_id))
+            return cursor.rowcount == 1
+
+    def run(self, job_id):
+        if not self.claim(job_id):
+            return
+        job_dir = self.job_dir(job_id)
+        paths = {name: os.path.join(job_dir, filename) for name, filename in INPUT_NAMES.items()}
+        options = self.options(job_id)
+        # Jobs run side by side, so each keeps its debug dumps in its own subdirectory
+        debug_dir = os.path.join(DEBUG_DUMP_DIR, job_id) if DEBUG_DUMP_DIR else None
+        reconciliation = ReconciliationPipeline(paths['treaty'], paths['bordereaux'], paths['statement'],
+                                                debug_dir=debug_dir, cedant=options.get('cedant'), run_id=job_id)
+
+        def progress(stage):
+            self._update(job_id, status='running', stage=stage, stages_done=STAGES.index(stage))
+
+        try:
+            _, pdf_buffer = reconciliation.run(progress)
+            sections, summary = reconciliation.report_sections()
+            self.report_store(job_id).write(sections, summary)
+            with open(self.report_path(job_id, 'pdf'), 'wb') as file, pdf_buffer:
+                shutil.copyfileobj(pdf_buffer, file)
+            self._update(job_id, status='done', stage=None, stages_done=len(STAGES))
+        except Exception as e:
+            print(f"Job {job_id} failed: {e}")
+            traceback.print_exc()
+            self._update(job_id, status='failed', error=str(e))
+        finally:
+            reconciliation.trace.write(self.trace_path(job_id))
+
+    def get(self, job_id):
+        """Status of a job as a JSON-serializable dict, or None if it does not exist"""
+        with closing(self._connect()) as conn:
+            conn.row_factory = sqlite3.Row
+            row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job.pop('owner_pid')
+        job['stages'] = list(STAGES)
+        job['progress'] = job.pop('stages_done') / len(STAGES)
+        return job
@@ -0,0 +1,313 @@
+import datetime
+import itertools
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+import bordereaux_store
+import reconciliation_index
+
+KEY_FIELD = 'Policy Holder ID'
+AMOUNT_TOLERANCE = 0.01
+# Above this many rows (both inputs together) the join spills key-hash partitions to disk.
+MAX_IN_MEMORY_ROWS = int(os.environ.get('CLAIMS_JOIN_MAX_ROWS', 2000000))
+PARTITIONS = 64
+CHUNK_ROWS = 200000
+
+JOIN_KEY = '__key__'
+KEY_VALUE = '__key_value__'
+OCCURRENCE = '__occurrence__'
+ROW = '__row__'
+BORDEREAUX_SUFFIX = '__bordereaux'
+STATEMENT_SUFFIX = '__statement'
+
+
+def column_label(name):
+    return ' '.join(str(name).split()).casefold()
+
+
+def normalized_value(value):
+    """Comparable form of a cell: trimmed case-folded text, whole floats as ints, dates as ISO days"""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    elif isinstance(value, datetime.datetime):
+        value = value.date().isoformat() if value.time() == datetime.time() else value.isoformat()
+    elif isinstance(value, datetime.date):
+        value = value.isoformat()
+    text = ' '.join(str(value).split()).casefold()
+    return text or None
+
+
+def display_value(value):
+    """A cell as reported: a Python scalar, whole floats as ints, blanks as None.
+
+    The outer join turns integer columns with unmatched rows into floats, and spilled partitions
+    come back from Parquet, so both join paths are reported through this one form.
+    """
+    if pd.api.types.is_scalar(value) and pd.isna(value):
+        return None
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, datetime.datetime) and not isinstance(value, pd.Timestamp):
+        return pd.Timestamp(value)
+    return value
+
+
+def normalized_column(column):
+    """normalized_value of every cell, computed once per distinct value; blanks become None"""
+    values = pd.Series(column).astype(object)
+    present = values.notna()
+    mapping = {value: normalized_value(value) for value in pd.unique(values[present])}
+    return values[present].map(mapping).reindex(values.index)
+
+
+def align_columns(statement_df, bordereaux_columns):
+    """Rename statement headers to the bordereaux column with the same label, ignoring case and spacing"""
+    labels = {column_label(name): name for name in bordereaux_columns}
+    renames = {name: labels[column_label(name)] for name in statement_df.columns
+               if column_label(name) in labels and name != labels[column_label(name)]}
+    return statement_df.rename(columns=renames) if renames else statement_df
+
+
+def compared_fields(bordereaux_columns, statement_columns, key):
+    """Columns present on both sides, in bordereaux order, except the join key"""
+    labels = {column_label(name) for name in statement_columns}
+    return [name for name in bordereaux_columns if name != key and column_label(name) in labels]
+
+
+def prepare(df, key, fields):
+    """Project a chunk onto the join key, its display value, the 1-based row number and the compared fields"""
+    prepared = pd.DataFrame({
+        JOIN_KEY: normalized_column(df[key]),
+        KEY_VALUE: df[key].astype(object),
+        ROW: np.asarray(df.index) + 1,
+    }, index=df.index)
+    for field in fields:
+        prepared[field] = df[field] if field in df.columns else None
+    # Records without a key cannot be matched to anything, e.g. sub-header and total rows.
+    return prepared[prepared[JOIN_KEY].notna()]
+
+
+def with_occurrence(prepared):
+    """Number repeated keys 0, 1, 2... so the nth bordereaux row pairs with the nth statement row"""
+    prepared = prepared.copy()
+    prepared[OCCURRENCE] = prepared.groupby(JOIN_KEY, sort=False).cumcount()
+    return prepared
+
+
+def numbers(values):
+    """Each cell as a float, NaN where it is blank, text or a date"""
+    if pd.api.types.is_datetime64_any_dtype(values.dtype) or pd.api.types.is_timedelta64_dtype(values.dtype):
+        return np.full(len(values), np.nan)
+    return pd.to_numeric(values, errors='coerce').to_numpy(dtype='float64')
+
+
+def cell_days(value):
+    """Day ordinals a cell can stand for, both readings of an ambiguous dd/mm date, or None if it is not a date"""
+    if isinstance(value, datetime.datetime):
+        return frozenset([value.date().toordinal()])
+    if isinstance(value, datetime.date):
+        return frozenset([value.toordinal()])
+    if isinstance(value, str):
+        return frozenset(reconciliation_index.cell_dates(value)) or None
+    return None
+
+
+def days(values):
+    """cell_days of every cell, computed once per distinct value; blanks and non-dates become None"""
+    values = pd.Series(values).astype(object)
+    present = values.notna()
+    mapping = {value: cell_days(value) for value in pd.unique(values[present])}
+    return values[present].map(mapping).reindex(values.index).to_numpy(dtype=object)
+
+
+def compare_field(bordereaux_values, statement_values, tolerance):
+    """Mismatch mask and statement-minus-bordereaux delta for one field, decided pair by pair.
+
+    Pairs of numbers match within tolerance and get a delta. Pairs of dates, whether typed or written
+    as text such as 05/01/2024 on a PDF statement, match when they can be the same day. Any other pair
+    is compared as normalized text. Deciding per pair keeps the outcome the same whichever rows share
+    a partition.
+    """
+    bordereaux_numbers = numbers(bordereaux_values)
+    statement_numbers = numbers(statement_values)
+    numeric = ~np.isnan(bordereaux_numbers) & ~np.isnan(statement_numbers)
+    delta = np.where(numeric, statement_numbers - bordereaux_numbers, np.nan)
+    with np.errstate(invalid='ignore'):
+        mismatch = np.abs(delta) > tolerance
+    text = ~numeric
+    if text.any():
+        bordereaux_days = days(bordereaux_values[text])
+        statement_days = days(statement_values[text])
+        dated = np.array([isinstance(bordereaux_day, frozenset) and isinstance(statement_day, frozenset)
+                          for bordereaux_day, statement_day in zip(bordereaux_days, statement_days)], dtype=bool)
+        bordereaux_text = normalized_column(bordereaux_values[text]).fillna('').to_numpy()
+        statement_text = normalized_column(statement_values[text]).fillna('').to_numpy()
+        text_mismatch = bordereaux_text != statement_text
+        text_mismatch[dated] = [not bordereaux_day & statement_day for bordereaux_day, statement_day
+                                in zip(bordereaux_days[dated], statement_days[dated])]
+        mismatch[text] = text_mismatch
+    return mismatch, delta
+
+
+def join_partition(bordereaux_part, statement_part, fields, tolerance):
+    """Hash-join one pair of prepared frames; returns (missing, extra, mismatched) frames"""
+    joined = pd.merge(with_occurrence(bordereaux_part), with_occurrence(statement_part),
+                      on=[JOIN_KEY, OCCURRENCE], how='outer', suffixes=(BORDEREAUX_SUFFIX, STATEMENT_SUFFIX),
+                      indicator=True, sort=False)
+    side = joined['_merge'].to_numpy()
+    missing = joined.loc[side == 'left_only', [KEY_VALUE + BORDEREAUX_SUFFIX, ROW + BORDEREAUX_SUFFIX]]
+    extra = joined.loc[side == 'right_only', [KEY_VALUE + STATEMENT_SUFFIX, ROW + STATEMENT_SUFFIX]]
+
+    both = joined[side == 'both']
+    mismatched = []
+    for field in fields:
+        bordereaux_values = both[field + BORDEREAUX_SUFFIX]
+        statement_values = both[field + STATEMENT_SUFFIX]
+        mask, delta = compare_field(bordereaux_values, statement_values, tolerance)
+        if mask.any():
+            mismatched.append(pd.DataFrame({
+                'key': both[KEY_VALUE + BORDEREAUX_SUFFIX].to_numpy()[mask],
+                'row': both[ROW + BORDEREAUX_SUFFIX].to_numpy()[mask],
+                'statement_row': both[ROW + STATEMENT_SUFFIX].to_numpy()[mask],
+                'field': field,
+                'field_order': fields.index(field),
+                'bordereaux': bordereaux_values.to_numpy(dtype=object)[mask],
+                'statement': statement_values.to_numpy(dtype=object)[mask],
+                'delta': delta[mask],
+            }))
+    missing.columns = ['key', 'row']
+    extra.columns = ['key', 'row']
+    mismatched = pd.concat(mismatched, ignore_index=True) if mismatched else None
+    return missing, extra, mismatched
+
+
+def build_report(key, results):
+    """Materialize the report dicts from per-partition result frames, ordered by row number"""
+    missing = pd.concat([result[0] for result in results], ignore_index=True).sort_values('row', kind='stable')
+    extra = pd.concat([result[1] for result in results], ignore_index=True).sort_values('row', kind='stable')
+    mismatched = [result[2] for result in results if result[2] is not None]
+    report = {
+        'Missing From Statement': [
+            {'Policy Holder ID': value, 'Issue': f'No statement record for {key} {value} (Row {row})'}
+            for value, row in zip(map(display_value, missing['key']), missing['row'].astype('int64'))
+        ],
+        'Not In Bordereaux': [
+            {'Policy Holder ID': value, 'Issue': f'Statement record for {key} {value} not in bordereaux '
+                                                 f'(Statement row {row})'}
+            for value, row in zip(map(display_value, extra['key']), extra['row'].astype('int64'))
+        ],
+        'Mismatched Records': [],
+    }
+    if mismatched:
+        mismatched = pd.concat(mismatched, ignore_index=True).sort_values(['row', 'field_order'], kind='stable')
+        for record in mismatched.itertuples(index=False):
+            bordereaux_value = display_value(record.bordereaux)
+            statement_value = display_value(record.statement)
+            discrepancy = {
+                'Policy Holder ID': display_value(record.key),
+                'Field': record.field,
+                'Bordereaux Value': bordereaux_value,
+                'Statement Value': statement_value,
+            }
+            issue = f'{record.field} is {bordereaux_value} in bordereaux but {statement_value} in statement'
+            if not np.isnan(record.delta):
+                discrepancy['Delta'] = record.delta
+                issue += f' (delta {record.delta:,.2f})'
+            discrepancy['Issue'] = f'{issue} (Row {int(record.row)}, statement row {int(record.statement_row)})'
+            report['Mismatched Records'].append(discrepancy)
+    return report
+
+
+def reconcile_frames(bordereaux_df, statement_df, key=KEY_FIELD, fields=None, tolerance=AMOUNT_TOLERANCE):
+    """In-memory keyed reconciliation of a bordereaux against a statement table"""
+    statement_df = align_columns(statement_df, bordereaux_df.columns)
+    if fields is None:
+        fields = compared_fields(bordereaux_df.columns, statement_df.columns, key)
+    fields = list(fields)
+    result = join_partition(prepare(bordereaux_df, key, fields), prepare(statement_df, key, fields),
+                            fields, tolerance)
+    return build_report(key, [result])
+
+
+def as_chunks(data, chunk_rows=CHUNK_ROWS):
+    if isinstance(data, pd.DataFrame):
+        return (data.iloc[start:start + chunk_rows] for start in range(0, max(len(data), 1), chunk_rows))
+    return iter(data)
+
+
+def spill(chunks, key, fields, directory, side, partitions, align_to=None):
+    """Write each chunk's prepared rows to per-partition Parquet files, bucketed by key hash"""
+    for number, chunk in enumerate(chunks):
+        if align_to is not None:
+            chunk = align_columns(chunk, align_to)
+        prepared = prepare(chunk, key, fields)
+        buckets = pd.util.hash_array(prepared[JOIN_KEY].to_numpy(dtype=object)) % partitions
+        for partition in np.unique(buckets):
+            bordereaux_store.save(f'{side}-{number:06d}', prepared[buckets == partition],
+                                  store_dir=os.path.join(directory, f'{partition:04d}'))
+
+
+def load_partition(directory, side):
+    """Concatenate one side of a partition in chunk order, so repeated keys keep their file order"""
+    if not os.path.isdir(directory):
+        return None
+    names = sorted(name for name in bordereaux_store.stored_keys(directory) if name.startswith(f'{side}-'))
+    if not names:
+        return None
+    return pd.concat([bordereaux_store.load(name, store_dir=directory) for name in names])
+
+
+def reconcile_partitioned(bordereaux_chunks, statement_chunks, key=KEY_FIELD, fields=None,
+                          tolerance=AMOUNT_TOLERANCE, partitions=PARTITIONS, work_dir=None):
+    """Out-of-core keyed reconciliation: spill both inputs to key-hash partitions, then join each pair.
+
+    Every key lands in exactly one partition, so only one partition pair is in memory at a time.
+    """
+    bordereaux_chunks = iter(bordereaux_chunks)
+    statement_chunks = iter(statement_chunks)
+    first_bordereaux = next(bordereaux_chunks)
+    first_statement = align_columns(next(statement_chunks), first_bordereaux.columns)
+    if fields is None:
+        fields = compared_fields(first_bordereaux.columns, first_statement.columns, key)
+    fields = list(fields)
+
+    directory = tempfile.mkdtemp(prefix='reconcile-', dir=work_dir)
+    try:
+        spill(itertools.chain([first_bordereaux], bordereaux_chunks), key, fields, directory, 'b', partitions)
+        spill(itertools.chain([first_statement], statement_chunks), key, fields, directory, 's', partitions,
+              align_to=first_bordereaux.columns)
+        empty = prepare(first_bordereaux.iloc[:0], key, fields)
+        results = []
+        for partition in range(partitions):
+            partition_dir = os.path.join(directory, f'{partition:04d}')
+            bordereaux_part = load_partition(partition_dir, 'b')
+            statement_part = load_partition(partition_dir, 's')
+            if bordereaux_part is None and statement_part is None:
+                continue
+            results.append(join_partition(empty if bordereaux_part is None else bordereaux_part,
+                                          empty if statement_part is None else statement_part,
+                                          fields, tolerance))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    if not results:
+        results.append(join_partition(empty, empty, fields, tolerance))
+    return build_report(key, results)
+
+
+def reconcile(bordereaux, statement, key=KEY_FIELD, fields=None, tolerance=AMOUNT_TOLERANCE,
+              max_rows=MAX_IN_MEMORY_ROWS, partitions=PARTITIONS):
+    """Hash-join bordereaux and statement records on key and report missing, extra and mismatched records.
+
+    Either input may be a DataFrame or an iterable of DataFrame chunks (e.g. excel_ingest.iter_chunks);
+    inputs that are chunked or larger than max_rows are reconciled out of core.
+    """
+    if isinstance(bordereaux, pd.DataFrame) and isinstance(statement, pd.DataFrame) and \
+            len(bordereaux) + len(statement) <= max_rows:
+        return reconcile_frames(bordereaux, statement, key, fields, tolerance)
+    return reconcile_partitioned(as_chunks(bordereaux), as_chunks(statement), key, fields, tolerance, partitions)
@@ -0,0 +1,101 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import closing
+
+import sqlite_store
+
+CACHE_DB = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'llm_responses.sqlite3')
+CACHE_MAX_BYTES = 256 * 1024 * 1024
+# Set CLAIMS_LLM_CACHE_BYPASS=1 to always call the API (responses are still stored).
+BYPASS = os.environ.get('CLAIMS_LLM_CACHE_BYPASS', '').lower() in ('1', 'true', 'yes')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    namespace TEXT NOT NULL,
+    response TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL
+)
+"""
+
+
+def cache_key(model, temperature, max_tokens, system_message, prompt):
+    """Content address of a completion request"""
+    prompt_hash = hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+    request = json.dumps([model, temperature, max_tokens, system_message, prompt_hash])
+    return hashlib.sha256(request.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """SQLite-backed store of model responses with size-based least-recently-used eviction.
+
+    Entries are grouped by namespace (e.g. treaty summaries vs. discrepancy analyses)
+    so hit/miss metrics can be reported per kind of call.
+    """
+
+    def __init__(self, db_path=CACHE_DB, max_bytes=CACHE_MAX_BYTES):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.hits = Counter()
+        self.misses = Counter()
+        self._lock = threading.Lock()
+        self.database = sqlite_store.Database(db_path, SCHEMA)
+
+    def _connect(self):
+        return self.database.connect()
+
+    def get(self, key, namespace='default'):
+        with closing(self._connect()) as conn, conn:
+            row = conn.execute('SELECT response FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is not None:
+                conn.execute('UPDATE responses SET last_used = ? WHERE key = ?', (time.time(), key))
+        with self._lock:
+            if row is None:
+                self.misses[namespace] += 1
+                return None
+            self.hits[namespace] += 1
+        return row[0]
+
+    def put(self, key, response, namespace='default'):
+        size = len(response.encode('utf-8'))
+        with closing(self._connect()) as conn, conn:
+            conn.execute('INSERT OR REPLACE INTO responses (key, namespace, response, size, last_used) '
+                         'VALUES (?, ?, ?, ?, ?)', (key, namespace, response, size, time.time()))
+            self._evict(conn)
+
+    def _evict(self, conn):
+        total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        stale = []
+        for key, size in conn.execute('SELECT key, size FROM responses ORDER BY last_used'):
+            if total <= self.max_bytes:
+                break
+            stale.append((key,))
+            total -= size
+        conn.executemany('DELETE FROM responses WHERE key = ?', stale)
+
+    def metrics(self):
+        """Hit/miss counts per namespace plus the current size of the store"""
+        with closing(self._connect()) as conn:
+            rows = conn.execute('SELECT namespace, COUNT(*), COALESCE(SUM(size), 0) '
+                                'FROM responses GROUP BY namespace').fetchall()
+        stored = {namespace: {'entries': entries, 'bytes': size} for namespace, entries, size in rows}
+        with self._lock:
+            namespaces = set(self.hits) | set(self.misses) | set(stored)
+            return {
+                namespace: {
+                    'hits': self.hits[namespace],
+                    'misses': self.misses[namespace],
+                    **stored.get(namespace, {'entries': 0, 'bytes': 0}),
+                }
+                for namespace in sorted(namespaces)
+            }
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,162 @@
+import bisect
+
+import numpy as np
+import pandas as pd
+
+from reconciliation_index import MIN_MATCH_SCORE, ReconciliationIndex
+
+# Above this many distinct values that are not whole tokens, sorting the token suffixes once is cheaper
+# than scanning the whole text for each value.
+SCAN_MAX_VALUES = 64
+
+
+class TextValueIndex:
+    """Hashed index over the tokens of a document for fast "value appears in text" checks"""
+
+    def __init__(self, text):
+        self.text = text or ''
+        # Whitespace tokens are substrings of the text, so a token hit is always a real hit.
+        self.tokens = frozenset(self.text.split())
+        self._lookups = {}
+        self._suffixes = None
+
+    def suffixes(self):
+        """Sorted distinct suffixes of the tokens, built on first use; every substring of a token prefixes one"""
+        if self._suffixes is None:
+            self._suffixes = sorted({token[start:] for token in self.tokens for start in range(1, len(token))}
+                                    | self.tokens)
+        return self._suffixes
+
+    def in_token(self, value):
+        """True if value is a substring of some token, by binary search over the token suffixes"""
+        suffixes = self.suffixes()
+        position = bisect.bisect_left(suffixes, value)
+        return position < len(suffixes) and suffixes[position].startswith(value)
+
+    def contains(self, value):
+        """Return True if value appears anywhere in the indexed text"""
+        if value in self.tokens:
+            return True
+        found = self._lookups.get(value)
+        if found is None:
+            found = self._search(value)
+            self._lookups[value] = found
+        return found
+
+    def _search(self, value):
+        if self._suffixes is None:
+            return value in self.text
+        parts = value.split()
+        if len(parts) == 1 and parts[0] == value:
+            # Without whitespace a value can only occur inside a single token.
+            return self.in_token(value)
+        # Values spanning tokens are confirmed in the text only when every piece occurs in some token.
+        return all(self.in_token(part) for part in parts) and value in self.text
+
+    def missing_mask(self, values):
+        """Boolean mask of the string values that do not appear in the text"""
+        values = pd.Series(values)
+        found = values.isin(self.tokens).to_numpy(dtype=bool)
+        # Only distinct values that are not whole tokens need a substring search.
+        remaining = pd.unique(values[~found])
+        if len(remaining) > SCAN_MAX_VALUES:
+            self.suffixes()
+        if len(remaining):
+            hits = [value for value in remaining if self.contains(value)]
+            if hits:
+                found = found | values.isin(hits).to_numpy(dtype=bool)
+        return ~found
+
+
+def column_as_text(bordereaux_df, field):
+    """Render a column the same way str(row[field]) does for each row"""
+    return bordereaux_df[field].astype(object).map(str)
+
+
+def policy_holder_ids(bordereaux_df):
+    """Policy Holder ID column, or 'Unknown' when the bordereaux has none"""
+    if 'Policy Holder ID' in bordereaux_df.columns:
+        return bordereaux_df['Policy Holder ID'].to_numpy(dtype=object)
+    return np.full(len(bordereaux_df), 'Unknown', dtype=object)
+
+
+def build_discrepancies(bordereaux_df, field, values, mask, source, scores=None):
+    """Materialize discrepancy dicts for the flagged rows of a single field"""
+    if not mask.any():
+        return []
+    ids = policy_holder_ids(bordereaux_df)[mask]
+    row_numbers = bordereaux_df.index.to_numpy()[mask]
+    flagged_values = values.to_numpy(dtype=object)[mask]
+    discrepancies = [
+        {
+            'Policy Holder ID': policy_id,
+            'Field': field,
+            'Value': value,
+            'Issue': f'{value} not found in {source} under field {field} (Row {index+1})'
+        }
+        for policy_id, value, index in zip(ids, flagged_values, row_numbers)
+    ]
+    if scores is not None:
+        for discrepancy, score in zip(discrepancies, scores[mask]):
+            discrepancy['Match Score'] = round(float(score), 2)
+    return discrepancies
+
+
+def order_by_row(discrepancies_by_field, common_fields):
+    """Interleave per-field discrepancies back into row-major order, as iterrows produced them"""
+    items = []
+    row_positions = []
+    for field in common_fields:
+        field_items, field_rows = discrepancies_by_field.get(field, ([], []))
+        items.extend(field_items)
+        row_positions.extend(field_rows)
+    # A stable sort on row position keeps fields in common_fields order within a row.
+    order = np.argsort(np.asarray(row_positions, dtype=np.int64), kind='stable')
+    return [items[i] for i in order]
+
+
+def field_mask(index, bordereaux_df, field, values):
+    """Missing-value mask for one field, plus match scores when the index is tolerant"""
+    if isinstance(index, ReconciliationIndex):
+        scores = index.scores(bordereaux_df[field])
+        return scores < MIN_MATCH_SCORE, scores
+    return index.missing_mask(values), None
+
+
+def find_discrepancies(bordereaux_df, statement_text, treaty_text, common_fields, tolerant=False):
+    """Run the statement, treaty and premium comparisons in one columnar pass.
+
+    Pass None for either text to skip the comparisons against that document. With tolerant=True,
+    values are matched after normalization (1500.0 matches "1,500.00", dates match in any common
+    format) and each discrepancy carries a 'Match Score'.
+    """
+    index_type = ReconciliationIndex if tolerant else TextValueIndex
+    statement_index = index_type(statement_text) if statement_text is not None else None
+    treaty_index = index_type(treaty_text) if treaty_text is not None else None
+    row_positions = np.arange(len(bordereaux_df))
+
+    statement_by_field = {}
+    treaty_by_field = {}
+    premium_by_field = {}
+    for field in common_fields:
+        values = column_as_text(bordereaux_df, field)
+
+        if statement_index is not None:
+            statement_mask, scores = field_mask(statement_index, bordereaux_df, field, values)
+            statement_items = build_discrepancies(bordereaux_df, field, values, statement_mask, 'statement', scores)
+            statement_by_field[field] = (statement_items, row_positions[statement_mask])
+            if 'Premium' in field:
+                # Premium checks are the statement check restricted to premium fields; reuse the mask.
+                premium_items = [dict(item) for item in statement_items]
+                premium_by_field[field] = (premium_items, row_positions[statement_mask])
+
+        if treaty_index is not None:
+            treaty_mask, scores = field_mask(treaty_index, bordereaux_df, field, values)
+            treaty_items = build_discrepancies(bordereaux_df, field, values, treaty_mask, 'treaty', scores)
+            treaty_by_field[field] = (treaty_items, row_positions[treaty_mask])
+
+    return {
+        'statement': order_by_row(statement_by_field, common_fields),
+        'treaty': order_by_row(treaty_by_field, common_fields),
+        'premium': order_by_row(premium_by_field, common_fields),
+    }
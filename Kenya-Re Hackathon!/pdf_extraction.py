@@ -0,0 +1,158 @@
+import atexit
+import hashlib
+import io
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pdfplumber
+
+import instrumentation
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'pdf_text')
+CACHE_MAX_BYTES = 512 * 1024 * 1024
+PAGES_PER_TASK = 20
+# Small documents are cheaper to parse inline than to ship to a worker process.
+PARALLEL_MIN_PAGES = 40
+MAX_WORKERS = os.cpu_count() or 1
+# The pool is started from job threads, possibly in a forked server worker. Forking a threaded process
+# can copy a lock another thread holds, so pool processes come from a clean forkserver instead.
+START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+_pool = None
+
+
+def read_pdf_bytes(file):
+    """Read the raw bytes of an uploaded file, file-like object or path"""
+    if isinstance(file, (bytes, bytearray)):
+        return bytes(file)
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, 'rb') as handle:
+            return handle.read()
+    if hasattr(file, 'seek'):
+        file.seek(0)
+    data = file.read()
+    # Leave uploads rewound so later readers see the whole file.
+    if hasattr(file, 'seek'):
+        file.seek(0)
+    return data
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+class TextCache:
+    """On-disk store of extracted text keyed by content hash, evicted least recently used first"""
+
+    def __init__(self, directory=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def _path(self, key):
+        return os.path.join(self.directory, f'{key}.txt')
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as file:
+                text = file.read()
+        except FileNotFoundError:
+            return None
+        # The file mtime doubles as the last-used timestamp for LRU eviction.
+        os.utime(path, None)
+        return text
+
+    def put(self, key, text):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            file.write(text)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def evict(self):
+        """Drop least recently used entries until the store fits in max_bytes"""
+        entries = []
+        total = 0
+        with os.scandir(self.directory) as scan:
+            for entry in scan:
+                if not entry.name.endswith('.txt'):
+                    continue
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+_cache = TextCache()
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=MAX_WORKERS,
+                                    mp_context=multiprocessing.get_context(START_METHOD))
+        atexit.register(_pool.shutdown, wait=False)
+    return _pool
+
+
+def extract_page_range(data, start, stop):
+    """Extract the text of pages [start, stop) as a list of per-page strings"""
+    with pdfplumber.open(io.BytesIO(data)) as pdf:
+        return [page.extract_text() or '' for page in pdf.pages[start:stop]]
+
+
+def extract_pages(data, extract_range=extract_page_range):
+    """Extract per-page results, fanning page ranges out to the process pool for long documents.
+
+    extract_range(data, start, stop) returns one result per page and must be a module-level
+    function so worker processes can unpickle it.
+    """
+    with pdfplumber.open(io.BytesIO(data)) as pdf:
+        total_pages = len(pdf.pages)
+    if total_pages < PARALLEL_MIN_PAGES or MAX_WORKERS < 2:
+        return extract_range(data, 0, total_pages)
+
+    ranges = [(start, min(start + PAGES_PER_TASK, total_pages))
+              for start in range(0, total_pages, PAGES_PER_TASK)]
+    try:
+        pool = get_pool()
+        futures = [pool.submit(extract_range, data, start, stop) for start, stop in ranges]
+        pages = []
+        for future in futures:
+            pages.extend(future.result())
+        return pages
+    except Exception as e:
+        print(f"Parallel PDF extraction failed, falling back to a single process: {e}")
+        return extract_range(data, 0, total_pages)
+
+
+def extract_text(file, use_cache=True):
+    """Extract the text of a PDF, reusing a cached copy when the same bytes were seen before"""
+    data = read_pdf_bytes(file)
+    key = content_hash(data)
+    if use_cache:
+        cached = _cache.get(key)
+        if cached is not None:
+            instrumentation.add(characters=len(cached))
+            return cached
+
+    pages = extract_pages(data)
+    text = ''.join(pages)
+    instrumentation.add(pages=len(pages), characters=len(text))
+    if use_cache:
+        try:
+            _cache.put(key, text)
+        except OSError as e:
+            print(f"Could not write PDF text cache: {e}")
+    return text
@@ -0,0 +1,280 @@
+import functools
+import itertools
+import tempfile
+import zlib
+
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfbase.pdfmetrics import stringWidth
+
+FONT = 'Helvetica'
+BOLD_FONT = 'Helvetica-Bold'
+# Resource names of the two standard fonts in every page's content stream
+FONT_NAMES = {FONT: 'F1', BOLD_FONT: 'F2'}
+FONT_SIZE = 9
+LINE_HEIGHT = 11
+MARGIN = 50
+CELL_PADDING = 4
+# Object numbers reserved up front; the page tree is written last, once all its kids are known.
+CATALOG_OBJECT, PAGES_OBJECT, FONT_OBJECT, BOLD_FONT_OBJECT = 1, 2, 3, 4
+REPORT_COLUMNS = ('Policy Holder ID', 'Issue')
+REPORT_WIDTHS = (0.3, 0.7)
+
+
+def pdf_string(text):
+    """Text as a PDF literal string in the standard fonts' WinAnsi encoding"""
+    data = str(text).encode('cp1252', errors='replace')
+    return b'(' + data.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)') + b')'
+
+
+@functools.lru_cache(maxsize=None)
+def char_width(char, font):
+    """Width of one character at size 1, cached so wrapping does not re-measure every string"""
+    return stringWidth(char, font, 1)
+
+
+def load_font_metrics():
+    """Measure the printable ASCII characters of both fonts up front, e.g. before forking workers"""
+    for font in FONT_NAMES:
+        for code in range(32, 127):
+            char_width(chr(code), font)
+
+
+def text_width(text, font, size):
+    return sum(char_width(char, font) for char in text) * size
+
+
+def split_word(word, font, size, width):
+    """Break a word wider than a line into pieces that each fit"""
+    pieces = []
+    piece = ''
+    piece_width = 0
+    for char in word:
+        char_size = char_width(char, font) * size
+        if piece and piece_width + char_size > width:
+            pieces.append(piece)
+            piece, piece_width = '', 0
+        piece += char
+        piece_width += char_size
+    pieces.append(piece)
+    return pieces
+
+
+def wrap(text, font, size, width):
+    """Greedily split text into lines no wider than width, breaking words wider than a whole line"""
+    lines = []
+    space = char_width(' ', font) * size
+    for paragraph in str(text).split('\n'):
+        line = []
+        line_width = 0
+        for word in paragraph.split():
+            word_width = text_width(word, font, size)
+            if word_width > width:
+                pieces = split_word(word, font, size, width)
+                if line:
+                    lines.append(' '.join(line))
+                lines.extend(pieces[:-1])
+                line, line_width = [pieces[-1]], text_width(pieces[-1], font, size)
+            elif line and line_width + space + word_width > width:
+                lines.append(' '.join(line))
+                line, line_width = [word], word_width
+            else:
+                line_width += word_width + (space if line else 0)
+                line.append(word)
+        lines.append(' '.join(line))
+    return lines
+
+
+class StreamingPdfWriter:
+    """Lays out text, headings and tables page by page and writes each page as soon as it is full.
+
+    Only the current page and the byte offsets of written objects are kept in memory, so the
+    memory use does not grow with the length of the report. Output is any binary writable file.
+    """
+
+    def __init__(self, file, title=None, pagesize=letter, margin=MARGIN, font_size=FONT_SIZE,
+                 line_height=LINE_HEIGHT):
+        self.file = file
+        self.width, self.height = pagesize
+        self.margin = margin
+        self.font_size = font_size
+        self.line_height = line_height
+        self.offsets = {}
+        self.position = 0
+        self.next_object = BOLD_FONT_OBJECT + 1
+        self.pages = []
+        self.commands = []
+        self.y = None
+        self.closed = False
+        self.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+        self.write_object(FONT_OBJECT, b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica '
+                                       b'/Encoding /WinAnsiEncoding >>')
+        self.write_object(BOLD_FONT_OBJECT, b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold '
+                                            b'/Encoding /WinAnsiEncoding >>')
+        self.new_page()
+        if title:
+            self.text_line(title, font=BOLD_FONT, size=self.font_size + 5, height=self.line_height * 2)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, data):
+        self.file.write(data)
+        self.position += len(data)
+
+    def write_object(self, number, body):
+        self.offsets[number] = self.position
+        self.write(b'%d 0 obj\n' % number + body + b'\nendobj\n')
+
+    def allocate(self):
+        number = self.next_object
+        self.next_object += 1
+        return number
+
+    @property
+    def content_width(self):
+        return self.width - 2 * self.margin
+
+    def new_page(self):
+        if self.y is not None:
+            self.flush_page()
+        self.commands = []
+        self.y = self.height - self.margin
+
+    def flush_page(self):
+        """Write the finished page and its content stream to the output"""
+        footer = f'Page {len(self.pages) + 1}'
+        self.draw(footer, self.width - self.margin - stringWidth(footer, FONT, self.font_size - 1),
+                  self.margin / 2, size=self.font_size - 1)
+        content = zlib.compress(b'\n'.join(self.commands))
+        content_object = self.allocate()
+        self.write_object(content_object, b'<< /Length %d /Filter /FlateDecode >>\nstream\n' % len(content) +
+                          content + b'\nendstream')
+        page_object = self.allocate()
+        self.write_object(page_object, (
+            '<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %.2f %.2f] /Contents %d 0 R '
+            '/Resources << /Font << /F1 %d 0 R /F2 %d 0 R >> >> >>'
+            % (PAGES_OBJECT, self.width, self.height, content_object, FONT_OBJECT, BOLD_FONT_OBJECT)
+        ).encode())
+        self.pages.append(page_object)
+        self.commands = []
+        if hasattr(self.file, 'flush'):
+            self.file.flush()
+
+    def draw(self, text, x, y, font=FONT, size=None):
+        size = size or self.font_size
+        self.commands.append(b'BT /%s %.1f Tf %.2f %.2f Td %s Tj ET'
+                             % (FONT_NAMES[font].encode(), size, x, y, pdf_string(text)))
+
+    def line(self, x1, y1, x2, y2):
+        self.commands.append(b'%.2f %.2f m %.2f %.2f l S' % (x1, y1, x2, y2))
+
+    def ensure_space(self, height):
+        """Start a new page unless height points still fit above the bottom margin; True if it did"""
+        if self.y - height < self.margin:
+            self.new_page()
+            return True
+        return False
+
+    def text_line(self, text, font=FONT, size=None, height=None):
+        height = height or self.line_height
+        self.ensure_space(height)
+        self.y -= height
+        self.draw(text, self.margin, self.y, font, size)
+
+    def heading(self, text):
+        self.ensure_space(self.line_height * 4)
+        self.y -= self.line_height / 2
+        self.text_line(text, font=BOLD_FONT, size=self.font_size + 2, height=self.line_height * 1.5)
+
+    def paragraph(self, text):
+        for line in wrap(text, FONT, self.font_size, self.content_width):
+            self.text_line(line)
+
+    def table_row(self, cells, widths, font=FONT, header=None):
+        """Draw one row of wrapped cells, continuing it on a new page (under the header) if it runs over"""
+        wrapped = [wrap('' if cell is None else cell, font, self.font_size, width - 2 * CELL_PADDING)
+                   for cell, width in zip(cells, widths)]
+        total = max(len(lines) for lines in wrapped)
+        drawn = 0
+        while drawn < total:
+            fit = int((self.y - self.margin - CELL_PADDING) // self.line_height)
+            if fit <= 0:
+                self.new_page()
+                if header:
+                    self.table_row(header, widths, BOLD_FONT)
+                continue
+            count = min(fit, total - drawn)
+            x = self.margin
+            for lines, width in zip(wrapped, widths):
+                for offset, text in enumerate(lines[drawn:drawn + count]):
+                    self.draw(text, x + CELL_PADDING, self.y - (offset + 1) * self.line_height, font)
+                x += width
+            self.y -= count * self.line_height + CELL_PADDING
+            self.line(self.margin, self.y, self.margin + sum(widths), self.y)
+            drawn += count
+
+    def table(self, columns, rows, widths=None):
+        """Draw a table from an iterable of rows, repeating the header row on every page"""
+        widths = [self.content_width * share for share in (widths or [1 / len(columns)] * len(columns))]
+        self.ensure_space(self.line_height * 3)
+        self.table_row(columns, widths, BOLD_FONT)
+        for row in rows:
+            self.table_row(row, widths, header=columns)
+
+    def close(self):
+        """Write the last page, page tree, catalog and cross-reference table"""
+        if self.closed:
+            return
+        self.closed = True
+        self.flush_page()
+        kids = b' '.join(b'%d 0 R' % page for page in self.pages)
+        self.write_object(PAGES_OBJECT, b'<< /Type /Pages /Kids [%s] /Count %d >>' % (kids, len(self.pages)))
+        self.write_object(CATALOG_OBJECT, b'<< /Type /Catalog /Pages %d 0 R >>' % PAGES_OBJECT)
+        xref_position = self.position
+        count = self.next_object
+        entries = [b'0000000000 65535 f \n'] + [b'%010d 00000 n \n' % self.offsets[number]
+                                                for number in range(1, count)]
+        self.write(b'xref\n0 %d\n' % count + b''.join(entries))
+        self.write(b'trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n'
+                   % (count, CATALOG_OBJECT, xref_position))
+        if hasattr(self.file, 'flush'):
+            self.file.flush()
+
+
+def write_report(file, sections, title='Discrepancy Report'):
+    """Write (category, discrepancies) sections to file; discrepancies may be any iterable or generator"""
+    with StreamingPdfWriter(file, title) as writer:
+        empty = True
+        for category, discrepancies in sections:
+            rows = iter(discrepancies)
+            first = next(rows, None)
+            if first is None:
+                continue
+            empty = False
+            writer.heading(f'{category}:')
+            writer.table(REPORT_COLUMNS, ([item.get(column, '') for column in REPORT_COLUMNS]
+                                          for item in itertools.chain([first], rows)), REPORT_WIDTHS)
+        if empty:
+            writer.paragraph('No discrepancies found.')
+
+
+def report_file(sections, title='Discrepancy Report'):
+    """Write a report to an anonymous temporary file on disk and return it rewound for reading"""
+    file = tempfile.TemporaryFile()
+    write_report(file, sections, title)
+    file.seek(0)
+    return file
+
+
+def write_text(text, path):
+    with open(path, 'wb') as file, StreamingPdfWriter(file) as writer:
+        writer.paragraph(text)
+
+
+def write_rows(columns, rows, path, title=None):
+    """Write a table of rows (e.g. from csv.reader) to a PDF at path"""
+    with open(path, 'wb') as file, StreamingPdfWriter(file, title) as writer:
+        writer.table(columns, rows)
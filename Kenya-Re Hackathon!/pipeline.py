@@ -0,0 +1,225 @@
+import json
+import os
+
+import AI_Integration
+import analysis
+import bordereaux_store
+import claims_index
+import clause_index
+import incremental
+import instrumentation
+import keyed_reconciliation
+import matching
+import pdf_extraction
+import rules
+import statement_tables
+
+# Set CLAIMS_DEBUG_DIR to keep the intermediate text/Excel/CSV files for inspection.
+DEBUG_DUMP_DIR = os.environ.get('CLAIMS_DEBUG_DIR')
+
+# Stages reported to run(progress=...), in execution order.
+STAGES = ('parse', 'ai', 'rules', 'report')
+# Clause search used to cite the treaty terms behind fraud flags
+FRAUD_CLAUSE_QUERY = 'claim claims amount premium benefit limit fraud fraudulent'
+
+
+class ReconciliationPipeline:
+    """Parses the uploaded treaty, bordereaux and statement once and runs every stage on the shared objects"""
+
+    def __init__(self, treaty_file, bordereaux_file, statement_file=None, debug_dir=DEBUG_DUMP_DIR,
+                 bordereaux_columns=None, reconciliation_key=keyed_reconciliation.KEY_FIELD, cedant=None,
+                 incremental_analysis=incremental.ENABLED, run_id=None):
+        self.treaty_file = treaty_file
+        self.bordereaux_file = bordereaux_file
+        # Load only these bordereaux columns from the columnar store (None loads all of them)
+        self.bordereaux_columns = bordereaux_columns
+        self.statement_file = statement_file
+        self.debug_dir = debug_dir
+        # Column the bordereaux and statement tables are joined on for record-level reconciliation
+        self.reconciliation_key = reconciliation_key
+        # Rows already analysed in the last submission for this cedant and treaty reuse their findings
+        self.cedant = cedant
+        self.incremental_analysis = incremental_analysis
+        self.treaty_text = None
+        self.treaty_hash = None
+        # BM25 index of the treaty's clauses; batches and treaty flags are matched against it
+        self.clause_index = None
+        self.statement_text = None
+        # Statement of account table (one row per policy) when the PDF has detectable tables
+        self.statement_df = None
+        self.bordereaux_df = None
+        self.bordereaux_key = None
+        self.ai_report = None
+        self.report = None
+        self.parsed = False
+        # Wall time, CPU, memory, rows, pages and tokens of every stage of this run
+        self.trace = instrumentation.Trace(run_id)
+
+    def parse(self):
+        """Parse each input file exactly once; later stages only see the in-memory results"""
+        if self.parsed:
+            return self
+        with self.trace.stage('parse'):
+            with self.trace.stage('parse.treaty'):
+                # Read once: the same bytes are hashed for the submission lineage and extracted
+                treaty_bytes = pdf_extraction.read_pdf_bytes(self.treaty_file)
+                self.treaty_hash = pdf_extraction.content_hash(treaty_bytes)
+                self.treaty_text = pdf_extraction.extract_text(treaty_bytes)
+                if clause_index.ENABLED:
+                    self.clause_index = clause_index.for_treaty(self.treaty_text)
+                    instrumentation.add(clauses=len(self.clause_index))
+            with self.trace.stage('parse.bordereaux'):
+                # Bordereaux seen before are memory-mapped from Parquet instead of re-parsing the Excel file
+                self.bordereaux_key = bordereaux_store.file_hash(self.bordereaux_file)
+                self.bordereaux_df = bordereaux_store.load_or_ingest(self.bordereaux_key, self.bordereaux_file,
+                                                                     AI_Integration.read_bordereaux,
+                                                                     self.bordereaux_columns)
+                instrumentation.add(rows=len(self.bordereaux_df))
+            if self.statement_file is not None:
+                with self.trace.stage('parse.statement'):
+                    statement_bytes = pdf_extraction.read_pdf_bytes(self.statement_file)
+                    self.statement_text = pdf_extraction.extract_text(statement_bytes)
+                    self.statement_df = statement_tables.extract_statement(statement_bytes)
+        self.parsed = True
+        self.dump_inputs()
+        return self
+
+    def dump_inputs(self):
+        """Write the parsed inputs to the debug directory, if one is configured.
+
+        The treaty text is dumped by the AI stage alongside its summary.
+        """
+        if not self.debug_dir:
+            return
+        os.makedirs(self.debug_dir, exist_ok=True)
+        if self.statement_text is not None:
+            AI_Integration.save_text_file(self.statement_text, os.path.join(self.debug_dir, 'statementoutput.txt'))
+        if self.statement_df is not None:
+            self.statement_df.to_csv(os.path.join(self.debug_dir, 'statement_table.csv'), index=False)
+        self.bordereaux_df.to_excel(os.path.join(self.debug_dir, 'clean_bordereaux.xlsx'), index=False)
+
+    def run_ai_stage(self):
+        self.parse()
+        with self.trace.stage('ai'):
+            return self._run_ai_stage()
+
+    def _run_ai_stage(self):
+        if not self.incremental_analysis:
+            self.ai_report = AI_Integration.run_ai_analysis(self.treaty_text, self.bordereaux_df, self.debug_dir,
+                                                          self.clause_index)
+            return self.ai_report
+
+        # Only rows added or changed since the last submission are sent to the model
+        store = incremental.SubmissionStore()
+        lineage = incremental.lineage(self.cedant, self.treaty_hash)
+        hashes = incremental.row_keys(self.bordereaux_df)
+        previous = store.previous(lineage)
+        changed = incremental.changed_rows(hashes, previous)
+        instrumentation.add(rows_reused=int((~changed).sum()))
+        ai_report = AI_Integration.run_ai_analysis(self.treaty_text, self.bordereaux_df[changed], self.debug_dir,
+                                                   self.clause_index)
+        if not ai_report:
+            self.ai_report = ai_report
+            return self.ai_report
+        report, known = incremental.merge_report(json.loads(ai_report), self.bordereaux_df, hashes, changed, previous)
+        try:
+            store.save(lineage, self.bordereaux_key, len(hashes), int(changed.sum()), known)
+        except Exception as e:
+            print(f"Could not store submission for incremental analysis: {e}")
+        self.ai_report = json.dumps(report, indent=2, default=str)
+        return self.ai_report
+
+    def run_rule_stage(self):
+        self.parse()
+        with self.trace.stage('rules'):
+            return self._run_rule_stage()
+
+    def _run_rule_stage(self):
+        bordereaux_df = self.bordereaux_df
+        statement_text = self.statement_text or ''
+        instrumentation.add(rows=len(bordereaux_df))
+        with self.trace.stage('rules.matching'):
+            common_fields = analysis.identify_common_fields(bordereaux_df, statement_text, self.treaty_text)
+            matches = matching.find_discrepancies(bordereaux_df, statement_text, self.treaty_text, common_fields,
+                                                  tolerant=True)
+        with self.trace.stage('rules.evaluate'):
+            # Every configured rule is evaluated as a column mask in one pass over the bordereaux
+            flags = rules.evaluate(bordereaux_df, rules.load_rules())
+        fraud_flags = flags.pop('Fraudulent Claims', [])
+        duplicate_data = flags.pop('Duplicate Entries', [])
+        with self.trace.stage('rules.keyed_reconciliation'):
+            flags.update(self.run_keyed_reconciliation())
+        if claims_index.ENABLED:
+            with self.trace.stage('rules.claims_history'):
+                flags.update(self.check_claims_history())
+        report = analysis.generate_report(matches['statement'], matches['treaty'], matches['premium'],
+                                          fraud_flags, duplicate_data, flags)
+        self.report = self.cite_treaty_clauses(report)
+        return self.report
+
+    def check_claims_history(self):
+        """Flag claims already seen in an earlier bordereaux from any cedant, then index this bordereaux"""
+        try:
+            return claims_index.check_and_record(self.bordereaux_df, self.bordereaux_key, self.cedant)
+        except Exception as e:
+            print(f"Could not check the claims history: {e}")
+            return {}
+
+    def cite_treaty_clauses(self, report):
+        """Name the treaty clauses behind each treaty, premium and fraud flag in the report"""
+        if not self.clause_index:
+            return report
+        for category in ('Treaty Discrepancies', 'Premium Discrepancies'):
+            clause_index.cite(report.get(category, []), self.clause_index, lambda item: item.get('Field', ''))
+        clause_index.cite(report.get('Fraudulent Claims', []), self.clause_index,
+                          lambda item: FRAUD_CLAUSE_QUERY)
+        return report
+
+    def run_keyed_reconciliation(self):
+        """Join bordereaux and statement records on the reconciliation key; {} without a keyed statement table"""
+        self.parse()
+        if self.statement_df is None:
+            return {}
+        key = self.reconciliation_key
+        statement_df = keyed_reconciliation.align_columns(self.statement_df, self.bordereaux_df.columns)
+        if key not in self.bordereaux_df.columns or key not in statement_df.columns:
+            return {}
+        return keyed_reconciliation.reconcile(self.bordereaux_df, statement_df, key)
+
+    def report_sections(self):
+        """(category, items) sections of the finished report: AI findings and summaries, then rule categories"""
+        ai_report = json.loads(self.ai_report) if self.ai_report else {}
+        sections = [
+            ('AI Findings', ai_report.get('findings', [])),
+            ('AI Batch Summaries', [{'Summary': summary} for summary in ai_report.get('batch_summaries', [])]),
+            ('AI Failed Batches', ai_report.get('failed_batches', [])),
+            ('AI Batch Prompts', ai_report.get('batch_prompts', [])),
+        ]
+        sections.extend((self.report or {}).items())
+        summary = {key: ai_report[key] for key in ('rows_analysed', 'rows_reused', 'rows_total', 'batches')
+                   if key in ai_report}
+        return sections, summary
+
+    def run(self, progress=None):
+        """Run every stage and return the AI report JSON and the rule-based PDF report.
+
+        progress, if given, is called with the name of each stage as it starts.
+        """
+        progress = progress or (lambda stage: None)
+        try:
+            progress('parse')
+            self.parse()
+            progress('ai')
+            ai_report = self.run_ai_stage()
+            if not ai_report:
+                raise ValueError('No report data provided')
+            progress('rules')
+            report = self.run_rule_stage()
+            progress('report')
+            with self.trace.stage('report'):
+                pdf_buffer = analysis.generate_pdf_report(report)
+        except Exception:
+            self.trace.finish('failed')
+            raise
+        self.trace.finish('done')
+        return ai_report, pdf_buffer
@@ -0,0 +1,107 @@
+import io
+import threading
+
+ENCODING_NAME = "cl100k_base"
+# gpt-3.5-turbo has a 16k context; keep room for the 1000-token answer and message framing.
+PROMPT_TOKEN_BUDGET = 14000
+ROW_BATCH = 1000
+
+_encoder = None
+_encoder_lock = threading.Lock()
+
+
+def load_encoder():
+    """Build the tokenizer once; call at startup so the first request does not pay for it"""
+    global _encoder
+    with _encoder_lock:
+        if _encoder is None:
+            # Imported here: tiktoken is slow to import and only prompt building needs it
+            import tiktoken
+            _encoder = tiktoken.get_encoding(ENCODING_NAME)
+    return _encoder
+
+
+def get_encoder():
+    return _encoder or load_encoder()
+
+
+def count_tokens(text):
+    return len(get_encoder().encode_ordinary(text))
+
+
+def csv_rows(df, batch_size=ROW_BATCH):
+    """Yield each DataFrame row as one CSV record, rendering batch_size rows at a time.
+
+    A record spans several lines when a quoted cell holds a line break, so exactly one item is
+    yielded per row.
+    """
+    for start in range(0, len(df), batch_size):
+        rendered = df.iloc[start:start + batch_size].to_csv(index=False, header=False, lineterminator='\n')
+        record = []
+        quotes = 0
+        for line in io.StringIO(rendered, newline='\n'):
+            record.append(line)
+            # Only quoted cells contain quote characters, always in pairs, so an odd count means the
+            # line break is inside a quoted cell.
+            quotes += line.count('"')
+            if quotes % 2 == 0:
+                yield ''.join(record)
+                record.clear()
+
+
+class PromptBuilder:
+    """Assembles a prompt section by section, keeping a running token count against a budget"""
+
+    def __init__(self, max_tokens=PROMPT_TOKEN_BUDGET):
+        self.max_tokens = max_tokens
+        self.parts = []
+        self.tokens = 0
+        self.rows_included = 0
+        self.truncated = False
+
+    @property
+    def remaining(self):
+        return self.max_tokens - self.tokens
+
+    def add(self, text):
+        """Append text if it fits the remaining budget; returns whether it was added"""
+        tokens = count_tokens(text)
+        if tokens > self.remaining:
+            self.truncated = True
+            return False
+        self.parts.append(text)
+        self.tokens += tokens
+        return True
+
+    def add_section(self, title, text, max_tokens=None):
+        """Append a titled section, trimming its body to the remaining budget (or max_tokens) if needed"""
+        heading = f"\n\n{title}:\n" if title else ""
+        limit = self.remaining if max_tokens is None else min(max_tokens, self.remaining)
+        if count_tokens(heading + text) <= limit:
+            return self.add(heading + text)
+        budget = limit - count_tokens(heading)
+        if budget <= 0:
+            self.truncated = True
+            return False
+        encoder = get_encoder()
+        trimmed = encoder.decode(encoder.encode_ordinary(text)[:budget])
+        self.truncated = True
+        return self.add(heading + trimmed)
+
+    def add_row(self, row):
+        """Append one data row if it fits; returns whether it was added"""
+        if not self.add(row):
+            return False
+        self.rows_included += 1
+        return True
+
+    def build(self):
+        return ''.join(self.parts)
+
+    def stats(self):
+        return {
+            'tokens': self.tokens,
+            'max_tokens': self.max_tokens,
+            'rows_included': self.rows_included,
+            'truncated': self.truncated,
+        }
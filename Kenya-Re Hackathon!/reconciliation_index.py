@@ -0,0 +1,170 @@
+import datetime
+import re
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_datetime64_any_dtype, is_numeric_dtype
+
+AMOUNT_TOLERANCE = 0.01
+# Longest multi-word value (e.g. a policy holder name) matched as an exact phrase.
+MAX_PHRASE_WORDS = 6
+# Scores at or above this count as found; all words present but not adjacent scores 0.8.
+MIN_MATCH_SCORE = 0.8
+EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+
+AMOUNT = re.compile(r'(?<![\w.,])-?(?:\d{1,3}(?:,\d{3})+|\d+)(?:\.\d+)?(?!\w)')
+ISO_DATE = re.compile(r'\b(\d{4})-(\d{1,2})-(\d{1,2})\b')
+NUMERIC_DATE = re.compile(r'\b(\d{1,2})[/.-](\d{1,2})[/.-](\d{4}|\d{2})\b')
+MONTHS = ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec']
+MONTH = r'(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\.?'
+DAY_MONTH_YEAR = re.compile(r'\b(\d{1,2})(?:st|nd|rd|th)?\s+' + MONTH + r',?\s+(\d{4})\b', re.IGNORECASE)
+MONTH_DAY_YEAR = re.compile(r'\b' + MONTH + r'\s+(\d{1,2})(?:st|nd|rd|th)?,?\s+(\d{4})\b', re.IGNORECASE)
+WORD = re.compile(r'[^\W_]+')
+
+
+def parse_amount(text):
+    """Number written as '1,500.00', '1500' or '-12.5', or None"""
+    text = text.strip()
+    if not AMOUNT.fullmatch(text):
+        return None
+    return float(text.replace(',', ''))
+
+
+def date_ordinal(year, month, day):
+    if year < 100:
+        year += 2000 if year < 70 else 1900
+    try:
+        return datetime.date(year, month, day).toordinal()
+    except ValueError:
+        return None
+
+
+def extract_dates(text):
+    """Ordinals of every date in the text; ambiguous dd/mm vs mm/dd dates yield both readings"""
+    ordinals = []
+    for year, month, day in ISO_DATE.findall(text):
+        ordinals.append(date_ordinal(int(year), int(month), int(day)))
+    for first, second, year in NUMERIC_DATE.findall(text):
+        ordinals.append(date_ordinal(int(year), int(second), int(first)))
+        ordinals.append(date_ordinal(int(year), int(first), int(second)))
+    for day, month, year in DAY_MONTH_YEAR.findall(text):
+        ordinals.append(date_ordinal(int(year), MONTHS.index(month.lower()) + 1, int(day)))
+    for month, day, year in MONTH_DAY_YEAR.findall(text):
+        ordinals.append(date_ordinal(int(year), MONTHS.index(month.lower()) + 1, int(day)))
+    return [ordinal for ordinal in ordinals if ordinal is not None]
+
+
+def cell_dates(text):
+    """extract_dates of a cell that holds nothing but one date, else an empty list"""
+    text = ' '.join(text.split())
+    if any(pattern.fullmatch(text) for pattern in (ISO_DATE, NUMERIC_DATE, DAY_MONTH_YEAR, MONTH_DAY_YEAR)):
+        return extract_dates(text)
+    return []
+
+
+def words(text):
+    return WORD.findall(text.casefold())
+
+
+def hash_array(values):
+    return np.unique(np.fromiter((hash(value) for value in values), dtype=np.int64))
+
+
+def contains_sorted(sorted_values, queries):
+    """Membership of each query in a sorted array, by binary search"""
+    queries = np.asarray(queries)
+    if not len(sorted_values):
+        return np.zeros(len(queries), dtype=bool)
+    positions = np.minimum(np.searchsorted(sorted_values, queries), len(sorted_values) - 1)
+    return sorted_values[positions] == queries
+
+
+class ReconciliationIndex:
+    """Normalized amounts, dates and words extracted once from a statement, in sorted arrays.
+
+    Every lookup is a binary search, so resolving a bordereaux cell is O(log n) in the
+    size of the statement, and each lookup returns a match-quality score in [0, 1].
+    """
+
+    def __init__(self, text, amount_tolerance=AMOUNT_TOLERANCE):
+        text = text or ''
+        self.amount_tolerance = amount_tolerance
+        self.amounts = np.unique(np.array([float(match.replace(',', '')) for match in AMOUNT.findall(text)],
+                                          dtype='float64'))
+        self.dates = np.unique(np.array(extract_dates(text), dtype='int64'))
+        tokens = words(text)
+        self.words = hash_array(tokens)
+        self.phrases = hash_array(
+            ' '.join(tokens[start:start + size])
+            for size in range(2, MAX_PHRASE_WORDS + 1)
+            for start in range(len(tokens) - size + 1)
+        )
+
+    def amount_scores(self, values):
+        """1.0 for an exact amount, 0.95 within the tolerance, 0.0 otherwise"""
+        values = np.asarray(values, dtype='float64')
+        scores = np.zeros(len(values))
+        if not len(self.amounts):
+            return scores
+        positions = np.searchsorted(self.amounts, values - self.amount_tolerance, side='left')
+        candidates = self.amounts[np.minimum(positions, len(self.amounts) - 1)]
+        within = (positions < len(self.amounts)) & (candidates <= values + self.amount_tolerance)
+        scores[within] = 0.95
+        scores[within & np.isclose(candidates, values, rtol=0, atol=1e-9)] = 1.0
+        return scores
+
+    def date_scores(self, ordinals):
+        return contains_sorted(self.dates, np.asarray(ordinals, dtype='int64')).astype('float64')
+
+    def text_score(self, value):
+        """1.0 for an exact word or phrase, 0.8 times the share of the value's words otherwise"""
+        value_words = words(value)
+        if not value_words:
+            return 1.0
+        if len(value_words) == 1:
+            return float(contains_sorted(self.words, np.array([hash(value_words[0])]))[0])
+        if len(value_words) <= MAX_PHRASE_WORDS and \
+                contains_sorted(self.phrases, np.array([hash(' '.join(value_words))]))[0]:
+            return 1.0
+        found = contains_sorted(self.words, np.array([hash(word) for word in value_words], dtype=np.int64))
+        return 0.8 * found.mean()
+
+    def score(self, value):
+        """Match quality of a single bordereaux cell"""
+        if value is None or (isinstance(value, float) and np.isnan(value)) or value is pd.NaT:
+            return 1.0
+        if isinstance(value, (bool, np.bool_)):
+            return self.text_score(str(value))
+        if isinstance(value, (int, float, np.integer, np.floating)):
+            return self.amount_scores([value])[0]
+        if isinstance(value, (datetime.date, np.datetime64)):
+            return self.date_scores([pd.Timestamp(value).toordinal()])[0]
+        value = str(value)
+        amount = parse_amount(value)
+        if amount is not None:
+            return self.amount_scores([amount])[0]
+        ordinals = extract_dates(value)
+        if ordinals and max(self.date_scores(ordinals)) == 1.0:
+            return 1.0
+        return self.text_score(value)
+
+    def scores(self, column):
+        """Match quality of every cell in a bordereaux column; blank cells score 1.0"""
+        column = pd.Series(column)
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            category_scores = self.scores(pd.Series(column.cat.categories))
+            codes = column.cat.codes.to_numpy()
+            return np.where(codes >= 0, category_scores[np.maximum(codes, 0)], 1.0)
+        if is_numeric_dtype(column.dtype) and not column.dtype == bool:
+            values = column.to_numpy(dtype='float64', na_value=np.nan)
+            return np.where(np.isnan(values), 1.0, self.amount_scores(values))
+        if is_datetime64_any_dtype(column.dtype):
+            missing = column.isna().to_numpy()
+            days = column.to_numpy(dtype='datetime64[D]').astype('int64') + EPOCH_ORDINAL
+            return np.where(missing, 1.0, self.date_scores(days))
+        uniques = pd.unique(column)
+        unique_scores = {value: self.score(value) for value in uniques}
+        return column.map(unique_scores).to_numpy(dtype='float64')
+
+    def missing_mask(self, column, min_score=MIN_MATCH_SCORE):
+        return self.scores(column) < min_score
@@ -0,0 +1,75 @@
+from markupsafe import escape
+
+HEAD = """<!DOCTYPE html>
+<html>
+    <head>
+        <title>AI Discrepancy Report</title>
+        <style>
+            body {
+                font-family: Arial, sans-serif;
+                margin: 40px;
+            }
+            h1 {
+                color: #4CAF50;
+            }
+            .report-content {
+                margin-top: 20px;
+            }
+            .report-index button.active {
+                font-weight: bold;
+            }
+            table {
+                border-collapse: collapse;
+                margin-top: 10px;
+            }
+            th, td {
+                border: 1px solid #ddd;
+                padding: 4px 8px;
+                text-align: left;
+                vertical-align: top;
+            }
+        </style>
+    </head>
+    <body>
+        <h1>AI Discrepancy Report</h1>
+"""
+
+SUMMARY_LABELS = (
+    ('rows_analysed', 'Rows analysed'),
+    ('rows_reused', 'Rows unchanged since last submission'),
+    ('rows_total', 'Rows in bordereaux'),
+    ('batches', 'Analysis batches'),
+)
+
+
+def iter_report_html(index, sections_url, script_url):
+    """Yield the report page in small chunks: summary, section index and an empty section view.
+
+    Section items are not rendered here; report.js fetches one page of the chosen section at a time
+    from sections_url, so the page size and time to first byte do not depend on the report size.
+    """
+    yield HEAD
+    summary = index.get('summary', {})
+    stats = [(label, summary[key]) for key, label in SUMMARY_LABELS if key in summary]
+    if stats:
+        yield '        <ul class="report-summary">\n'
+        for label, value in stats:
+            yield f'            <li>{escape(label)}: {escape(value)}</li>\n'
+        yield '        </ul>\n'
+
+    yield (f'        <div class="report-content" id="report" data-sections-url="{escape(sections_url)}">\n'
+           '            <h2>Report Data:</h2>\n'
+           '            <div class="report-index">\n')
+    sections = [section for section in index['sections'] if section['count']]
+    if not sections:
+        yield '                <p>No discrepancies found.</p>\n'
+    for section in sections:
+        category = escape(section['category'])
+        yield (f'                <button type="button" data-category="{category}">'
+               f'{category} ({section["count"]})</button>\n')
+    yield ('            </div>\n'
+           '            <div id="section"></div>\n'
+           '        </div>\n'
+           f'        <script src="{escape(script_url)}"></script>\n'
+           '    </body>\n'
+           '</html>\n')
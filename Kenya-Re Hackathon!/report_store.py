@@ -0,0 +1,97 @@
+import json
+import os
+from array import array
+
+ITEMS_FILE = 'items.jsonl'
+OFFSETS_FILE = 'offsets.bin'
+INDEX_FILE = 'index.json'
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+# Flush the offsets of written items every this many items, so writing never holds a whole report.
+OFFSET_BATCH = 10000
+
+
+class ReportStore:
+    """Report sections on disk as JSON lines plus a byte-offset table, so any page is read with one seek.
+
+    Layout of the directory: items.jsonl holds every item of every section in order, offsets.bin
+    the int64 start offset of each line, and index.json the sections with their first item and count.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._index = None
+
+    def _path(self, filename):
+        return os.path.join(self.directory, filename)
+
+    def write(self, sections, summary=None):
+        """Store (category, items) sections; items may be any iterable of JSON-serializable dicts"""
+        os.makedirs(self.directory, exist_ok=True)
+        index = {'summary': summary or {}, 'sections': []}
+        position = 0
+        count = 0
+        offsets = array('q')
+        with open(self._path(ITEMS_FILE), 'wb') as items_file, open(self._path(OFFSETS_FILE), 'wb') as offsets_file:
+            for category, items in sections:
+                first = count
+                for item in items:
+                    line = json.dumps(item, default=str).encode('utf-8') + b'\n'
+                    offsets.append(position)
+                    items_file.write(line)
+                    position += len(line)
+                    count += 1
+                    if len(offsets) >= OFFSET_BATCH:
+                        offsets.tofile(offsets_file)
+                        offsets = array('q')
+                index['sections'].append({'category': category, 'first': first, 'count': count - first})
+            offsets.append(position)
+            offsets.tofile(offsets_file)
+        tmp_path = self._path(f'{INDEX_FILE}.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump(index, file)
+        # The index is written last, so a store with an index is always complete.
+        os.replace(tmp_path, self._path(INDEX_FILE))
+        self._index = index
+
+    def exists(self):
+        return os.path.exists(self._path(INDEX_FILE))
+
+    def index(self):
+        """Summary plus [{'category', 'count'}] for every section"""
+        if self._index is None:
+            with open(self._path(INDEX_FILE), 'r', encoding='utf-8') as file:
+                self._index = json.load(file)
+        return self._index
+
+    def section(self, category):
+        return next((section for section in self.index()['sections'] if section['category'] == category), None)
+
+    def page(self, category, page=1, page_size=PAGE_SIZE):
+        """One page of a section's items, reading only that page's bytes; None for an unknown category"""
+        section = self.section(category)
+        if section is None:
+            return None
+        page_size = max(1, min(page_size, MAX_PAGE_SIZE))
+        pages = max(1, -(-section['count'] // page_size))
+        page = max(1, min(page, pages))
+        start = section['first'] + (page - 1) * page_size
+        stop = min(start + page_size, section['first'] + section['count'])
+        items = []
+        if stop > start:
+            offsets = array('q')
+            with open(self._path(OFFSETS_FILE), 'rb') as file:
+                file.seek(start * offsets.itemsize)
+                offsets.fromfile(file, stop - start + 1)
+            with open(self._path(ITEMS_FILE), 'rb') as file:
+                file.seek(offsets[0])
+                data = file.read(offsets[-1] - offsets[0])
+            items = [json.loads(line) for line in data.splitlines()]
+        return {
+            'category': category,
+            'page': page,
+            'page_size': page_size,
+            'pages': pages,
+            'total': section['count'],
+            'items': items,
+        }
@@ -0,0 +1,237 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+ID_FIELD = 'Policy Holder ID'
+# Optional JSON file with extra rule definitions, e.g. [{"type": "velocity", "key": "Cedant", ...}]
+RULES_FILE = os.environ.get('CLAIMS_RULES_FILE')
+
+
+class Columns:
+    """Per-evaluation cache of converted columns, so rules sharing a column convert it only once"""
+
+    def __init__(self, df):
+        self.df = df
+        self._numeric = {}
+        self._dates = {}
+        self._codes = {}
+
+    def has(self, *names):
+        return all(name in self.df.columns for name in names)
+
+    def raw(self, name):
+        return self.df[name].to_numpy(dtype=object)
+
+    def numeric(self, name):
+        if name not in self._numeric:
+            self._numeric[name] = pd.to_numeric(self.df[name], errors='coerce').to_numpy(dtype='float64')
+        return self._numeric[name]
+
+    def dates(self, name):
+        """Column as int64 day numbers, with missing dates as NaN"""
+        if name not in self._dates:
+            parsed = pd.to_datetime(self.df[name], errors='coerce')
+            days = parsed.to_numpy(dtype='datetime64[D]').astype('int64').astype('float64', copy=True)
+            days[parsed.isna().to_numpy()] = np.nan
+            self._dates[name] = days
+        return self._dates[name]
+
+    def codes(self, *names):
+        """Dense integer code per distinct key tuple; -1 where any key is missing"""
+        if names not in self._codes:
+            keys = self.df[list(names)]
+            codes = keys.groupby(list(names), sort=False, dropna=False, observed=True).ngroup().to_numpy(copy=True)
+            codes[keys.isna().any(axis=1).to_numpy()] = -1
+            self._codes[names] = codes
+        return self._codes[names]
+
+    def ids(self):
+        if ID_FIELD in self.df.columns:
+            return self.raw(ID_FIELD)
+        return np.full(len(self.df), 'Unknown', dtype=object)
+
+
+class Rule:
+    """A check that compiles to one boolean mask over the whole bordereaux"""
+
+    category = 'Flagged Claims'
+    requires = ()
+
+    def applies(self, columns):
+        return columns.has(*self.requires)
+
+    def mask(self, columns):
+        raise NotImplementedError
+
+    def describe(self, columns, positions, row_numbers):
+        """Build report dicts for the flagged row positions only"""
+        ids = columns.ids()[positions]
+        return [{'Policy Holder ID': policy_id, 'Issue': f'{self.issue} (Row {row})'}
+                for policy_id, row in zip(ids, row_numbers)]
+
+
+class RatioRule(Rule):
+    """Flag rows where numerator > factor * denominator"""
+
+    category = 'Fraudulent Claims'
+
+    def __init__(self, numerator='Claim Amount', denominator='Premium Amount', factor=2, category=None):
+        self.numerator = numerator
+        self.denominator = denominator
+        self.factor = factor
+        self.requires = (numerator, denominator)
+        self.category = category or self.category
+
+    def mask(self, columns):
+        numerator = columns.numeric(self.numerator)
+        denominator = columns.numeric(self.denominator)
+        with np.errstate(invalid='ignore'):
+            return numerator > self.factor * denominator  # NaN compares False, like the notnull checks
+
+    def describe(self, columns, positions, row_numbers):
+        ids = columns.ids()[positions]
+        numerators = columns.raw(self.numerator)[positions]
+        denominators = columns.raw(self.denominator)[positions]
+        return [
+            {
+                'Policy Holder ID': policy_id,
+                self.numerator: numerator,
+                self.denominator: denominator,
+                'Issue': f'Potential fraud: {self.numerator} ({numerator}) significantly higher than '
+                         f'{self.denominator} ({denominator}) (Row {row})'
+            }
+            for policy_id, numerator, denominator, row in zip(ids, numerators, denominators, row_numbers)
+        ]
+
+
+class DuplicateRule(Rule):
+    """Flag every row whose key columns repeat elsewhere in the bordereaux"""
+
+    category = 'Duplicate Entries'
+
+    def __init__(self, keys=(ID_FIELD,), category=None):
+        self.keys = tuple(keys)
+        self.requires = self.keys
+        self.category = category or self.category
+
+    def mask(self, columns):
+        return columns.df.duplicated(subset=list(self.keys), keep=False).to_numpy()
+
+    def describe(self, columns, positions, row_numbers):
+        label = ', '.join(self.keys)
+        ids = columns.ids()[positions]
+        return [{'Policy Holder ID': policy_id, 'Issue': f'Duplicate {label} found in bordereaux (Row {row})'}
+                for policy_id, row in zip(ids, row_numbers)]
+
+
+class DateOverlapRule(Rule):
+    """Flag rows whose [start, end] date window overlaps another row with the same key"""
+
+    category = 'Overlapping Cover'
+
+    def __init__(self, key=ID_FIELD, start='Start Date of Cover', end='End Date of Cover', category=None):
+        self.key = key
+        self.start = start
+        self.end = end
+        self.requires = (key, start, end)
+        self.category = category or self.category
+        self.issue = f'{start} to {end} overlaps another row with the same {key}'
+
+    def mask(self, columns):
+        codes = columns.codes(self.key)
+        starts = columns.dates(self.start)
+        ends = columns.dates(self.end)
+        valid = (codes >= 0) & ~np.isnan(starts) & ~np.isnan(ends)
+        positions = np.flatnonzero(valid)
+        order = positions[np.lexsort((starts[positions], codes[positions]))]
+        same_key = codes[order][1:] == codes[order][:-1]
+        # Sorted by start within a key, a row overlaps a later one iff it overlaps the next one,
+        # and a row overlaps an earlier one iff it starts before the running max of earlier ends.
+        running_end = pd.Series(ends[order]).groupby(codes[order]).cummax().to_numpy()
+        overlaps_next = same_key & (starts[order][1:] <= ends[order][:-1])
+        overlaps_prev = same_key & (starts[order][1:] <= running_end[:-1])
+        mask = np.zeros(len(codes), dtype=bool)
+        mask[order[:-1][overlaps_next]] = True
+        mask[order[1:][overlaps_prev]] = True
+        return mask
+
+
+class VelocityRule(Rule):
+    """Flag claims when one key (e.g. a cedant) files more than max_claims within window_days"""
+
+    category = 'Claim Velocity'
+
+    def __init__(self, key='Cedant', date='Claim Date', max_claims=5, window_days=30, category=None):
+        self.key = key
+        self.date = date
+        self.max_claims = max_claims
+        self.window_days = window_days
+        self.requires = (key, date)
+        self.category = category or self.category
+        self.issue = f'More than {max_claims} claims for the same {key} within {window_days} days'
+
+    def mask(self, columns):
+        codes = columns.codes(self.key)
+        days = columns.dates(self.date)
+        positions = np.flatnonzero((codes >= 0) & ~np.isnan(days))
+        mask = np.zeros(len(codes), dtype=bool)
+        if not len(positions):
+            return mask
+        days = days[positions] - days[positions].min()
+        # One sortable number per row; spacing keys further apart than any window keeps them disjoint.
+        span = days.max() + self.window_days + 1
+        keyed = codes[positions] * span + days
+        order = np.argsort(keyed, kind='stable')
+        keyed = keyed[order]
+        window_start = np.searchsorted(keyed, keyed - self.window_days, side='left')
+        in_window = np.arange(len(keyed)) - window_start + 1
+        mask[positions[order][in_window > self.max_claims]] = True
+        return mask
+
+
+RULE_TYPES = {
+    'ratio': RatioRule,
+    'duplicate': DuplicateRule,
+    'date_overlap': DateOverlapRule,
+    'velocity': VelocityRule,
+}
+
+DEFAULT_RULES = [RatioRule(), DuplicateRule()]
+
+
+def rule_from_config(config):
+    """Build a rule from a declarative dict such as {"type": "ratio", "factor": 3}"""
+    config = dict(config)
+    rule_type = config.pop('type')
+    if rule_type not in RULE_TYPES:
+        raise ValueError(f"Unknown rule type: {rule_type}")
+    if 'keys' in config:
+        config['keys'] = tuple(config['keys'])
+    return RULE_TYPES[rule_type](**config)
+
+
+def load_rules(path=RULES_FILE):
+    """The default rules plus any configured in the JSON rules file"""
+    rules = list(DEFAULT_RULES)
+    if path:
+        with open(path, 'r', encoding='utf-8') as file:
+            rules.extend(rule_from_config(config) for config in json.load(file))
+    return rules
+
+
+def evaluate(bordereaux_df, rules=None):
+    """Evaluate all rules over the bordereaux columns and return {category: [flag dicts]}"""
+    rules = DEFAULT_RULES if rules is None else rules
+    columns = Columns(bordereaux_df)
+    row_numbers = bordereaux_df.index.to_numpy() + 1
+    results = {}
+    for rule in rules:
+        flagged = results.setdefault(rule.category, [])
+        if not rule.applies(columns):
+            continue
+        positions = np.flatnonzero(rule.mask(columns))
+        if len(positions):
+            flagged.extend(rule.describe(columns, positions, row_numbers[positions]))
+    return results
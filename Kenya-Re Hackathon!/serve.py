@@ -0,0 +1,126 @@
+"""Production server: load everything once, then fork worker processes sharing one listening socket:
+
+    python serve.py --host 0.0.0.0 --port 8000 --workers 4
+
+The parent imports the pipeline, builds the tokenizer and font metrics and requeues interrupted
+jobs before forking, so workers start warm and share that memory copy-on-write. Workers that exit
+are replaced, after the jobs they were running are put back in the queue for the new worker to pick up.
+Workers keep their metrics totals in a shared directory, so /metrics on any worker reports the totals
+of all of them, replaced ones included. Without os.fork (Windows) a single warmed, threaded process
+serves instead.
+"""
+import argparse
+import logging
+import os
+import shutil
+import signal
+import socket
+import sys
+import time
+
+from werkzeug.serving import make_server
+
+import app as application
+import instrumentation
+
+logger = logging.getLogger('claims')
+
+# A worker that dies sooner than this after starting is restarted only after the same delay.
+RESTART_DELAY_SECONDS = 1.0
+# Each server keeps its workers' metrics in a subdirectory named after its own pid
+METRICS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'metrics')
+
+
+def bind(host, port, backlog=128):
+    sock = socket.create_server((host, port), backlog=backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def serve_worker(sock, host, port):
+    """Serve requests on the shared socket, one thread per request, with this process's own job queue"""
+    from jobs import JobQueue
+    # Jobs of other workers look interrupted to a new queue; the parent already requeued the real ones.
+    application.job_queue = JobQueue(requeue_running=False)
+    server = make_server(host, port, application.app, threaded=True, fd=sock.fileno())
+    logger.info('worker %s serving on %s:%s', os.getpid(), host, port)
+    server.serve_forever()
+
+
+def spawn(sock, host, port):
+    pid = os.fork()
+    if pid == 0:
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        status = 0
+        try:
+            serve_worker(sock, host, port)
+        except KeyboardInterrupt:
+            pass
+        except Exception:
+            logger.exception('worker %s failed', os.getpid())
+            status = 1
+        finally:
+            os._exit(status)
+    return pid
+
+
+def run(host, port, workers):
+    started = time.perf_counter()
+    application.warm()
+    from jobs import requeue_interrupted, requeue_owned
+    requeue_interrupted()
+    logger.info('warmed in %.2fs', time.perf_counter() - started)
+    sock = bind(host, port)
+    if workers <= 1 or not hasattr(os, 'fork'):
+        serve_worker(sock, host, port)
+        return
+
+    metrics_dir = os.path.join(METRICS_DIR, str(os.getpid()))
+    instrumentation.registry.share(metrics_dir)
+    children = {}
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for _ in range(workers):
+        children[spawn(sock, host, port)] = time.monotonic()
+    while children:
+        pid, status = os.wait()
+        spawned_at = children.pop(pid, None)
+        if spawned_at is None:
+            continue
+        requeued = requeue_owned(pid)
+        if stopping:
+            continue
+        logger.warning('worker %s exited with status %s, requeueing %s running jobs; starting a new one',
+                       pid, status, requeued)
+        if time.monotonic() - spawned_at < RESTART_DELAY_SECONDS:
+            time.sleep(RESTART_DELAY_SECONDS)
+        if not stopping:
+            children[spawn(sock, host, port)] = time.monotonic()
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve the reconciliation app with pre-forked, warmed workers.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2, help='worker processes to fork')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    run(args.host, args.port, args.workers)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,31 @@
+import os
+import sqlite3
+import threading
+from contextlib import closing
+
+# Seconds a connection waits for another thread or process to release its write lock
+BUSY_TIMEOUT_SECONDS = 30
+
+
+class Database:
+    """A SQLite file whose directory and schema are created on first use.
+
+    connect() returns a new connection each time, so callers close it when done and threads never
+    share one; connections wait up to BUSY_TIMEOUT_SECONDS for other processes' writes.
+    """
+
+    def __init__(self, db_path, schema):
+        self.db_path = db_path
+        self.schema = schema
+        self._ready = False
+        self._lock = threading.Lock()
+
+    def connect(self):
+        if not self._ready:
+            with self._lock:
+                if not self._ready:
+                    os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+                    with closing(sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT_SECONDS)) as conn, conn:
+                        conn.executescript(self.schema)
+                    self._ready = True
+        return sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT_SECONDS)
@@ -0,0 +1,123 @@
+import io
+import json
+import os
+import re
+
+import pandas as pd
+import pdfplumber
+
+import excel_ingest
+import instrumentation
+import pdf_extraction
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'pdf_tables')
+KEY_FIELD = 'Policy Holder ID'
+# Ruled tables are detected from their lines; statements printed without a grid fall back to text alignment.
+TEXT_SETTINGS = {'vertical_strategy': 'text', 'horizontal_strategy': 'text'}
+NUMBER = re.compile(r'-?\(?\d{1,3}(?:,\d{3})*(?:\.\d+)?\)?|-?\d+(?:\.\d+)?')
+
+_cache = pdf_extraction.TextCache(CACHE_DIR)
+
+
+def clean_cell(value):
+    """Cell text with wrapped lines and repeated spaces collapsed"""
+    return ' '.join(str(value).split()) if value is not None else ''
+
+
+def page_tables(page):
+    tables = page.extract_tables() or page.extract_tables(TEXT_SETTINGS)
+    cleaned = []
+    for table in tables:
+        rows = [[clean_cell(value) for value in row] for row in table]
+        rows = [row for row in rows if any(row)]
+        if rows:
+            cleaned.append(rows)
+    return cleaned
+
+
+def extract_table_range(data, start, stop):
+    """Extract the tables of pages [start, stop) as a list of per-page lists of row lists"""
+    with pdfplumber.open(io.BytesIO(data)) as pdf:
+        return [page_tables(page) for page in pdf.pages[start:stop]]
+
+
+def is_number(text):
+    return bool(NUMBER.fullmatch(text))
+
+
+def looks_like_header(row):
+    """A header row has mostly filled cells and no numbers"""
+    filled = [value for value in row if value]
+    return len(filled) * 2 >= len(row) and not any(is_number(value) for value in filled)
+
+
+def to_number(text):
+    negative = text.startswith('(') and text.endswith(')')
+    number = float(text.strip('()').replace(',', ''))
+    return -number if negative else number
+
+
+def typed_column(column):
+    """Numeric columns become float64, everything else stays text; blanks become missing values"""
+    filled = column[column != '']
+    if len(filled) and filled.map(is_number).all():
+        return column.map(lambda value: to_number(value) if value else None).astype('float64')
+    return column.where(column != '', None)
+
+
+def merge_tables(tables):
+    """Group page tables into logical tables, joining headerless continuations across page breaks"""
+    merged = []
+    for rows in tables:
+        if looks_like_header(rows[0]):
+            header = rows[0]
+            body = rows[1:]
+            # Tables split over pages often repeat their header; keep them as one table.
+            current = next((table for table in merged if table['header'] == header), None)
+            if current is None:
+                merged.append({'header': header, 'rows': body})
+            else:
+                current['rows'].extend(body)
+        elif merged and len(merged[-1]['header']) == len(rows[0]):
+            merged[-1]['rows'].extend(rows)
+    return merged
+
+
+def table_frame(header, rows):
+    names = excel_ingest.column_names([value or None for value in header])
+    df = pd.DataFrame([row[:len(names)] + [''] * (len(names) - len(row)) for row in rows], columns=names)
+    for name in df.columns:
+        df[name] = typed_column(df[name])
+    return df
+
+
+def extract_tables(file, use_cache=True):
+    """Every table in a PDF as a DataFrame with inferred headers and numeric columns"""
+    data = pdf_extraction.read_pdf_bytes(file)
+    key = pdf_extraction.content_hash(data)
+    cached = _cache.get(key) if use_cache else None
+    if cached is not None:
+        tables = json.loads(cached)
+    else:
+        pages = pdf_extraction.extract_pages(data, extract_table_range)
+        # The page text is counted as pages by extract_text; these are the same pages parsed for tables
+        instrumentation.add(table_pages=len(pages))
+        tables = merge_tables([table for page in pages for table in page])
+        if use_cache:
+            try:
+                _cache.put(key, json.dumps(tables))
+            except OSError as e:
+                print(f"Could not write PDF table cache: {e}")
+    return [table_frame(table['header'], table['rows']) for table in tables]
+
+
+def extract_statement(file, use_cache=True):
+    """The main table of a statement of account: the one keyed by Policy Holder ID, else the largest.
+
+    Returns None when the PDF has no detectable tables.
+    """
+    tables = [df for df in extract_tables(file, use_cache) if len(df)]
+    if not tables:
+        return None
+    keyed = [df for df in tables if KEY_FIELD in df.columns]
+    return max(keyed or tables, key=len)
@@ -0,0 +1,72 @@
+document.addEventListener('DOMContentLoaded', function() {
+    const report = document.getElementById('report');
+    const sectionDiv = document.getElementById('section');
+    const buttons = report.querySelectorAll('.report-index button');
+    const pageSize = 50;
+
+    function renderTable(items) {
+        const table = document.createElement('table');
+        const columns = [];
+        items.forEach(item => Object.keys(item).forEach(key => {
+            if (!columns.includes(key)) {
+                columns.push(key);
+            }
+        }));
+        const header = table.insertRow();
+        columns.forEach(column => {
+            const cell = document.createElement('th');
+            cell.textContent = column;
+            header.appendChild(cell);
+        });
+        items.forEach(item => {
+            const row = table.insertRow();
+            columns.forEach(column => {
+                const value = item[column];
+                row.insertCell().textContent = value === undefined || value === null ? '' : value;
+            });
+        });
+        return table;
+    }
+
+    function pageButton(label, category, page, enabled) {
+        const button = document.createElement('button');
+        button.type = 'button';
+        button.textContent = label;
+        button.disabled = !enabled;
+        button.addEventListener('click', () => showPage(category, page));
+        return button;
+    }
+
+    function showPage(category, page) {
+        const params = new URLSearchParams({category: category, page: page, page_size: pageSize});
+        sectionDiv.textContent = 'Loading...';
+        fetch(`${report.dataset.sectionsUrl}?${params}`)
+        .then(response => {
+            if (!response.ok) {
+                throw new Error('Network response was not ok');
+            }
+            return response.json();
+        })
+        .then(data => {
+            sectionDiv.textContent = '';
+            const heading = document.createElement('h3');
+            heading.textContent = `${data.category} (page ${data.page} of ${data.pages}, ${data.total} items)`;
+            sectionDiv.appendChild(heading);
+            sectionDiv.appendChild(pageButton('Previous', category, data.page - 1, data.page > 1));
+            sectionDiv.appendChild(pageButton('Next', category, data.page + 1, data.page < data.pages));
+            sectionDiv.appendChild(renderTable(data.items));
+        })
+        .catch(error => {
+            console.error('Error:', error);
+            sectionDiv.textContent = `An error occurred: ${error.message}`;
+        });
+    }
+
+    buttons.forEach(button => button.addEventListener('click', () => {
+        buttons.forEach(other => other.classList.toggle('active', other === button));
+        showPage(button.dataset.category, 1);
+    }));
+    if (buttons.length) {
+        buttons[0].click();
+    }
+});
@@ -1,6 +1,23 @@
 document.addEventListener('DOMContentLoaded', function() {
     const form = document.getElementById('uploadForm');
     const resultDiv = document.getElementById('result');
+    const pollInterval = 2000;
+
+    function pollJob(job) {
+        return fetch(job.status_url)
+        .then(response => response.json())
+        .then(status => {
+            if (status.status === 'failed') {
+                throw new Error(status.error);
+            }
+            if (status.status !== 'done') {
+                const stage = status.stage ? ` (${status.stage})` : '';
+                resultDiv.innerHTML = `Processing${stage}... ${Math.round(status.progress * 100)}%`;
+                return new Promise(resolve => setTimeout(resolve, pollInterval)).then(() => pollJob(job));
+            }
+            return job.report_url;
+        });
+    }
 
     form.addEventListener('submit', function(event) {
         event.preventDefault();
@@ -16,20 +33,16 @@ document.addEventListener('DOMContentLoaded', function() {
             if (!response.ok) {
                 throw new Error('Network response was not ok');
             }
-            return response.text();
+            return response.json();
         })
-        .then(htmlContent => {
-            // Replace the current page content
-            document.open();
-            document.write(htmlContent);
-            document.close();
-            
-            // Optional: Scroll to top of new content
-            window.scrollTo(0, 0);
+        .then(pollJob)
+        .then(reportUrl => {
+            // The report page streams in and loads each section page on demand
+            window.location.href = reportUrl;
         })
         .catch(error => {
             console.error('Error:', error);
             resultDiv.innerHTML = `An error occurred: ${error.message}`;
         });
     });
-});
\ No newline at end of file
+});
@@ -0,0 +1,140 @@
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import instrumentation
+from prompt_builder import count_tokens, get_encoder
+
+MAP_PROMPT = "Create a summarized document highlighting key details."
+REDUCE_PROMPT = ("The following are summaries of consecutive parts of one insurance treaty. "
+                 "Combine them into a single summarized document highlighting key details such as "
+                 "limits, retentions, exclusions, territories, premiums and dates.")
+
+# Leaves room for the instructions and the 1000-token answer in a 4k-context model.
+CHUNK_TOKENS = 2500
+MAX_CONCURRENCY = 4
+MAX_RETRIES = 4
+BACKOFF_SECONDS = 1.0
+MAX_REDUCE_ROUNDS = 5
+
+# Lines that open a new treaty section: "Article 5", "SECTION II", "Clause 3", "12.1 Exclusions", ...
+SECTION_HEADING = re.compile(
+    r'^[ \t]*(?:(?:article|section|clause|schedule|part|appendix)\b|\d+(?:\.\d+)*[.)]?[ \t]+[A-Z])',
+    re.IGNORECASE | re.MULTILINE,
+)
+
+
+def split_sections(text):
+    """Split treaty text at section headings, keeping each heading with its body"""
+    starts = [match.start() for match in SECTION_HEADING.finditer(text)]
+    if not starts or starts[0] != 0:
+        starts.insert(0, 0)
+    starts.append(len(text))
+    return [text[start:end] for start, end in zip(starts, starts[1:]) if text[start:end].strip()]
+
+
+def split_oversized(section, max_tokens):
+    """Break a section that is larger than one chunk on paragraph, then line, then token boundaries"""
+    for separator in ('\n\n', '\n'):
+        parts = [part + separator for part in section.split(separator) if part.strip()]
+        if len(parts) > 1:
+            return pack(parts, max_tokens)
+    encoder = get_encoder()
+    tokens = encoder.encode_ordinary(section)
+    return [encoder.decode(tokens[start:start + max_tokens]) for start in range(0, len(tokens), max_tokens)]
+
+
+def pack(parts, max_tokens):
+    """Greedily pack consecutive parts into chunks of at most max_tokens"""
+    chunks = []
+    current = []
+    current_tokens = 0
+    for part in parts:
+        part_tokens = count_tokens(part)
+        if part_tokens > max_tokens:
+            if current:
+                chunks.append(''.join(current))
+                current, current_tokens = [], 0
+            chunks.extend(split_oversized(part, max_tokens))
+            continue
+        if current and current_tokens + part_tokens > max_tokens:
+            chunks.append(''.join(current))
+            current, current_tokens = [], 0
+        current.append(part)
+        current_tokens += part_tokens
+    if current:
+        chunks.append(''.join(current))
+    return chunks
+
+
+def chunk_text(text, max_tokens=CHUNK_TOKENS):
+    """Token-budgeted chunks of text that break on section boundaries where possible"""
+    return pack(split_sections(text), max_tokens)
+
+
+def complete_with_retry(complete, prompt, max_retries=MAX_RETRIES, backoff=BACKOFF_SECONDS):
+    """Call the completion backend, retrying failures with exponential backoff and jitter"""
+    for attempt in range(max_retries + 1):
+        try:
+            return complete(prompt)
+        except Exception as e:
+            if attempt == max_retries:
+                raise
+            delay = backoff * (2 ** attempt) * (1 + random.random())
+            print(f"Completion failed ({e}); retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+
+def summarize_chunks(chunks, instructions, complete, max_concurrency=MAX_CONCURRENCY, **retry):
+    """Summarize each chunk concurrently, returning the summaries in chunk order"""
+    prompts = [chunk + "\n\n" + instructions for chunk in chunks]
+    if len(prompts) == 1:
+        return [complete_with_retry(complete, prompts[0], **retry)]
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        futures = [instrumentation.submit(executor, complete_with_retry, complete, prompt, **retry)
+                   for prompt in prompts]
+        return [future.result() for future in futures]
+
+
+def summarize(text, complete, chunk_tokens=CHUNK_TOKENS, max_concurrency=MAX_CONCURRENCY, **retry):
+    """Map-reduce summary of a long treaty.
+
+    complete is any callable taking a prompt and returning the model's text, such as
+    AI_Integration.chat_completion or a StubCompletion in tests.
+    """
+    chunks = chunk_text(text, chunk_tokens)
+    if not chunks:
+        return ""
+    summaries = summarize_chunks(chunks, MAP_PROMPT, complete, max_concurrency, **retry)
+
+    for _ in range(MAX_REDUCE_ROUNDS):
+        if len(summaries) == 1:
+            return summaries[0]
+        groups = pack([summary + "\n\n" for summary in summaries], chunk_tokens)
+        summaries = summarize_chunks(groups, REDUCE_PROMPT, complete, max_concurrency, **retry)
+    return "\n\n".join(summaries)
+
+
+class StubCompletion:
+    """Local stand-in for the chat model: echoes the first words of each prompt and records calls"""
+
+    def __init__(self, words=50, latency=0.0, failures=0):
+        self.words = words
+        self.latency = latency
+        self.failures = failures
+        self.prompts = []
+        self._lock = threading.Lock()
+
+    def __call__(self, prompt):
+        with self._lock:
+            self.prompts.append(prompt)
+            fail = self.failures > 0
+            if fail:
+                self.failures -= 1
+        if self.latency:
+            time.sleep(self.latency)
+        if fail:
+            raise RuntimeError("stub completion failure")
+        return ' '.join(prompt.split()[:self.words])
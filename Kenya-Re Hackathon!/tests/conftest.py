@@ -0,0 +1,26 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import prompt_builder
+
+
+class WordEncoder:
+    """Stand-in for the tiktoken encoder, one token per space-separated word, so tests need no download"""
+
+    def encode_ordinary(self, text):
+        return text.split(' ')
+
+    def encode(self, text, **kwargs):
+        return text.split(' ')
+
+    def decode(self, tokens):
+        return ' '.join(tokens)
+
+
+@pytest.fixture
+def word_tokens(monkeypatch):
+    monkeypatch.setattr(prompt_builder, '_encoder', WordEncoder())
@@ -0,0 +1,40 @@
+import csv
+import io
+
+import pandas as pd
+
+import batch_analysis
+import prompt_builder
+
+
+def multiline_bordereaux():
+    notes = ['plain'] * 8
+    notes[1] = 'line one\nline two\nline three'
+    notes[5] = 'see\r\nattached'
+    return pd.DataFrame({'Policy Holder ID': [f'PH{number}' for number in range(1, 9)], 'Notes': notes})
+
+
+def test_csv_rows_yields_one_record_per_row():
+    df = multiline_bordereaux()
+    rows = list(prompt_builder.csv_rows(df, batch_size=3))
+    assert len(rows) == len(df)
+    assert [next(csv.reader(io.StringIO(row, newline=''))) for row in rows] == df.astype(str).values.tolist()
+
+
+def test_batches_split_between_rows_when_cells_hold_line_breaks(word_tokens):
+    df = multiline_bordereaux()
+    header = batch_analysis.with_row_numbers(df).head(0).to_csv(index=False)
+    header_tokens = prompt_builder.count_tokens(batch_analysis.start_batch('summary', header, 10 ** 6).build())
+    # Room for about three rows per batch
+    batches = batch_analysis.plan_batches(df, 'summary', max_tokens=header_tokens + 6)
+
+    assert len(batches) > 1
+    assert sum(row_count for _, _, row_count, _ in batches) == len(df)
+    expected_first = 0
+    for prompt, first_row, row_count, _ in batches:
+        assert first_row == expected_first
+        expected_first += row_count
+        records = list(csv.reader(io.StringIO(prompt.split('Bordereaux CSV:\n', 1)[1], newline='')))
+        assert records[0] == ['Row', 'Policy Holder ID', 'Notes']
+        assert records[1:] == [[str(number + 1), f'PH{number + 1}', df['Notes'][number]]
+                               for number in range(first_row, first_row + row_count)]
@@ -0,0 +1,26 @@
+import pandas as pd
+
+import keyed_reconciliation
+
+
+def test_statement_dates_written_as_text_match_bordereaux_dates():
+    bordereaux = pd.Series([pd.Timestamp('2024-01-05'), pd.Timestamp('2024-01-05'), pd.Timestamp('2024-03-02'),
+                            pd.Timestamp('2024-03-02')])
+    statement = pd.Series(['05/01/2024', '5 Jan 2024', '2024-03-02', '03/03/2024'])
+    mismatch, delta = keyed_reconciliation.compare_field(bordereaux, statement, 0.01)
+    assert mismatch.tolist() == [False, False, False, True]
+    assert pd.isna(delta).all()
+
+
+def test_in_memory_and_partitioned_joins_agree_on_text_dates():
+    bordereaux = pd.DataFrame({'Policy Holder ID': ['PH1', 'PH2', 'PH3'],
+                               'Claim Date': pd.to_datetime(['2024-01-05', '2024-02-10', '2024-03-15']),
+                               'Claim Amount': [100.0, 250.0, 75.0]})
+    statement = pd.DataFrame({'Policy Holder ID': ['PH1', 'PH2', 'PH3'],
+                              'Claim Date': ['05/01/2024', '10/02/2024', '16/03/2024'],
+                              'Claim Amount': [100.0, 250.0, 75.0]})
+    in_memory = keyed_reconciliation.reconcile(bordereaux, statement)
+    partitioned = keyed_reconciliation.reconcile(bordereaux, statement, max_rows=0, partitions=4)
+    assert in_memory == partitioned
+    assert [(record['Policy Holder ID'], record['Field']) for record in in_memory['Mismatched Records']] == \
+        [('PH3', 'Claim Date')]
@@ -0,0 +1,31 @@
+import io
+
+from flask import Flask, jsonify, request
+
+import uploads
+
+
+def upload_app(**config):
+    app = Flask(__name__)
+    app.config.update(config)
+    uploads.init_app(app)
+
+    @app.route('/upload', methods=['POST'])
+    def upload():
+        return jsonify({'files': sorted(request.files)})
+
+    return app
+
+
+def test_total_upload_size_is_capped_by_default():
+    assert upload_app().config['MAX_CONTENT_LENGTH'] == uploads.MAX_UPLOAD_BYTES
+
+
+def test_oversized_body_is_refused_with_413():
+    client = upload_app(MAX_CONTENT_LENGTH=4096).test_client()
+    small = client.post('/upload', data={'treaty': (io.BytesIO(b'x' * 1024), 'treaty.pdf')})
+    assert small.status_code == 200
+    parts = {f'part{number}': (io.BytesIO(b'x' * 1024), f'part{number}.pdf') for number in range(8)}
+    large = client.post('/upload', data=parts)
+    assert large.status_code == 413
+    assert 'error' in large.get_json()
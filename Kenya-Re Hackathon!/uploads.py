@@ -0,0 +1,97 @@
+import io
+import os
+import shutil
+import tempfile
+
+from flask import Request, g, jsonify
+from werkzeug.exceptions import RequestEntityTooLarge
+
+WORKSPACES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'workspaces')
+# Whole multipart body; larger requests are refused before any of it is read.
+MAX_UPLOAD_BYTES = int(os.environ.get('CLAIMS_MAX_UPLOAD_MB', '512')) * 1024 * 1024
+# Any single uploaded file
+MAX_FILE_BYTES = int(os.environ.get('CLAIMS_MAX_FILE_MB', '256')) * 1024 * 1024
+# Plain form fields such as the cedant name are small and stay in memory.
+MAX_FORM_MEMORY_BYTES = 1024 * 1024
+
+
+class Workspace:
+    """Scratch directory private to one request; removed, with everything left in it, by cleanup()"""
+
+    def __init__(self, root=WORKSPACES_DIR):
+        os.makedirs(root, exist_ok=True)
+        self.path = tempfile.mkdtemp(prefix='request-', dir=root)
+
+    def upload_file(self, limit=MAX_FILE_BYTES):
+        """New empty file in the workspace for one uploaded part; client file names are never used as paths"""
+        descriptor, path = tempfile.mkstemp(prefix='upload-', dir=self.path)
+        return UploadFile(descriptor, path, limit)
+
+    def cleanup(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+class UploadFile(io.FileIO):
+    """On-disk spool of an uploaded file that refuses to grow past limit bytes"""
+
+    def __init__(self, descriptor, path, limit):
+        super().__init__(descriptor, 'w+b')
+        self.path = path
+        self.limit = limit
+        self.size = 0
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self.limit:
+            raise RequestEntityTooLarge(f'Each uploaded file may be at most {self.limit // (1024 * 1024)} MB.')
+        return super().write(data)
+
+
+class SpoolingRequest(Request):
+    """Request whose multipart file parts are written to the request's workspace in chunks as they arrive"""
+
+    max_form_memory_size = MAX_FORM_MEMORY_BYTES
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return workspace().upload_file()
+
+
+def workspace():
+    """Workspace of the current request, created on first use"""
+    if 'workspace' not in g:
+        g.workspace = Workspace()
+    return g.workspace
+
+
+def cleanup_workspace(exception=None):
+    current = g.pop('workspace', None)
+    if current is not None:
+        current.cleanup()
+
+
+def save(file_storage, path):
+    """Store an uploaded file at path, moving its spool file rather than copying it when possible"""
+    stream = file_storage.stream
+    if isinstance(stream, UploadFile):
+        stream.close()
+        try:
+            os.replace(stream.path, path)
+            return
+        except OSError:
+            # Workspace and destination on different filesystems
+            shutil.move(stream.path, path)
+            return
+    file_storage.save(path)
+
+
+def too_large(error):
+    return jsonify({'error': error.description or 'Upload is too large.'}), 413
+
+
+def init_app(app):
+    """Spool uploads to per-request workspaces, cap their size, and clean the workspaces up afterwards"""
+    app.request_class = SpoolingRequest
+    # Flask's default config already holds MAX_CONTENT_LENGTH = None, so setdefault would leave it uncapped
+    app.config['MAX_CONTENT_LENGTH'] = app.config.get('MAX_CONTENT_LENGTH') or MAX_UPLOAD_BYTES
+    app.teardown_request(cleanup_workspace)
+    app.register_error_handler(RequestEntityTooLarge, too_large)